@@ -0,0 +1,192 @@
+from typing import Callable, Generator, NamedTuple
+
+# Adaptive eye scan. Error counts grow monotonically away from the eye center,
+# so a phase column only has to be measured around its open/closed boundaries,
+# starting from the boundaries found in the neighbouring column. Every other
+# point of the grid is inferred from the measured ones.
+
+# Gets (voltage, phase) points, returns the amplitudes of every sample (lane)
+# for each of them
+Measure = Callable[[list[tuple[int, int]]], list[tuple[int, ...]]]
+# Voltage index search, yields indices to probe and is sent whether they are
+# open
+Search = Generator[int, bool, tuple[int, int] | None]
+
+
+class Sample(NamedTuple):
+    voltage: int
+    phase: int
+    index: int
+    amplitude: int
+    inferred: bool
+
+
+def boundary_search(open_index: int, direction: int, guess: int | None,
+                    size: int) -> Generator[int, bool, int]:
+    # Returns the last open index going from open_index in direction
+    edge = 0 if direction < 0 else size - 1
+    closed_index = edge + direction
+    if guess is not None and direction * (guess - open_index) > 0:
+        if (yield guess):
+            open_index = guess
+            step = 1
+            while open_index != edge:
+                probe = open_index + direction * step
+                if direction * (probe - edge) > 0:
+                    probe = edge
+                if not (yield probe):
+                    closed_index = probe
+                    break
+                open_index = probe
+                step *= 2
+        else:
+            closed_index = guess
+            step = 1
+            while direction * (closed_index - open_index) > 1:
+                probe = closed_index - direction * step
+                if direction * (probe - open_index) <= 0:
+                    break
+                if (yield probe):
+                    open_index = probe
+                    break
+                closed_index = probe
+                step *= 2
+    while direction * (closed_index - open_index) > 1:
+        probe = (open_index + closed_index) // 2
+        if (yield probe):
+            open_index = probe
+        else:
+            closed_index = probe
+    return open_index
+
+
+def column_search(center: int, previous: tuple[int, int] | None,
+                  size: int) -> Search:
+    # Returns the (top, bottom) open voltage indices, or None when closed.
+    # The eye only narrows going away from its center, so the column is
+    # closed when no point of the previous open interval is open anymore.
+    candidates = [center]
+    if previous is not None:
+        candidates += sorted((index
+                              for index in range(previous[0], previous[1] + 1)
+                              if index != center),
+                             key=lambda index: abs(index - center))
+    for candidate in candidates:
+        if (yield candidate):
+            break
+    else:
+        return None
+    top_guess, bottom_guess = previous or (None, None)
+    top = yield from boundary_search(candidate, -1, top_guess, size)
+    bottom = yield from boundary_search(candidate, 1, bottom_guess, size)
+    return top, bottom
+
+
+def search_column(searches: dict[int, Search], measure: Callable[[list[int]],
+                                                                 list[tuple]],
+                  open_threshold: int) -> tuple[dict, dict]:
+    # Runs the searches of every sample together, each round of probes is
+    # measured at once. Returns the search results and the measured points.
+    column = {}
+    results = {}
+    pending = {index: next(search) for index, search in searches.items()}
+    while pending:
+        probes = sorted(set(pending.values()) - column.keys())
+        if probes:
+            column.update(zip(probes, measure(probes)))
+        for index, probe in list(pending.items()):
+            try:
+                pending[index] = searches[index].send(
+                    column[probe][index] <= open_threshold)
+            except StopIteration as stop:
+                results[index] = stop.value
+                del pending[index]
+    return results, column
+
+
+def infer_column(column: dict[int, tuple], index: int, center: int,
+                 interval: tuple[int, int] | None,
+                 size: int) -> list[tuple[int, bool]]:
+    # Inside the interval the eye is open, outside a point has at least the
+    # errors of the nearest point measured towards the column center
+    amplitudes = []
+    for voltage_index in range(size):
+        if voltage_index in column:
+            amplitudes.append((column[voltage_index][index], False))
+        elif interval is not None and interval[0] <= voltage_index <= interval[
+                1]:
+            amplitudes.append((0, True))
+        else:
+            step = 1 if voltage_index < center else -1
+            nearest = voltage_index
+            while nearest not in column:
+                nearest += step
+            amplitudes.append((column[nearest][index], True))
+    return amplitudes
+
+
+def trace_column(phase: int,
+                 voltages: list[int],
+                 measure: Measure,
+                 intervals: list[tuple[int, int] | None],
+                 centers: list[int],
+                 previous: list[list[tuple[int, bool]]] | None,
+                 open_threshold: int = 0) -> list[list[tuple[int, bool]]]:
+    # Updates intervals and centers in place, returns (amplitude, inferred)
+    # for every sample and voltage. Samples closed in the previous column are
+    # not measured again.
+    size = len(voltages)
+    searches = {
+        index: column_search(centers[index], intervals[index], size)
+        for index in range(len(centers))
+        if previous is None or intervals[index] is not None
+    }
+    results, column = search_column(
+        searches,
+        lambda probes: measure([(voltages[probe], phase) for probe in probes]),
+        open_threshold)
+    amplitudes = []
+    for index in range(len(centers)):
+        if index not in searches:
+            amplitudes.append([(amplitude, True)
+                               for amplitude, _ in previous[index]])
+            continue
+        amplitudes.append(
+            infer_column(column, index, centers[index], results[index], size))
+        intervals[index] = results[index]
+        if results[index] is not None:
+            centers[index] = sum(results[index]) // 2
+    return amplitudes
+
+
+def trace_eye(voltages: list[int],
+              phases: list[int],
+              measure: Measure,
+              sample_count: int,
+              open_threshold: int = 0) -> list[Sample]:
+    # Columns are traced from the one closest to phase 0 outwards in both
+    # directions, each one starting from the boundaries of its neighbour
+    start = min(range(len(phases)), key=lambda index: abs(phases[index]))
+    center = min(range(len(voltages)), key=lambda index: abs(voltages[index]))
+    intervals = [None] * sample_count
+    centers = [center] * sample_count
+    amplitudes = trace_column(phases[start], voltages, measure, intervals,
+                              centers, None, open_threshold)
+    columns = {start: amplitudes}
+    start_state = (intervals, centers, amplitudes)
+    for phase_indices in (range(start + 1,
+                                len(phases)), range(start - 1, -1, -1)):
+        intervals = list(start_state[0])
+        centers = list(start_state[1])
+        amplitudes = start_state[2]
+        for phase_index in phase_indices:
+            amplitudes = trace_column(phases[phase_index], voltages, measure,
+                                      intervals, centers, amplitudes,
+                                      open_threshold)
+            columns[phase_index] = amplitudes
+    return [
+        Sample(voltage, phases[phase_index], index, amplitude, inferred)
+        for phase_index, column in sorted(columns.items())
+        for index, sample_amplitudes in enumerate(column)
+        for voltage, (amplitude, inferred) in zip(voltages, sample_amplitudes)
+    ]
@@ -0,0 +1,311 @@
+import argparse
+import concurrent.futures
+import contextlib
+import functools
+import os
+import pathlib
+import sys
+from typing import NamedTuple
+import numpy
+from instructions import LANES, ws_char
+from results import BINARY_MAGIC, FLAG_INFERRED, FLAG_WRITTEN, load_results
+from runs import RUN_HEADER, read_run_headers
+
+# Eye metrics of scan results, computed on (device, lane, bit, voltage,
+# phase) arrays. A point is inside the BER contour of a threshold when its
+# error count is at most threshold * checked bits, points without a known
+# dwell time have to be error-free and points not measured or with a
+# saturated error counter are outside. Points inferred by an adaptive scan
+# are outside too unless they are asked for. A tsv file holds one scan per
+# tag, the value of its first column when that is not a number, e.g. the
+# adapter URL of fleet results or the label of scan runs, whose dwell time
+# comes from the run headers.
+
+DEFAULT_THRESHOLDS = (1E-6, 1E-9, 1E-12)
+DEFAULT_BIT_RATE = 10E9
+# Files in scan directories that are not results
+SKIPPED_SUFFIXES = (".journal", ".tmp")
+# Bytes read to tell result files from other files
+SNIFF_SIZE = 256
+
+
+class ScanData(NamedTuple):
+    devices: numpy.ndarray
+    voltages: numpy.ndarray
+    phases: numpy.ndarray
+    # (device, lane, bit, voltage, phase), NaN where not measured
+    ecount: numpy.ndarray
+    # Seconds, NaN where not known
+    dwell: numpy.ndarray
+    # Points inferred by an adaptive scan instead of measured
+    inferred: numpy.ndarray
+
+
+class EyeMetrics(NamedTuple):
+    # (threshold, device, lane, bit), in voltage and phase offset steps
+    height: numpy.ndarray
+    width: numpy.ndarray
+    area: numpy.ndarray
+
+
+def load_binary(path: str | pathlib.Path) -> ScanData:
+    header, records = load_results(path)
+    grid = header["grid"]
+    written = (records["flags"] & FLAG_WRITTEN).astype(bool)
+    return ScanData(numpy.array(grid["devices"]),
+                    numpy.array(grid["voltages"]), numpy.array(grid["phases"]),
+                    numpy.where(written, records["ecount"], numpy.nan),
+                    numpy.where(written, records["dwell"] / 1000, numpy.nan),
+                    (records["flags"] & FLAG_INFERRED).astype(bool))
+
+
+def read_tsv(path: str | pathlib.Path) -> dict[str, numpy.ndarray]:
+    # Sample columns of a tsv result file by tag, "" in files without a tag
+    # column
+    with open(path) as file:
+        first = file.readline()
+    if first.split("\t", 1)[0].lstrip("-").isdigit():
+        return {"": numpy.loadtxt(path, delimiter="\t", ndmin=2)}
+    lines = {}
+    with open(path) as file:
+        for line in file:
+            if line.startswith("#"):
+                continue
+            tag, _, sample = line.partition("\t")
+            lines.setdefault(tag, []).append(sample)
+    return {
+        tag: numpy.loadtxt(samples, delimiter="\t", ndmin=2)
+        for tag, samples in lines.items()
+    }
+
+
+def tsv_scan(data: numpy.ndarray, dwell_time: float | None = None) -> ScanData:
+    # dwell_time is used when the samples have no dwell column
+    devices = numpy.unique(data[:, 0])
+    voltages = numpy.unique(data[:, 3])[::-1]
+    phases = numpy.unique(data[:, 4])[::-1]
+    shape = (len(devices), 2 * LANES, int(data[:, 2].max()) + 1, len(voltages),
+             len(phases))
+    # Voltages and phases are stored in descending order like in a scan
+    index = (numpy.searchsorted(devices, data[:, 0]), data[:, 1].astype(int),
+             data[:, 2].astype(int), len(voltages) - 1 -
+             numpy.searchsorted(voltages[::-1], data[:, 3]),
+             len(phases) - 1 - numpy.searchsorted(phases[::-1], data[:, 4]))
+    ecount = numpy.full(shape, numpy.nan)
+    ecount[index] = data[:, 5]
+    dwell = numpy.full(shape, numpy.nan)
+    if data.shape[1] > 7:
+        dwell[index] = data[:, 7] / 1000
+    elif dwell_time is not None:
+        dwell[index] = dwell_time
+    inferred = numpy.zeros(shape, bool)
+    if data.shape[1] > 6:
+        inferred[index] = data[:, 6] != 0
+    return ScanData(devices.astype(int), voltages.astype(int),
+                    phases.astype(int), ecount, dwell, inferred)
+
+
+def load_tsv(path: str | pathlib.Path,
+             dwell_time: float | None = None) -> dict[str, ScanData]:
+    runs = read_run_headers(path)
+    return {
+        tag: tsv_scan(data,
+                      runs[tag].dwell_time if tag in runs else dwell_time)
+        for tag, data in read_tsv(path).items()
+    }
+
+
+def load_scans(path: str | pathlib.Path,
+               dwell_time: float | None = None) -> dict[str, ScanData]:
+    # Scans of a result file by tag, binary files hold a single one
+    with open(path, "rb") as file:
+        binary = file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+    return {"": load_binary(path)} if binary else load_tsv(path, dwell_time)
+
+
+def ber_contours(data: ScanData,
+                 thresholds: list[float],
+                 bit_rate: float = DEFAULT_BIT_RATE,
+                 inferred: bool = False) -> numpy.ndarray:
+    # Returns (threshold, device, lane, bit, voltage, phase) masks of the
+    # points inside every contour, with inferred the inferred points count as
+    # measured
+    limits = numpy.nan_to_num(numpy.multiply.outer(numpy.asarray(thresholds),
+                                                   data.dwell * bit_rate),
+                              nan=0)
+    # A saturated counter only bounds the error count from below
+    inside = (data.ecount <= limits) & (data.ecount < ws_char.ecount.mask)
+    return inside if inferred else inside & ~data.inferred
+
+
+def center_run(mask: numpy.ndarray, center: int) -> numpy.ndarray:
+    # Length of the run of True along the last axis through center
+    up = numpy.logical_and.accumulate(mask[..., center::-1], axis=-1)
+    down = numpy.logical_and.accumulate(mask[..., center:], axis=-1)
+    return numpy.where(mask[..., center],
+                       up.sum(axis=-1) + down.sum(axis=-1) - 1, 0)
+
+
+def grid_step(values: numpy.ndarray) -> int:
+    return int(abs(values[0] - values[1])) if len(values) > 1 else 1
+
+
+def eye_metrics(data: ScanData,
+                thresholds: list[float],
+                bit_rate: float = DEFAULT_BIT_RATE,
+                inferred: bool = False) -> EyeMetrics:
+    # Height is the open run through voltage 0 at the phase closest to 0,
+    # width the one through phase 0 at the voltage closest to 0
+    inside = ber_contours(data, thresholds, bit_rate, inferred)
+    voltage_center = int(numpy.abs(data.voltages).argmin())
+    phase_center = int(numpy.abs(data.phases).argmin())
+    voltage_step = grid_step(data.voltages)
+    phase_step = grid_step(data.phases)
+    return EyeMetrics(
+        center_run(inside[..., phase_center], voltage_center) * voltage_step,
+        center_run(inside[..., voltage_center, :], phase_center) * phase_step,
+        inside.sum(axis=(-2, -1)) * voltage_step * phase_step)
+
+
+def worst_bit(metrics: EyeMetrics) -> tuple[EyeMetrics, numpy.ndarray]:
+    # Minimum of every metric over the bits, (threshold, device, lane), and
+    # the bit with the smallest area
+    return EyeMetrics(*(metric.min(axis=-1)
+                        for metric in metrics)), metrics.area.argmin(axis=-1)
+
+
+def analyze_file(path: pathlib.Path, thresholds: list[float], bit_rate: float,
+                 dwell_time: float | None, worst: bool,
+                 inferred: bool) -> list[tuple]:
+    rows = []
+    for tag, data in load_scans(path, dwell_time).items():
+        metrics = eye_metrics(data, thresholds, bit_rate, inferred)
+        if worst:
+            metrics, bits = worst_bit(metrics)
+        for index in numpy.ndindex(metrics.height.shape):
+            threshold, device_index, lane = index[:3]
+            bit = bits[index] if worst else index[3]
+            rows.append(
+                (path, tag, thresholds[threshold], data.devices[device_index],
+                 lane, bit, *(int(metric[index]) for metric in metrics)))
+    return rows
+
+
+def is_result_file(path: pathlib.Path) -> bool:
+    # Binary results start with their magic, tsv ones with a sample line of
+    # device, lane, bit, voltage, phase and ecount, after the tag column if
+    # there is one, or with the header of scan runs. Part files of a fleet
+    # scan are left out while its result exists.
+    if path.suffix in SKIPPED_SUFFIXES or (path.suffix[1:].isdigit()
+                                           and path.with_suffix("").exists()):
+        return False
+    with open(path, "rb") as file:
+        start = file.read(SNIFF_SIZE)
+    if start.startswith(BINARY_MAGIC) or start.startswith(
+            f"{RUN_HEADER}\t".encode()):
+        return True
+    fields = start.split(b"\n", 1)[0].split(b"\t")
+    if fields and not fields[0].removeprefix(b"-").isdigit():
+        fields = fields[1:]
+    return len(fields) >= 6 and all(
+        field.removeprefix(b"-").isdigit() for field in fields[:6])
+
+
+def result_files(paths: list[pathlib.Path]) -> list[pathlib.Path]:
+    # Files given directly are taken as they are
+    files = []
+    for path in paths:
+        if path.is_dir():
+            files += sorted(child for child in path.rglob("*")
+                            if child.is_file() and is_result_file(child))
+        else:
+            files.append(path)
+    return files
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog='eyescan-analysis',
+        description='TI DAC Eyescan result analysis',
+        epilog=
+        'Computes eye height, width and area of eyescan result files for BER contours'
+    )
+    parser.add_argument('paths',
+                        type=pathlib.Path,
+                        nargs='+',
+                        help="result files or directories of them")
+    parser.add_argument('-o',
+                        '--output',
+                        type=pathlib.Path,
+                        help="output file path, stdout by default")
+    parser.add_argument(
+        '-T',
+        '--threshold',
+        type=float,
+        action='append',
+        help=
+        f"BER threshold of a contour, {', '.join(map(str, DEFAULT_THRESHOLDS))} by default"
+    )
+    parser.add_argument('--bit-rate',
+                        type=float,
+                        default=DEFAULT_BIT_RATE,
+                        help="bits per second checked by the error counter")
+    parser.add_argument(
+        '-t',
+        '--dwell-time',
+        type=lambda x: float(x) / 1000,
+        help=
+        "Dwell time in miliseconds of tsv files without a dwell column, otherwise their points have to be error-free"
+    )
+    parser.add_argument(
+        '-w',
+        '--worst-bit',
+        action='store_true',
+        help=
+        "Report the minimum of every metric over the bits of a lane, the bit column has the bit with the smallest area"
+    )
+    parser.add_argument(
+        '--inferred',
+        action='store_true',
+        help=
+        "Count the points inferred by adaptive scans as measured, otherwise they are outside every contour"
+    )
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help="number of worker processes")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    files = result_files(args.paths)
+    analyze = functools.partial(analyze_file,
+                                thresholds=args.threshold
+                                or list(DEFAULT_THRESHOLDS),
+                                bit_rate=args.bit_rate,
+                                dwell_time=args.dwell_time,
+                                worst=args.worst_bit,
+                                inferred=args.inferred)
+    failed = False
+    with (open(args.output, "w") if args.output else contextlib.nullcontext(sys.stdout)) as output, \
+            concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+        output.write("\t".join(("file", "tag", "threshold", "device", "lane",
+                                "bit", "height", "width", "area")) + "\n")
+        futures = [executor.submit(analyze, path) for path in files]
+        for path, future in zip(files, futures):
+            try:
+                rows = future.result()
+            except Exception as error:
+                print(f"Could not analyze {path}: {error}", file=sys.stderr)
+                failed = True
+                continue
+            for row in rows:
+                output.write("\t".join(map(str, row)) + "\n")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+import argparse
+import datetime
+import functools
+import json
+import os
+import pathlib
+import shutil
+import sqlite3
+import sys
+from dataclasses import dataclass, replace
+from typing import Callable
+import numpy
+from analysis import DEFAULT_BIT_RATE, DEFAULT_THRESHOLDS, eye_metrics, load_binary, read_tsv, result_files, worst_bit
+from instructions import LANES
+from results import BINARY_MAGIC, BinaryWriter, ScanGrid
+from runs import read_run_headers
+
+# Scan archive. Every ingested scan is stored as a binary result file, and a
+# SQLite index holds its metadata and the worst-bit eye metrics of every lane
+# for each BER threshold, without inferred points, so trend queries never
+# open the samples. Every scan is ingested in its own transaction, a result
+# file already in the archive is skipped unless it changed since. Tagged tsv
+# results are split into a scan per tag: fleet results per adapter URL,
+# scan runs per run with its own test pattern and dwell time.
+
+INDEX_NAME = "index.sqlite"
+STORE_DIRECTORY = "scans"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    -- Names the binary result file in the store, never reused
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    -- First column of a tagged tsv result, the adapter URL of a fleet
+    -- result or the run label of scan runs, empty otherwise
+    tag TEXT NOT NULL,
+    -- pyftdi URL, empty when not known
+    adapter TEXT NOT NULL,
+    test_pattern TEXT,
+    -- Modification time of the source, seconds since the epoch
+    timestamp REAL NOT NULL,
+    devices TEXT NOT NULL,
+    bits INTEGER NOT NULL,
+    voltages TEXT NOT NULL,
+    phases TEXT NOT NULL,
+    dwell_time REAL,
+    bit_rate REAL NOT NULL,
+    UNIQUE (source, tag)
+);
+CREATE INDEX IF NOT EXISTS scans_timestamp ON scans (timestamp);
+CREATE TABLE IF NOT EXISTS metrics (
+    lane INTEGER NOT NULL,
+    threshold REAL NOT NULL,
+    scan INTEGER NOT NULL REFERENCES scans (id),
+    device INTEGER NOT NULL,
+    -- Bit with the smallest area
+    bit INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    area INTEGER NOT NULL,
+    PRIMARY KEY (lane, threshold, scan, device)
+) WITHOUT ROWID;
+"""
+TREND_COLUMNS = ("timestamp", "adapter", "device", "test_pattern", "bit",
+                 "height", "width", "area", "source")
+
+
+@dataclass
+class ScanMetadata:
+    # pyftdi URL, fleet results have their own in the first column
+    adapter: str = ""
+    # Scan runs have their own test pattern and dwell time in their headers
+    test_pattern: str | None = None
+    # Seconds, for tsv samples without a dwell column
+    dwell_time: float | None = None
+    bit_rate: float = DEFAULT_BIT_RATE
+
+
+def open_archive(path: str | pathlib.Path) -> sqlite3.Connection:
+    path = pathlib.Path(path)
+    (path / STORE_DIRECTORY).mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path / INDEX_NAME)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def read_tsv_scans(
+        path: pathlib.Path,
+        metadata: ScanMetadata) -> dict[str, tuple[list[tuple], ScanMetadata]]:
+    # Samples and metadata of the scans of a tsv result file by tag
+    runs = read_run_headers(path)
+    scans = {}
+    for tag, data in read_tsv(path).items():
+        if tag in runs:
+            scan_metadata = replace(metadata,
+                                    test_pattern=runs[tag].test_pattern.name,
+                                    dwell_time=runs[tag].dwell_time)
+        else:
+            scan_metadata = replace(metadata, adapter=tag or metadata.adapter)
+        scans[tag] = ([(*map(int, row[:7]), *row[7:8])
+                       for row in data.tolist()], scan_metadata)
+    return scans
+
+
+def write_store(path: pathlib.Path, samples: list[tuple],
+                dwell_time: float | None):
+    devices, _, bits, voltages, phases = (sorted(
+        set(values)) for values in zip(*(sample[:5] for sample in samples)))
+    grid = ScanGrid(tuple(devices), 2 * LANES,
+                    max(bits) + 1, tuple(reversed(voltages)),
+                    tuple(reversed(phases)))
+    # Without a dwell time the points have to be error-free, like in analysis
+    writer = BinaryWriter(path, grid, dwell_time or 0)
+    try:
+        for sample in samples:
+            writer.write(sample)
+    finally:
+        writer.close()
+
+
+def store_path(archive: pathlib.Path, scan_id: int) -> pathlib.Path:
+    return archive / STORE_DIRECTORY / f"{scan_id}.bin"
+
+
+def insert_scan(connection: sqlite3.Connection, archive: pathlib.Path,
+                source: pathlib.Path, tag: str, metadata: ScanMetadata,
+                timestamp: float, store: Callable[[pathlib.Path],
+                                                  None]) -> int:
+    # Replaces an earlier scan of the same source and tag. The store is
+    # written under a temporary name and gets the id of the scan.
+    temporary = archive / STORE_DIRECTORY / f"ingest-{os.getpid()}.tmp"
+    try:
+        store(temporary)
+        data = load_binary(temporary)
+        metrics, worst_bits = worst_bit(
+            eye_metrics(data, list(DEFAULT_THRESHOLDS), metadata.bit_rate))
+        with connection:
+            stale = [
+                scan_id for (scan_id, ) in connection.execute(
+                    "SELECT id FROM scans WHERE source = ? AND tag = ?", (
+                        str(source), tag))
+            ]
+            for scan_id in stale:
+                connection.execute("DELETE FROM metrics WHERE scan = ?",
+                                   (scan_id, ))
+                connection.execute("DELETE FROM scans WHERE id = ?",
+                                   (scan_id, ))
+            scan_id = connection.execute(
+                "INSERT INTO scans (source, tag, adapter, "
+                "test_pattern, timestamp, devices, bits, voltages, phases, "
+                "dwell_time, bit_rate) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(source), tag, metadata.adapter, metadata.test_pattern,
+                 timestamp, json.dumps(data.devices.tolist()),
+                 data.ecount.shape[2], json.dumps(
+                     data.voltages.tolist()), json.dumps(data.phases.tolist()),
+                 metadata.dwell_time, metadata.bit_rate)).lastrowid
+            connection.executemany(
+                "INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                ((lane, DEFAULT_THRESHOLDS[threshold], scan_id,
+                  int(data.devices[device_index]),
+                  int(worst_bits[threshold, device_index, lane]),
+                  *(int(metric[threshold, device_index, lane])
+                    for metric in metrics)) for threshold, device_index, lane
+                 in numpy.ndindex(worst_bits.shape)))
+            os.replace(temporary, store_path(archive, scan_id))
+    finally:
+        temporary.unlink(missing_ok=True)
+    for stale_id in stale:
+        store_path(archive, stale_id).unlink(missing_ok=True)
+    return scan_id
+
+
+def ingest(archive: str | pathlib.Path, source: str | pathlib.Path,
+           metadata: ScanMetadata) -> list[int]:
+    # Returns the ids of the scans ingested from source, none when the
+    # archive already has it
+    archive = pathlib.Path(archive)
+    source = pathlib.Path(source).absolute()
+    timestamp = os.stat(source).st_mtime
+    connection = open_archive(archive)
+    try:
+        with open(source, "rb") as file:
+            binary = file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+        if binary:
+            scans = {"": (None, metadata)}
+        else:
+            scans = read_tsv_scans(source, metadata)
+        scan_ids = []
+        for tag, (samples, scan_metadata) in scans.items():
+            if connection.execute(
+                    "SELECT 1 FROM scans WHERE source = ? AND tag = ? "
+                    "AND timestamp = ?",
+                (str(source), tag, timestamp)).fetchone():
+                continue
+            if binary:
+                store = functools.partial(shutil.copyfile, source)
+            else:
+                store = functools.partial(write_store,
+                                          samples=samples,
+                                          dwell_time=scan_metadata.dwell_time)
+            scan_ids.append(
+                insert_scan(connection, archive, source, tag, scan_metadata,
+                            timestamp, store))
+        return scan_ids
+    finally:
+        connection.close()
+
+
+def lane_trend(connection: sqlite3.Connection,
+               lane: int,
+               threshold: float,
+               last: int | None = None,
+               device: int | None = None,
+               adapter: str | None = None,
+               test_pattern: str | None = None) -> list[sqlite3.Row]:
+    # Metrics of the lane in the last devices scanned, oldest first
+    conditions = ["metrics.lane = ?", "metrics.threshold = ?"]
+    parameters = [lane, threshold]
+    for condition, value in (("metrics.device = ?",
+                              device), ("scans.adapter = ?", adapter),
+                             ("scans.test_pattern = ?", test_pattern)):
+        if value is not None:
+            conditions.append(condition)
+            parameters.append(value)
+    rows = connection.execute(
+        f"SELECT {', '.join(TREND_COLUMNS)} FROM metrics "
+        "JOIN scans ON scans.id = metrics.scan "
+        f"WHERE {' AND '.join(conditions)} "
+        "ORDER BY scans.timestamp DESC, metrics.device DESC LIMIT ?",
+        (*parameters, -1 if last is None else last)).fetchall()
+    return rows[::-1]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog='eyescan-archive',
+        description='TI DAC Eyescan result archive',
+        epilog=
+        'Stores eyescan results with a SQLite index of their metadata and lane eye metrics for trend queries'
+    )
+    parser.add_argument('archive', type=pathlib.Path, help="archive directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = commands.add_parser(
+        'ingest', help="add result files that are not in the archive yet")
+    ingest_parser.add_argument('paths',
+                               type=pathlib.Path,
+                               nargs='+',
+                               help="result files or directories of them")
+    ingest_parser.add_argument(
+        '-u',
+        '--pyftdi-url',
+        default="",
+        help="adapter of results without an adapter URL column")
+    ingest_parser.add_argument('-p',
+                               '--test-pattern',
+                               help="test pattern of the scans")
+    ingest_parser.add_argument(
+        '-t',
+        '--dwell-time',
+        type=lambda x: float(x) / 1000,
+        help=
+        "Dwell time in miliseconds of tsv files without a dwell column, otherwise their points have to be error-free"
+    )
+    ingest_parser.add_argument(
+        '--bit-rate',
+        type=float,
+        default=DEFAULT_BIT_RATE,
+        help="bits per second checked by the error counter")
+    trend_parser = commands.add_parser(
+        'trend', help="eye metrics of a lane over the archived scans")
+    trend_parser.add_argument('-l',
+                              '--lane',
+                              type=int,
+                              choices=range(2 * LANES),
+                              required=True,
+                              help="lane to report")
+    trend_parser.add_argument(
+        '-T',
+        '--threshold',
+        type=float,
+        choices=DEFAULT_THRESHOLDS,
+        default=DEFAULT_THRESHOLDS[-1],
+        help="BER threshold of the contour the metrics are computed for")
+    trend_parser.add_argument('-n',
+                              '--last',
+                              type=int,
+                              help="only report the last devices scanned")
+    trend_parser.add_argument('-d',
+                              '--device',
+                              type=int,
+                              help="only report this daisy-chain position")
+    trend_parser.add_argument('-u',
+                              '--pyftdi-url',
+                              help="only report scans of this adapter")
+    trend_parser.add_argument('-p',
+                              '--test-pattern',
+                              help="only report scans with this test pattern")
+    trend_parser.add_argument('-o',
+                              '--output',
+                              type=pathlib.Path,
+                              help="output file path, stdout by default")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'ingest':
+        metadata = ScanMetadata(args.pyftdi_url, args.test_pattern,
+                                args.dwell_time, args.bit_rate)
+        failed = False
+        for path in result_files(args.paths):
+            try:
+                scan_ids = ingest(args.archive, path, metadata)
+            except Exception as error:
+                print(f"Could not ingest {path}: {error}", file=sys.stderr)
+                failed = True
+                continue
+            if scan_ids:
+                print(f"Ingested {path}", file=sys.stderr)
+        if failed:
+            raise SystemExit(1)
+        return
+    connection = open_archive(args.archive)
+    rows = lane_trend(connection, args.lane, args.threshold, args.last,
+                      args.device, args.pyftdi_url, args.test_pattern)
+    connection.close()
+    with (open(args.output, "w") if args.output else sys.stdout) as output:
+        output.write("\t".join(TREND_COLUMNS) + "\n")
+        for row in rows:
+            timestamp = datetime.datetime.fromtimestamp(
+                row["timestamp"]).isoformat(timespec="seconds")
+            output.write("\t".join(map(str, (timestamp, *tuple(row)[1:]))) +
+                         "\n")
+
+
+if __name__ == "__main__":
+    main()
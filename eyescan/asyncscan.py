@@ -0,0 +1,196 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable
+from scan import select_perform_func
+from instructions import LANES
+from plan import ScanPlan
+
+# Asyncio scan API. The blocking JTAG work of a scan runs in an executor
+# thread, and its output writer hands every batch of samples over to the
+# event loop, which yields them one by one. The writer waits while the
+# consumer is behind. Closing the iterator stops the scan after its current
+# row and waits until the JtagEngine is closed, contextlib.aclosing closes it
+# when the task iterating it is cancelled. scan_stations runs the scans of
+# several adapters on one event loop, at most max_scans of them at once.
+
+# Sample batches waiting for the consumer of a scan
+SAMPLE_QUEUE_SIZE = 16
+# How often a writer waiting for the consumer checks for cancellation
+CANCEL_POLL_INTERVAL = 0.1
+DEFAULT_MAX_SCANS = 4
+
+
+class ScanCancelled(Exception):
+    pass
+
+
+class StationError(Exception):
+
+    def __init__(self, errors: dict[str, Exception]):
+        super().__init__(", ".join(f"{pyftdi_url}: {error}"
+                                   for pyftdi_url, error in errors.items()))
+        self.errors = errors
+
+
+@dataclass
+class ScanProgress:
+    pyftdi_url: str
+    samples: int
+    # Samples of the whole scan
+    total: int
+    seconds: float
+
+    @property
+    def fraction(self) -> float:
+        return self.samples / self.total if self.total else 1
+
+
+class SampleQueue:
+    """Sink of a BackgroundWriter that puts the sample batches into an
+    asyncio queue, the writer thread waits while the queue is full."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue,
+                 cancelled: threading.Event):
+        self.loop = loop
+        self.queue = queue
+        self.cancelled = cancelled
+
+    def put(self, batch: list[tuple] | None):
+        # None marks the end of the scan
+        future = asyncio.run_coroutine_threadsafe(self.queue.put(batch),
+                                                  self.loop)
+        while True:
+            try:
+                future.result(CANCEL_POLL_INTERVAL)
+                return
+            except concurrent.futures.TimeoutError:
+                if self.cancelled.is_set():
+                    future.cancel()
+                    raise ScanCancelled()
+
+    def write_batch(self, samples: list[tuple]):
+        if self.cancelled.is_set():
+            raise ScanCancelled()
+        self.put(samples)
+
+    def flush(self):
+        pass
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def scan_size(plan: ScanPlan, devices: int) -> int:
+    lanes = sum(lane // LANES in plan.receiver_blocks for lane in plan.lanes)
+    return devices * lanes * len(plan.bits) * len(plan.voltages) * len(
+        plan.phases)
+
+
+async def scan_samples(pyftdi_url: str,
+                       parallel: bool = False,
+                       chain_wide: bool = False,
+                       pipelined: bool = False,
+                       progress: Callable[[ScanProgress], None] | None = None,
+                       executor: concurrent.futures.Executor | None = None,
+                       **kwargs) -> AsyncIterator[tuple]:
+    # kwargs are the keyword arguments of the perform function, the samples
+    # are only written to an output file with output_path. progress is called
+    # on the event loop after every batch.
+    loop = asyncio.get_running_loop()
+    kwargs.setdefault("output_path", None)
+    perform_eyescan_func = select_perform_func(parallel, chain_wide, pipelined)
+    plan = kwargs.get("plan") or ScanPlan.sweep(kwargs["bit_number"],
+                                                kwargs["voltage_increment"],
+                                                kwargs["phase_increment"])
+    if parallel or chain_wide or pipelined:
+        devices = plan.select_devices(
+            range(1, kwargs["daisy_chain_device_count"] + 1))
+    else:
+        devices = plan.select_devices([kwargs["daisy_chain_device_number"]])
+    total = scan_size(plan, len(devices))
+    batches = asyncio.Queue(SAMPLE_QUEUE_SIZE)
+    cancelled = threading.Event()
+    sink = SampleQueue(loop, batches, cancelled)
+
+    def run():
+        try:
+            return perform_eyescan_func(pyftdi_url=pyftdi_url,
+                                        sinks=(sink, ),
+                                        **kwargs)
+        finally:
+            with contextlib.suppress(ScanCancelled):
+                sink.put(None)
+
+    start = time.monotonic()
+    scan = loop.run_in_executor(executor, run)
+    samples = 0
+    try:
+        while (batch := await batches.get()) is not None:
+            for sample in batch:
+                yield sample
+            samples += len(batch)
+            if progress is not None:
+                progress(
+                    ScanProgress(pyftdi_url, samples, total,
+                                 time.monotonic() - start))
+        # Raises the error of a failed scan
+        await scan
+    finally:
+        if not scan.done():
+            cancelled.set()
+            await asyncio.wait([scan])
+            if not scan.cancelled():
+                scan.exception()
+
+
+async def scan_stations(
+    stations: dict[str, dict],
+    max_scans: int = DEFAULT_MAX_SCANS,
+    progress: Callable[[ScanProgress], None] | None = None,
+    executor: concurrent.futures.Executor | None = None
+) -> AsyncIterator[tuple[str, tuple]]:
+    # Scans every station, pyftdi URL -> keyword arguments of scan_samples,
+    # and yields (pyftdi URL, sample) as they come. A failing station does
+    # not stop the others, StationError is raised once they are done.
+    semaphore = asyncio.Semaphore(max_scans)
+    samples = asyncio.Queue(SAMPLE_QUEUE_SIZE)
+    errors = {}
+
+    async def station(pyftdi_url: str, options: dict):
+        try:
+            async with semaphore, contextlib.aclosing(
+                    scan_samples(pyftdi_url,
+                                 progress=progress,
+                                 executor=executor,
+                                 **options)) as station_samples:
+                async for sample in station_samples:
+                    await samples.put((pyftdi_url, sample))
+        except Exception as error:
+            errors[pyftdi_url] = error
+        await samples.put(None)
+
+    tasks = [
+        asyncio.create_task(station(pyftdi_url, options))
+        for pyftdi_url, options in stations.items()
+    ]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            item = await samples.get()
+            if item is None:
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if errors:
+        raise StationError(errors)
@@ -0,0 +1,266 @@
+import argparse
+import functools
+import json
+import pathlib
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from dwell import DwellPolicy
+from scan import perform_eyescan, perform_parallel_eyescan
+from instructions import TestPattern
+from simulator import LANES_PER_BLOCK, SimulatedJtagEngine
+from transport import TRANSPORTS
+
+# Throughput benchmark of the eyescan loops against the simulated DAC38J8x
+# chain. Each eye point is one (device, receiver block, voltage, phase, bit)
+# readout, which produces one sample per lane.
+
+MODES = ["serial", "parallel", "chain", "pipelined", "adaptive", "dwell"]
+# The simulated eye has the same error counts at any dwell, so open points
+# settle after 32x the shortest dwell, closed ones at once
+BENCHMARK_DWELL_POLICY = DwellPolicy(min_dwell=1E-5,
+                                     max_dwell=1E-3,
+                                     target_ber=1E-6,
+                                     bit_rate=10E9)
+
+
+@dataclass
+class BenchmarkResult:
+    mode: str
+    transport: str
+    device_count: int
+    points: int
+    samples: int
+    inferred_samples: int
+    mismatches: int
+    seconds: float
+    ir_shifts: int
+    dr_shifts: int
+    tck_cycles: int
+    usb_round_trips: int
+    writer_stall_seconds: float
+
+    @property
+    def points_per_second(self) -> float:
+        return self.points / self.seconds if self.seconds else 0
+
+    @property
+    def shifts_per_point(self) -> float:
+        return (self.ir_shifts + self.dr_shifts) / max(self.points, 1)
+
+    @property
+    def tck_cycles_per_point(self) -> float:
+        return self.tck_cycles / max(self.points, 1)
+
+    @property
+    def points_per_round_trip(self) -> float:
+        return self.points / max(self.usb_round_trips, 1)
+
+    def to_dict(self) -> dict:
+        return asdict(self) | {
+            "points_per_second": self.points_per_second,
+            "shifts_per_point": self.shifts_per_point,
+            "tck_cycles_per_point": self.tck_cycles_per_point,
+            "points_per_round_trip": self.points_per_round_trip,
+        }
+
+
+def count_mismatches(engine: SimulatedJtagEngine,
+                     output_path: pathlib.Path) -> tuple[int, int, int]:
+    # Inferred samples only have to agree on whether the eye is open
+    samples = 0
+    inferred_samples = 0
+    mismatches = 0
+    with open(output_path) as file:
+        for line in file:
+            fields = line.split("\t")
+            device, lane, bit, voltage, phase, amplitude = map(int, fields[:6])
+            # Adaptive and dwell policy readouts add inferred and dwell columns
+            inferred = len(fields) > 6 and int(fields[6])
+            samples += 1
+            ecount = engine.eye(device, lane).ecount(voltage, phase, bit)
+            if inferred:
+                inferred_samples += 1
+                if (ecount == 0) != (amplitude == 0):
+                    mismatches += 1
+            elif ecount != amplitude:
+                mismatches += 1
+    return samples, inferred_samples, mismatches
+
+
+def run_benchmark(mode: str,
+                  device_count: int,
+                  bit_number: int,
+                  voltage_increment: int,
+                  phase_increment: int,
+                  ftdi_jtag_frequency: float,
+                  shift_latency: float,
+                  usb_latency: float = 0,
+                  transport: str = "direct",
+                  dwell_time: float = 0,
+                  daisy_chain_device_number: int = 1) -> BenchmarkResult:
+    engines = []
+
+    def jtag_factory(**kwargs):
+        engines.append(
+            SimulatedJtagEngine(device_count=device_count,
+                                shift_latency=shift_latency,
+                                usb_latency=usb_latency,
+                                **kwargs))
+        return engines[-1]
+
+    perform_eyescan_func = perform_eyescan
+    if mode == "parallel":
+        perform_eyescan_func = perform_parallel_eyescan
+    elif mode == "chain":
+        perform_eyescan_func = functools.partial(perform_parallel_eyescan,
+                                                 chain_wide=True)
+    elif mode == "pipelined":
+        perform_eyescan_func = functools.partial(perform_parallel_eyescan,
+                                                 pipelined=True)
+    elif mode == "adaptive":
+        perform_eyescan_func = functools.partial(perform_parallel_eyescan,
+                                                 adaptive=True)
+    elif mode == "dwell":
+        perform_eyescan_func = functools.partial(
+            perform_parallel_eyescan, dwell_policy=BENCHMARK_DWELL_POLICY)
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = pathlib.Path(directory) / "eyescan.tsv"
+        start = time.perf_counter()
+        writer_statistics = perform_eyescan_func(
+            pyftdi_url="sim://",
+            ftdi_jtag_frequency=ftdi_jtag_frequency,
+            ftdi_direction=0,
+            ftdi_initial_value=0,
+            ftdi_reset_bit=0,
+            daisy_chain_device_number=daisy_chain_device_number,
+            daisy_chain_device_count=device_count,
+            output_path=output_path,
+            bit_number=bit_number,
+            test_pattern=TestPattern.PRBS_7_BIT,
+            dwell_time=dwell_time,
+            voltage_increment=voltage_increment,
+            phase_increment=phase_increment,
+            jtag_factory=jtag_factory,
+            transport=transport)
+        seconds = time.perf_counter() - start
+        engine = engines[-1]
+        samples, inferred_samples, mismatches = count_mismatches(
+            engine, output_path)
+    statistics = engine.statistics
+    return BenchmarkResult(
+        mode=mode,
+        transport=transport,
+        device_count=device_count,
+        # Inferred samples cost no JTAG traffic
+        points=(samples - inferred_samples) // LANES_PER_BLOCK,
+        samples=samples,
+        inferred_samples=inferred_samples,
+        mismatches=mismatches,
+        seconds=seconds,
+        ir_shifts=statistics.ir_shifts,
+        dr_shifts=statistics.dr_shifts,
+        tck_cycles=statistics.tck_cycles,
+        usb_round_trips=statistics.usb_round_trips,
+        writer_stall_seconds=writer_statistics.stall_seconds)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog='eyescan-benchmark',
+        description='TI DAC Eyescan throughput benchmark',
+        epilog=
+        'Runs the eyescan loops against a simulated DAC38J8x JTAG daisy-chain')
+    parser.add_argument('-m',
+                        '--mode',
+                        choices=MODES,
+                        action='append',
+                        help="eyescan implementation to benchmark")
+    parser.add_argument('-T',
+                        '--transport',
+                        choices=TRANSPORTS,
+                        action='append',
+                        help="JTAG transport to benchmark")
+    parser.add_argument('-c',
+                        '--daisy-chain-count',
+                        type=int,
+                        action='append',
+                        help="how many devices in simulated JTAG daisy-chain")
+    parser.add_argument('-b',
+                        '--bit-number',
+                        type=int,
+                        default=2,
+                        help="how many bits to check")
+    parser.add_argument('-t',
+                        '--dwell-time',
+                        type=lambda x: float(x) / 1000,
+                        default=0,
+                        help="Dwell time in miliseconds")
+    parser.add_argument('-f',
+                        '--ftdi-jtag-frequency',
+                        type=float,
+                        default=1E5,
+                        help="frequency of simulated JTAG clk")
+    parser.add_argument(
+        '-l',
+        '--shift-latency',
+        type=lambda x: float(x) / 1000,
+        default=0,
+        help="simulated latency of every JTAG shift in miliseconds")
+    parser.add_argument(
+        '-u',
+        '--usb-latency',
+        type=lambda x: float(x) / 1000,
+        default=0,
+        help="simulated latency of every USB round trip in miliseconds")
+    parser.add_argument('--voltage-increment',
+                        type=int,
+                        default=8,
+                        help="voltage offset increment")
+    parser.add_argument('--phase-increment',
+                        type=int,
+                        default=4,
+                        help="phase offset increment")
+    parser.add_argument('-j',
+                        '--json',
+                        type=pathlib.Path,
+                        help="write results as JSON to this path")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = []
+    for mode in args.mode or MODES:
+        for transport in args.transport or TRANSPORTS:
+            for device_count in args.daisy_chain_count or [1]:
+                result = run_benchmark(
+                    mode=mode,
+                    device_count=device_count,
+                    bit_number=args.bit_number,
+                    voltage_increment=args.voltage_increment,
+                    phase_increment=args.phase_increment,
+                    ftdi_jtag_frequency=args.ftdi_jtag_frequency,
+                    shift_latency=args.shift_latency,
+                    usb_latency=args.usb_latency,
+                    transport=transport,
+                    dwell_time=args.dwell_time)
+                print(f"{result.mode}\t{result.transport}\t"
+                      f"devices={result.device_count}\t"
+                      f"points={result.points}\t"
+                      f"points/s={result.points_per_second:.1f}\t"
+                      f"shifts/point={result.shifts_per_point:.2f}\t"
+                      f"tck/point={result.tck_cycles_per_point:.1f}\t"
+                      f"points/round trip={result.points_per_round_trip:.2f}\t"
+                      f"inferred={result.inferred_samples}\t"
+                      f"mismatches={result.mismatches}")
+                results.append(result)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump([result.to_dict() for result in results], file, indent=2)
+    if any(result.mismatches for result in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
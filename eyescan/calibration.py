@@ -0,0 +1,122 @@
+import json
+import os
+import pathlib
+from dataclasses import asdict
+from typing import Callable
+from instructions import ReceiverSettings
+
+# JTAG clock calibration. TCK is ramped up through CALIBRATION_FREQUENCIES
+# while the chain keeps passing its integrity check, the fastest frequency
+# that passed every repeat is lowered by SAFETY_MARGIN and cached per adapter
+# serial number and chain length. Scans that fail the check back off from it.
+# The receiver settings found by eyescan-tune belong to the board and its
+# channels, not to the adapter, and are cached per board id and chain length.
+
+CALIBRATION_FREQUENCIES = (1E5, 2E5, 5E5, 1E6, 2E6, 5E6, 10E6, 15E6, 30E6)
+CALIBRATION_REPEATS = 8
+SAFETY_MARGIN = 0.7
+BACKOFF_FACTOR = 0.5
+MIN_FREQUENCY = CALIBRATION_FREQUENCIES[0]
+CACHE_PATH = pathlib.Path(
+    os.environ.get(
+        "XDG_CACHE_HOME",
+        pathlib.Path.home() / ".cache")) / "eyescan" / "jtag-frequency.json"
+TUNING_CACHE_PATH = CACHE_PATH.with_name("receiver-settings.json")
+
+
+class CalibrationError(Exception):
+    pass
+
+
+class ChainIntegrityError(Exception):
+    pass
+
+
+class TuningError(Exception):
+    pass
+
+
+def cache_key(identifier: str, daisy_chain_device_count: int) -> str:
+    return f"{identifier}/{daisy_chain_device_count}"
+
+
+def load_cache(path: pathlib.Path = CACHE_PATH) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def write_cache(cache: dict, path: pathlib.Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.tmp")
+    temporary.write_text(json.dumps(cache, indent=2, sort_keys=True))
+    os.replace(temporary, path)
+
+
+def cached_frequency(serial_number: str,
+                     daisy_chain_device_count: int,
+                     path: pathlib.Path = CACHE_PATH) -> float | None:
+    return load_cache(path).get(
+        cache_key(serial_number, daisy_chain_device_count))
+
+
+def store_frequency(serial_number: str,
+                    daisy_chain_device_count: int,
+                    frequency: float,
+                    path: pathlib.Path = CACHE_PATH):
+    cache = load_cache(path)
+    cache[cache_key(serial_number, daisy_chain_device_count)] = frequency
+    write_cache(cache, path)
+
+
+def cached_receiver_settings(
+    board_id: str,
+    daisy_chain_device_count: int,
+    path: pathlib.Path = TUNING_CACHE_PATH
+) -> dict[tuple[int, int], ReceiverSettings] | None:
+    # By (device, receiver block), cached as "device/receiver block"
+    settings = load_cache(path).get(
+        cache_key(board_id, daisy_chain_device_count))
+    if settings is None:
+        return None
+    return {
+        tuple(map(int, key.split("/"))): ReceiverSettings(**fields)
+        for key, fields in settings.items()
+    }
+
+
+def store_receiver_settings(board_id: str,
+                            daisy_chain_device_count: int,
+                            settings: dict[tuple[int, int], ReceiverSettings],
+                            path: pathlib.Path = TUNING_CACHE_PATH):
+    cache = load_cache(path)
+    cache[cache_key(board_id, daisy_chain_device_count)] = {
+        f"{device}/{receiver_block}": asdict(receiver_settings)
+        for (device, receiver_block), receiver_settings in settings.items()
+    }
+    write_cache(cache, path)
+
+
+def calibrate(set_frequency: Callable[[float], float],
+              check: Callable[[], bool],
+              frequencies: tuple[float, ...] = CALIBRATION_FREQUENCIES,
+              repeats: int = CALIBRATION_REPEATS) -> float:
+    # set_frequency returns the frequency the adapter actually runs at
+    fastest = None
+    for frequency in frequencies:
+        frequency = set_frequency(frequency)
+        if not all(check() for _ in range(repeats)):
+            break
+        fastest = frequency
+    if fastest is None:
+        raise CalibrationError(
+            f"JTAG chain fails its integrity check at {frequencies[0]} Hz")
+    return max(fastest * SAFETY_MARGIN, frequencies[0])
+
+
+def back_off(frequency: float) -> float:
+    if frequency <= MIN_FREQUENCY:
+        raise CalibrationError(
+            f"JTAG chain fails its integrity check at {frequency} Hz")
+    return max(frequency * BACKOFF_FACTOR, MIN_FREQUENCY)
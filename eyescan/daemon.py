@@ -0,0 +1,187 @@
+import argparse
+import pathlib
+import queue
+import socket
+import socketserver
+import sys
+import threading
+from dataclasses import asdict
+from typing import Callable
+from pyftdi.jtag import JtagEngine
+from scan import ScanSession, select_perform_func
+from instrumentation import profiling
+from service import decode_job, encode_status
+
+# Scan daemon. Every adapter stays open in a ScanSession between scans, so a
+# scan skips the adapter reset and the configuration registers that already
+# hold its values. Scans submitted by eyescan --daemon run one at a time in
+# the order they came in, and their samples are streamed back to the client.
+
+# Job options that need a new session when they change
+SESSION_OPTIONS = ("ftdi_jtag_frequency", "ftdi_direction",
+                   "ftdi_initial_value", "ftdi_reset_bit",
+                   "daisy_chain_device_count")
+
+
+class ScanJob:
+
+    def __init__(self, job: dict, stream):
+        self.job = job
+        self.stream = stream
+        self.status = None
+        self.done = threading.Event()
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        with self.request.makefile("w") as stream:
+            try:
+                job = decode_job(self.rfile.readline())
+            except (ValueError, KeyError, TypeError) as error:
+                stream.write(encode_status(error=f"Invalid job: {error}"))
+                return
+            scan_job = ScanJob(job, stream)
+            stream.write(encode_status(queued=self.server.pending()))
+            stream.flush()
+            self.server.jobs.put(scan_job)
+            scan_job.done.wait()
+            try:
+                stream.write(encode_status(**scan_job.status))
+                stream.flush()
+            except ConnectionError:
+                pass
+
+
+class ScanDaemon(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self,
+                 socket_path: str | pathlib.Path,
+                 jtag_factory: Callable[..., JtagEngine] = JtagEngine):
+        super().__init__(str(socket_path), JobHandler)
+        self.jtag_factory = jtag_factory
+        self.jobs = queue.Queue()
+        self.active = None
+        # pyftdi URL -> ScanSession
+        self.sessions = {}
+        self.worker = threading.Thread(target=self.run_jobs,
+                                       name="eyescan-daemon")
+        self.worker.start()
+
+    def pending(self) -> int:
+        return self.jobs.qsize() + (self.active is not None)
+
+    def session(self, job: dict) -> ScanSession:
+        pyftdi_url = job["pyftdi_url"]
+        settings = tuple(job[option] for option in SESSION_OPTIONS)
+        session = self.sessions.get(pyftdi_url)
+        if session is not None and session.settings != settings:
+            self.close_session(pyftdi_url)
+            session = None
+        if session is None:
+            session = ScanSession(pyftdi_url,
+                                  *settings,
+                                  jtag_factory=self.jtag_factory)
+            self.sessions[pyftdi_url] = session
+        return session
+
+    def close_session(self, pyftdi_url: str):
+        session = self.sessions.pop(pyftdi_url, None)
+        if session is not None:
+            try:
+                session.close()
+            except Exception as error:
+                print(f"Could not close {pyftdi_url}: {error}",
+                      file=sys.stderr)
+
+    def run_jobs(self):
+        while (scan_job := self.jobs.get()) is not None:
+            self.active = scan_job
+            scan_job.status = self.perform(scan_job)
+            self.active = None
+            scan_job.done.set()
+
+    def perform(self, scan_job: ScanJob) -> dict:
+        job = dict(scan_job.job)
+        perform_eyescan_func = select_perform_func(job.pop("parallel"),
+                                                   job.pop("chain_wide"),
+                                                   job.pop("pipelined"))
+        try:
+            statistics = perform_eyescan_func(session=self.session(job),
+                                              streams=(scan_job.stream, ),
+                                              **job)
+        except ConnectionError as error:
+            # The client went away, the adapter is not affected
+            return {"error": f"{type(error).__name__}: {error}"}
+        except Exception as error:
+            # The adapter is opened and reset again for the next scan
+            print(f"Scan of {job['pyftdi_url']} failed: {error}",
+                  file=sys.stderr)
+            self.close_session(job["pyftdi_url"])
+            return {"error": f"{type(error).__name__}: {error}"}
+        return {"done": asdict(statistics)}
+
+    def server_close(self):
+        # Finishes the running scan, the queued ones are not started
+        while True:
+            try:
+                scan_job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            scan_job.status = {"error": "Daemon stopped"}
+            scan_job.done.set()
+        self.jobs.put(None)
+        self.worker.join()
+        super().server_close()
+        for pyftdi_url in list(self.sessions):
+            self.close_session(pyftdi_url)
+
+
+def remove_stale_socket(socket_path: pathlib.Path):
+    if not socket_path.exists():
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(str(socket_path))
+        except ConnectionRefusedError:
+            socket_path.unlink()
+            return
+    raise SystemExit(f"A daemon is already listening on {socket_path}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog='eyescan-daemon',
+        description='TI DAC Eyescan daemon',
+        epilog=
+        'Keeps the JTAG adapters open and runs the scans submitted with eyescan --daemon one at a time'
+    )
+    parser.add_argument('socket',
+                        type=pathlib.Path,
+                        help="Unix socket path to listen on")
+    parser.add_argument(
+        '--profile',
+        type=pathlib.Path,
+        action='append',
+        help=
+        "Count and time the operations of all scans into this file, as a Prometheus textfile for a .prom suffix and JSON otherwise"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    remove_stale_socket(args.socket)
+    profile_paths = tuple(args.profile or ())
+    with profiling(profile_paths), ScanDaemon(args.socket) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            args.socket.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
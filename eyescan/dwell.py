@@ -0,0 +1,74 @@
+import math
+from dataclasses import dataclass
+from typing import Callable
+from instructions import ws_char
+
+# Confidence-driven dwell. A point is measured with the shortest dwell first
+# and measured again with twice the dwell, until the error count shows with
+# the requested confidence whether the BER is below or above the target, the
+# counter saturates or the longest dwell is reached.
+
+ECOUNT_SATURATION = ws_char.ecount.mask
+# Gets the dwell and (voltage, phase) points, returns the amplitudes of every
+# sample (lane) for each of them
+MeasureDwell = Callable[[float, list[tuple[int, int]]], list[tuple[int, ...]]]
+
+
+def poisson_cdf(count: int, mean: float) -> float:
+    # P(X <= count) for X ~ Poisson(mean)
+    if mean <= 0:
+        return 1
+    return min(
+        1,
+        math.fsum(
+            math.exp(index * math.log(mean) - mean - math.lgamma(index + 1))
+            for index in range(count + 1)))
+
+
+@dataclass(frozen=True)
+class DwellPolicy:
+    min_dwell: float
+    max_dwell: float
+    target_ber: float = 1E-12
+    confidence: float = 0.95
+    bit_rate: float = 10E9
+
+    def __post_init__(self):
+        if self.max_dwell > self.min_dwell and self.min_dwell <= 0:
+            raise ValueError("Dwell can only be extended from above 0")
+
+    @classmethod
+    def fixed(cls, dwell_time: float) -> 'DwellPolicy':
+        return cls(dwell_time, dwell_time)
+
+    def settled(self, ecount: int, dwell: float) -> bool:
+        if ecount >= ECOUNT_SATURATION or dwell >= self.max_dwell:
+            return True
+        mean = dwell * self.bit_rate * self.target_ber
+        significance = 1 - self.confidence
+        # BER below the target: this few errors would be unlikely at it
+        if poisson_cdf(ecount, mean) <= significance:
+            return True
+        # BER above the target: this many errors would be unlikely at it
+        return ecount > 0 and 1 - poisson_cdf(ecount - 1, mean) <= significance
+
+    def measure(
+            self, measure: MeasureDwell,
+            points: list[tuple[int,
+                               int]]) -> list[tuple[tuple[int, ...], float]]:
+        # Returns the amplitudes and the dwell they were measured with
+        results = [None] * len(points)
+        pending = list(range(len(points)))
+        dwell = self.min_dwell
+        while pending:
+            amplitudes = measure(dwell, [points[index] for index in pending])
+            unsettled = []
+            for index, point_amplitudes in zip(pending, amplitudes):
+                results[index] = (point_amplitudes, dwell)
+                if not all(
+                        self.settled(amplitude, dwell)
+                        for amplitude in point_amplitudes):
+                    unsettled.append(index)
+            pending = unsettled
+            dwell = min(dwell * 2, self.max_dwell)
+        return results
@@ -1,270 +1,19 @@
-from pyftdi.jtag import JtagEngine
-from pyftdi.bits import BitSequence
 import argparse
+import dataclasses
+import functools
+import json
 import pathlib
-import time
-from instructions import IEEE_1500_IR_COMMAND, IEEE_1500_DR_COMMAND, BYPASS_COMMAND, COMMANDS, RESET_STATE_COMMAND, ws_char, ws_cfg, ws_core, ws_tuning, TestPattern
-
-# See https://e2e.ti.com/cfs-file/__key/communityserver-discussions-components-files/73/2625.DAC38J84-RX-Tests-_2D00_-Version-1p1.pdf
-
-# INSTRUCTIONS:
-# https://www.ti.com/lit/ds/symlink/dac38j82.pdf?ts=1763026988732&ref_url=https%253A%252F%252Fwww.ti.com%252Fproduct%252FDAC38J82 (page 47)
-# INSTRUCTION OPCODE DESCRIPTION
-# ws_bypass 0x00 Bypass. Selects a 1-bit bypass data register. Use when accessing other macros on the same IEEE1500 scan chain.
-# ws_cfg 0x35 Configuration. Write protection options for other instructions.
-# ws_core 0x30 Core. Fields also accessible via dedicated core-side ports.
-# ws_tuning 0x31 Tuning. Fields for fine tuning macro performance.
-# ws_debug 0x32 Debug. Fields for advanced control, manufacturing test, silicon characterization and debug
-# ws_unshadowed 0x34 Unshadowed. Fields for silicon characterization.
-# ws_char 0x33 Char. Fields used for eye scan.
-
-
-def write_ir(data: str, jtag: JtagEngine, daisy_chain_device_number: int,
-             daisy_chain_device_count: int):
-    jtag.write_ir(
-        BitSequence(BYPASS_COMMAND *
-                    (daisy_chain_device_count - daisy_chain_device_number) +
-                    data + BYPASS_COMMAND * (daisy_chain_device_number - 1),
-                    msb=False))
-
-
-def shift_dr(data: str, jtag: JtagEngine, daisy_chain_device_number: int,
-             daisy_chain_device_count: int) -> str:
-    encoded_data = BitSequence(
-        "0" * (daisy_chain_device_count - daisy_chain_device_number) + data +
-        "0" * (daisy_chain_device_number - 1),
-        msb=False)
-    jtag.change_state('shift_dr')
-    readback = jtag.shift_and_update_register(encoded_data)
-    jtag.go_idle()
-    readback = str(readback).replace(" ", "")
-    readback = readback.split(":")[1]
-    return readback
-
-
-def select_command(jtag: JtagEngine, daisy_chain_device_number: int,
-                   daisy_chain_device_count: int, command: str):
-    write_ir(IEEE_1500_IR_COMMAND, jtag, daisy_chain_device_number,
-             daisy_chain_device_count)
-    shift_dr(command, jtag, daisy_chain_device_number,
-             daisy_chain_device_count)
-    write_ir(RESET_STATE_COMMAND, jtag, daisy_chain_device_number,
-             daisy_chain_device_count)
-    write_ir(IEEE_1500_DR_COMMAND, jtag, daisy_chain_device_number,
-             daisy_chain_device_count)
-
-
-def read_back_from_char(jtag: JtagEngine,
-                        daisy_chain_device_number: int,
-                        daisy_chain_device_count: int,
-                        voltage_off: int,
-                        phase_off: int,
-                        bit_select: int,
-                        is_r0=True):
-    bits = ws_char(phase_off,
-                   bit_select,
-                   voltage_off,
-                   es=0b0001,
-                   esword=255,
-                   voltage_offset_override=True).to_binary()[::-1] + (
-                       "" if is_r0 else "0")
-    readback = shift_dr(bits, jtag, daisy_chain_device_number,
-                        daisy_chain_device_count)
-    readback_decoded = readback[daisy_chain_device_number -
-                                1:][::-1][0 if is_r0 else 2:][::-1]
-    return int(readback_decoded[2:14][::-1],
-               2), int(readback_decoded[50:62][::-1],
-                       2), int(readback_decoded[98:110][::-1],
-                               2), int(readback_decoded[146:158][::-1], 2)
-
-
-def configure_receiver_block(jtag: JtagEngine, daisy_chain_device_number: int,
-                             daisy_chain_device_count: int,
-                             receiver_block: int, test_pattern: TestPattern):
-    select_command(jtag, daisy_chain_device_number, daisy_chain_device_count,
-                   COMMANDS[receiver_block]["SELECT_CFG"])
-    bits = ws_cfg().to_binary()[::-1] + ("0" if receiver_block == 1 else "")
-    shift_dr(bits, jtag, daisy_chain_device_number, daisy_chain_device_count)
-    select_command(jtag, daisy_chain_device_number, daisy_chain_device_count,
-                   COMMANDS[receiver_block]["SELECT_CFG"])
-    bits = ws_cfg(core_we_head=True,
-                  core_we=True,
-                  char_we=True,
-                  tuning_we=True,
-                  core_we_tail=True,
-                  tuning_we_tail=True).to_binary()[::-1] + (
-                      "0" if receiver_block == 1 else "")
-    shift_dr(bits, jtag, daisy_chain_device_number, daisy_chain_device_count)
-    select_command(jtag, daisy_chain_device_number, daisy_chain_device_count,
-                   COMMANDS[receiver_block]["SELECT_CORE_INPUTS"])
-    bits = ws_core(enpll=True,
-                   mpy=5,
-                   enrx=True,
-                   buswidth=2,
-                   term=1,
-                   eq=1,
-                   enoc=True,
-                   cfg_ovr=True,
-                   testpatt=test_pattern).to_binary()[::-1] + (
-                       "0" if receiver_block == 1 else "")
-    shift_dr(bits, jtag, daisy_chain_device_number, daisy_chain_device_count)
-    select_command(jtag, daisy_chain_device_number, daisy_chain_device_count,
-                   COMMANDS[receiver_block]["SELECT_TUNING"])
-    bits = ws_tuning(
-        encor=True).to_binary()[::-1] + ("0" if receiver_block == 1 else "")
-    shift_dr(bits, jtag, daisy_chain_device_number, daisy_chain_device_count)
-
-
-def readout_receiver_block(jtag: JtagEngine, daisy_chain_device_number: int,
-                           daisy_chain_device_count: int, bit_number: int,
-                           receiver_block: int, dwell_time: float,
-                           voltage_increment: int, phase_increment: int):
-    for voltage in range(31, -33, -1 * voltage_increment):
-        for bit_select in range(bit_number):
-            select_command(jtag, daisy_chain_device_number,
-                           daisy_chain_device_count,
-                           COMMANDS[receiver_block]["SELECT_READBACK"])
-            read_back_from_char(jtag, daisy_chain_device_number,
-                                daisy_chain_device_count, voltage & 0xff, 0,
-                                bit_select, receiver_block == 0)
-            for phase in range(15, -17, -1 * phase_increment):
-                read_back_from_char(jtag, daisy_chain_device_number,
-                                    daisy_chain_device_count, voltage & 0xff,
-                                    phase & 0xff, bit_select,
-                                    receiver_block == 0)
-                time.sleep(dwell_time)
-                amplitudes = read_back_from_char(jtag,
-                                                 daisy_chain_device_number,
-                                                 daisy_chain_device_count,
-                                                 voltage & 0xff, phase & 0xff,
-                                                 bit_select,
-                                                 receiver_block == 0)
-                for lane, amp in enumerate(amplitudes):
-                    yield lane + 4 * receiver_block, bit_select, voltage, phase, amp
-
-
-def reset_state_whole_chain(jtag, daisy_chain_device_number,
-                            daisy_chain_device_count):
-    jtag.write_ir(
-        BitSequence(RESET_STATE_COMMAND *
-                    (daisy_chain_device_count - daisy_chain_device_number) +
-                    RESET_STATE_COMMAND + RESET_STATE_COMMAND *
-                    (daisy_chain_device_number - 1),
-                    msb=False))
-
-
-def parallel_readout_receiver_block(jtag: JtagEngine,
-                                    daisy_chain_device_count: int,
-                                    bit_number: int, receiver_block: int,
-                                    dwell_time: float, voltage_increment: int,
-                                    phase_increment: int):
-    for voltage in range(31, -33, -1 * voltage_increment):
-        for bit_select in range(bit_number):
-            for daisy_chain_device_number in range(
-                    1, daisy_chain_device_count + 1):
-                reset_state_whole_chain(jtag, daisy_chain_device_number,
-                                        daisy_chain_device_count)
-                select_command(jtag, daisy_chain_device_number,
-                               daisy_chain_device_count,
-                               COMMANDS[receiver_block]["SELECT_READBACK"])
-                read_back_from_char(jtag, daisy_chain_device_number,
-                                    daisy_chain_device_count, voltage & 0xff,
-                                    0, bit_select, receiver_block == 0)
-            for phase in range(15, -17, -1 * phase_increment):
-                start = time.time()
-                for daisy_chain_device_number in range(
-                        1, daisy_chain_device_count + 1):
-                    reset_state_whole_chain(jtag, daisy_chain_device_number,
-                                            daisy_chain_device_count)
-                    write_ir(IEEE_1500_DR_COMMAND, jtag,
-                             daisy_chain_device_number,
-                             daisy_chain_device_count)
-                    read_back_from_char(jtag, daisy_chain_device_number,
-                                        daisy_chain_device_count,
-                                        voltage & 0xff, phase & 0xff,
-                                        bit_select, receiver_block == 0)
-
-                time.sleep(max(dwell_time - (time.time() - start), 0))
-                for daisy_chain_device_number in range(
-                        1, daisy_chain_device_count + 1):
-                    reset_state_whole_chain(jtag, daisy_chain_device_number,
-                                            daisy_chain_device_count)
-                    write_ir(IEEE_1500_DR_COMMAND, jtag,
-                             daisy_chain_device_number,
-                             daisy_chain_device_count)
-                    amplitudes = read_back_from_char(
-                        jtag, daisy_chain_device_number,
-                        daisy_chain_device_count, voltage & 0xff, phase & 0xff,
-                        bit_select, receiver_block == 0)
-                    for lane, amp in enumerate(amplitudes):
-                        yield daisy_chain_device_number, lane + 4 * receiver_block, bit_select, voltage, phase, amp
-
-
-def perform_eyescan(pyftdi_url: str, ftdi_jtag_frequency: float,
-                    ftdi_direction: int, ftdi_initial_value: int,
-                    ftdi_reset_bit: int, daisy_chain_device_number: int,
-                    daisy_chain_device_count: int,
-                    output_path: str | pathlib.Path, bit_number: int,
-                    test_pattern: TestPattern, dwell_time: float,
-                    voltage_increment: int, phase_increment: int):
-    try:
-        jtag = JtagEngine(frequency=ftdi_jtag_frequency,
-                          direction=ftdi_direction,
-                          initial=ftdi_initial_value,
-                          rst_bit=ftdi_reset_bit)
-        jtag.configure(pyftdi_url)
-        jtag.reset(hw_reset=True, tap_reset=True)
-        with open(output_path, "w") as file:
-            for receiver_block in range(2):
-                for daisy_chain_device_number in range(
-                        1, daisy_chain_device_count + 1):
-                    configure_receiver_block(jtag, daisy_chain_device_number,
-                                             daisy_chain_device_count,
-                                             receiver_block, test_pattern)
-                for lane, bit, voltage, phase, amplitude in readout_receiver_block(
-                        jtag, daisy_chain_device_number,
-                        daisy_chain_device_count, bit_number, receiver_block,
-                        dwell_time, voltage_increment, phase_increment):
-                    file.write(
-                        f"{daisy_chain_device_number}\t{lane}\t{bit}\t{voltage}\t{phase}\t{amplitude}\n"
-                    )
-    finally:
-        jtag.close()
-        del jtag
-
-
-def perform_parallel_eyescan(
-        pyftdi_url: str, ftdi_jtag_frequency: float, ftdi_direction: int,
-        ftdi_initial_value: int, ftdi_reset_bit: int,
-        daisy_chain_device_count: int, output_path: str | pathlib.Path,
-        bit_number: int, test_pattern: TestPattern, dwell_time: float,
-        voltage_increment: int, phase_increment: int, **kwargs):
-    try:
-        jtag = JtagEngine(frequency=ftdi_jtag_frequency,
-                          direction=ftdi_direction,
-                          initial=ftdi_initial_value,
-                          rst_bit=ftdi_reset_bit)
-        jtag.configure(pyftdi_url)
-        jtag.reset(hw_reset=True, tap_reset=True)
-        with open(output_path, "w") as file:
-            for receiver_block in range(2):
-                for daisy_chain_device_number in range(
-                        1, daisy_chain_device_count + 1):
-                    configure_receiver_block(jtag, daisy_chain_device_number,
-                                             daisy_chain_device_count,
-                                             receiver_block, test_pattern)
-                    reset_state_whole_chain(jtag, daisy_chain_device_number,
-                                            daisy_chain_device_count)
-                for daisy_chain_device_number, lane, bit, voltage, phase, amplitude in parallel_readout_receiver_block(
-                        jtag, daisy_chain_device_count, bit_number,
-                        receiver_block, dwell_time, voltage_increment,
-                        phase_increment):
-                    file.write(
-                        f"{daisy_chain_device_number}\t{lane}\t{bit}\t{voltage}\t{phase}\t{amplitude}\n"
-                    )
-    finally:
-        jtag.close()
-        del jtag
+import sys
+from dwell import DwellPolicy
+from fleet import discover_adapters, perform_fleet_eyescan
+from instrumentation import profiling
+from plan import ScanPlan, estimate_scan, operation_latencies, report_estimate
+from runs import load_runs, pattern_runs
+from results import OUTPUT_FORMATS, WriterStatistics
+from scan import ScanSession, perform_session_eyescan, select_perform_func
+from service import submit_job
+from transport import TRANSPORTS
+from instructions import TestPattern
 
 
 def parse_args():
@@ -299,11 +48,14 @@ def parse_args():
                         type=lambda x: float(x) / 1000,
                         default=0,
                         help="Dwell time in miliseconds")
-    parser.add_argument('-f',
-                        '--ftdi-jtag-frequency',
-                        type=float,
-                        default=1E5,
-                        help="frequency of JTAG clk")
+    parser.add_argument(
+        '-f',
+        '--ftdi-jtag-frequency',
+        type=lambda x: None if x == "auto" else float(x),
+        default=1E5,
+        help=
+        "frequency of JTAG clk, auto for the one calibrated for the adapter and chain length (calibrating it if there is none yet)"
+    )
     parser.add_argument('-d',
                         '--ftdi-direction',
                         type=lambda x: int(x, 0),
@@ -336,6 +88,139 @@ def parse_args():
         '--parallel',
         action='store_true',
         help="Run eyescan test for all DACs in daisy-chain in parallel")
+    parser.add_argument(
+        '--chain-wide',
+        action='store_true',
+        help=
+        "Read all DACs in daisy-chain with a single DR shift (implies --parallel)"
+    )
+    parser.add_argument(
+        '--pipelined',
+        action='store_true',
+        help=
+        "Arm both receiver blocks of all DACs in daisy-chain and share one dwell window between them (implies --parallel), takes more JTAG shifts per point and needs a --dwell-time"
+    )
+    parser.add_argument(
+        '--adaptive',
+        action='store_true',
+        help=
+        "Only measure points around the eye boundary of every lane, the other points are inferred and marked in an extra output column"
+    )
+    parser.add_argument(
+        '--max-dwell-time',
+        type=lambda x: float(x) / 1000,
+        help=
+        "Start every point with --dwell-time and double it up to this many miliseconds until the error count shows with --confidence whether the BER is below --target-ber, the dwell of every sample is written in an extra output column"
+    )
+    parser.add_argument('--target-ber',
+                        type=float,
+                        default=1E-12,
+                        help="BER threshold of --max-dwell-time")
+    parser.add_argument('--confidence',
+                        type=float,
+                        default=0.95,
+                        help="statistical confidence of --max-dwell-time")
+    parser.add_argument(
+        '--bit-rate',
+        type=float,
+        default=10E9,
+        help=
+        "bits per second checked by the error counter, for --max-dwell-time")
+    parser.add_argument(
+        '--output-format',
+        choices=OUTPUT_FORMATS,
+        default="tsv",
+        help=
+        "tsv writes one line per sample, binary a memory-mappable array of fixed-width records over the sweep grid"
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help="Also write the samples to stdout as tsv while the scan runs")
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help=
+        "Continue an interrupted scan with the same options, keeping the samples of the slices listed in the journal next to the output"
+    )
+    parser.add_argument(
+        '--fleet',
+        type=str,
+        action='append',
+        help=
+        "Scan the board chain of every given pyftdi URL in a separate process, the output gets the adapter URL as the first column (instead of --pyftdi-url)"
+    )
+    parser.add_argument('--fleet-discover',
+                        action='store_true',
+                        help="Like --fleet with every connected FTDI adapter")
+    parser.add_argument(
+        '--profile',
+        type=pathlib.Path,
+        action='append',
+        help=
+        "Count and time the JTAG, USB, dwell and output operations of the scan into this file while it runs, as a Prometheus textfile for a .prom suffix and JSON otherwise"
+    )
+    parser.add_argument(
+        '--calibrate',
+        action='store_true',
+        help=
+        "Calibrate the JTAG clk of the adapter and chain length again before the scan, which then runs like with --ftdi-jtag-frequency auto"
+    )
+    parser.add_argument(
+        '--tuned',
+        action='store_true',
+        help=
+        "Configure every receiver block with the settings eyescan-tune found for the board (--board-id) and chain length instead of the defaults"
+    )
+    parser.add_argument(
+        '--board-id',
+        type=str,
+        help=
+        "identifier of the board whose tuned receiver settings --tuned uses, e.g. its serial number"
+    )
+    parser.add_argument(
+        '--daemon',
+        type=pathlib.Path,
+        help=
+        "Unix socket of an eyescan-daemon to run the scan on, which keeps the adapter open and skips configuration registers that already hold their values"
+    )
+    parser.add_argument(
+        '--plan',
+        type=pathlib.Path,
+        help=
+        "JSON scan plan with the voltages, phases, bits, receiver_blocks, lanes and devices to scan and the row order (voltage or bit major), fields it leaves out come from the other options"
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help=
+        "Scan a simulated chain instead and print the JTAG traffic and predicted duration of the scan, without touching the adapter"
+    )
+    parser.add_argument(
+        '--latencies',
+        type=pathlib.Path,
+        help=
+        "--profile JSON of an earlier scan at the same JTAG clk, whose mean operation latencies --dry-run uses"
+    )
+    parser.add_argument(
+        '--archive',
+        type=pathlib.Path,
+        help=
+        "Add the output to this eyescan-archive directory once the scan is done, requires numpy"
+    )
+    parser.add_argument(
+        '--render',
+        type=pathlib.Path,
+        help=
+        "Keep an eye diagram of every lane updated in this directory while the scan runs, as an HTML page with a PNG image, requires numpy"
+    )
+    parser.add_argument(
+        '--transport',
+        choices=TRANSPORTS,
+        default="direct",
+        help=
+        "JTAG transport, mpsse sends every voltage/bit row of the scan as one USB transfer"
+    )
 
     def parse_test_pattern(pattern):
         try:
@@ -345,32 +230,231 @@ def parse_args():
                 f"{pattern} is not a valid test pattern ({[str(i) for i in TestPattern]})"
             )
 
-    parser.add_argument('-p',
-                        '--test-pattern',
-                        type=parse_test_pattern,
-                        choices=list(TestPattern),
-                        default=TestPattern.PRBS_7_BIT,
-                        help="eyescan test pattern")
+    parser.add_argument(
+        '-p',
+        '--test-pattern',
+        type=parse_test_pattern,
+        choices=list(TestPattern),
+        action='append',
+        help=
+        f"eyescan test pattern ({TestPattern.PRBS_7_BIT} by default), repeat it to scan the patterns one after another in one JTAG session with the pattern as the first output column"
+    )
+    parser.add_argument(
+        '--runs',
+        type=pathlib.Path,
+        help=
+        "JSON list of scan runs, with their label, test_pattern, dwell_time, tuned and plan, scanned one after another in one JTAG session with the run label as the first output column"
+    )
+
+    args = parser.parse_args()
+    test_patterns = args.test_pattern or [TestPattern.PRBS_7_BIT]
+    args.test_pattern = test_patterns[0]
+    if len(test_patterns) > 1 and args.runs is not None:
+        parser.error("--runs cannot be combined with several --test-pattern")
+    if args.pipelined and (args.adaptive or args.max_dwell_time is not None):
+        parser.error(
+            "--pipelined cannot be combined with --adaptive or --max-dwell-time"
+        )
+    if args.max_dwell_time is not None and not 0 < args.dwell_time <= args.max_dwell_time:
+        parser.error(
+            "--max-dwell-time requires a --dwell-time between 0 and it")
+    if (args.fleet or args.fleet_discover) and args.output_format != "tsv":
+        parser.error("--fleet only merges tsv output")
+    if (args.fleet or args.fleet_discover) and args.resume:
+        parser.error("--fleet scans cannot be resumed")
+    if (args.fleet or args.fleet_discover) and args.profile:
+        parser.error("--fleet scans cannot be profiled")
+    if args.daemon is not None and (args.fleet or args.fleet_discover):
+        parser.error("--daemon cannot be combined with --fleet")
+    if args.calibrate and (args.fleet or args.fleet_discover
+                           or args.daemon is not None):
+        parser.error(
+            "--calibrate cannot be combined with --fleet or --daemon, use --ftdi-jtag-frequency auto"
+        )
+    if args.daemon is not None and args.profile:
+        parser.error("--daemon scans are profiled by the daemon")
+    if not 0 < args.confidence < 1:
+        parser.error("--confidence must be between 0 and 1")
+    if args.dry_run and (args.fleet or args.fleet_discover
+                         or args.daemon is not None or args.calibrate
+                         or args.archive is not None):
+        parser.error(
+            "--dry-run cannot be combined with --fleet, --daemon, --calibrate or --archive"
+        )
+    if args.dry_run and args.ftdi_jtag_frequency is None:
+        parser.error("--dry-run needs an --ftdi-jtag-frequency in Hz")
+    if args.render is not None and (args.fleet or args.fleet_discover
+                                    or args.dry_run):
+        parser.error("--render cannot be combined with --fleet or --dry-run")
+    if args.latencies is not None and not args.dry_run:
+        parser.error("--latencies requires --dry-run")
+    if args.dry_run and args.profile:
+        parser.error(
+            "--dry-run scans are not profiled, their estimate is printed")
+    # Without a dwell window to share, pipelining only adds WIR switches, a
+    # dry run still estimates it
+    if args.pipelined and not args.dwell_time and args.max_dwell_time is None and not args.dry_run:
+        parser.error(
+            "--pipelined needs a --dwell-time, without one it only adds JTAG shifts"
+        )
+    try:
+        plan = ScanPlan.sweep(args.bit_number, args.voltage_increment,
+                              args.phase_increment)
+        if args.plan is not None:
+            plan = ScanPlan.load(args.plan, plan)
+    except (OSError, KeyError, TypeError, ValueError) as error:
+        parser.error(f"Invalid scan plan: {error}")
+    # The eye diagrams tell dead lanes once the eye center is measured
+    if args.render is not None:
+        plan = dataclasses.replace(plan, center_first=True)
+    args.plan = plan
+    try:
+        if args.runs is not None:
+            args.runs = load_runs(args.runs, args.test_pattern, plan)
+        elif len(test_patterns) > 1:
+            args.runs = pattern_runs(test_patterns)
+    except (OSError, KeyError, TypeError, ValueError) as error:
+        parser.error(f"Invalid scan runs: {error}")
+    if args.runs is not None:
+        if args.output_format != "tsv":
+            parser.error("Scan runs only merge tsv output")
+        if args.resume or args.daemon is not None or args.dry_run or args.archive is not None:
+            parser.error(
+                "Scan runs cannot be combined with --resume, --daemon, --dry-run or --archive"
+            )
+        # The run label column would end up after the adapter URL column
+        if args.fleet or args.fleet_discover:
+            parser.error("Scan runs cannot be combined with --fleet")
+        if args.max_dwell_time is not None and any(run.dwell_time is not None
+                                                   for run in args.runs):
+            parser.error(
+                "Scan runs with their own dwell_time cannot use --max-dwell-time"
+            )
+    # Every adapter of a fleet drives another board
+    if args.tuned or any(run.tuned for run in args.runs or ()):
+        if args.fleet or args.fleet_discover:
+            parser.error("Tuned scans cannot be combined with --fleet")
+        if args.board_id is None:
+            parser.error("Tuned scans need the --board-id of the board")
+    try:
+        if args.latencies is not None:
+            args.latencies = json.loads(args.latencies.read_text())
+    except (OSError, ValueError) as error:
+        parser.error(f"Invalid --latencies profile: {error}")
+    return args
+
 
-    return parser.parse_args()
+def archive_scan(args):
+    # The archive computes eye metrics with numpy, the scan does not need it
+    from archive import ScanMetadata, ingest
+    # Fleet output has the adapter URL of every sample
+    pyftdi_url = "" if args.fleet or args.fleet_discover else args.pyftdi_url
+    ingest(
+        args.archive, args.output,
+        ScanMetadata(pyftdi_url, args.test_pattern.name, args.dwell_time,
+                     args.bit_rate))
 
 
 def main():
     args = parse_args()
-    perform_eyescan_func = perform_parallel_eyescan if args.parallel else perform_eyescan
-    perform_eyescan_func(pyftdi_url=args.pyftdi_url,
-                         ftdi_jtag_frequency=args.ftdi_jtag_frequency,
-                         ftdi_direction=args.ftdi_direction,
-                         ftdi_initial_value=args.ftdi_initial_value,
-                         ftdi_reset_bit=args.ftdi_reset_bit,
-                         daisy_chain_device_count=args.daisy_chain_count,
-                         daisy_chain_device_number=args.daisy_chain_number,
-                         output_path=args.output,
-                         bit_number=args.bit_number,
-                         test_pattern=args.test_pattern,
-                         dwell_time=args.dwell_time,
-                         voltage_increment=args.voltage_increment,
-                         phase_increment=args.phase_increment)
+    dwell_policy = None
+    if args.max_dwell_time is not None:
+        dwell_policy = DwellPolicy(args.dwell_time, args.max_dwell_time,
+                                   args.target_ber, args.confidence,
+                                   args.bit_rate)
+    if args.calibrate:
+        session = ScanSession(args.pyftdi_url,
+                              None,
+                              args.ftdi_direction,
+                              args.ftdi_initial_value,
+                              args.ftdi_reset_bit,
+                              args.daisy_chain_count,
+                              recalibrate=True)
+        print(f"JTAG clk calibrated to {session.frequency:.0f} Hz",
+              file=sys.stderr)
+        session.close()
+        args.ftdi_jtag_frequency = None
+    kwargs = dict(ftdi_jtag_frequency=args.ftdi_jtag_frequency,
+                  ftdi_direction=args.ftdi_direction,
+                  ftdi_initial_value=args.ftdi_initial_value,
+                  ftdi_reset_bit=args.ftdi_reset_bit,
+                  daisy_chain_device_count=args.daisy_chain_count,
+                  daisy_chain_device_number=args.daisy_chain_number,
+                  bit_number=args.bit_number,
+                  test_pattern=args.test_pattern,
+                  dwell_time=args.dwell_time,
+                  voltage_increment=args.voltage_increment,
+                  phase_increment=args.phase_increment,
+                  transport=args.transport,
+                  adaptive=args.adaptive,
+                  dwell_policy=dwell_policy,
+                  output_format=args.output_format,
+                  stream=args.stream,
+                  resume=args.resume,
+                  plan=args.plan,
+                  tuned=args.tuned,
+                  board_id=args.board_id,
+                  render=args.render)
+    perform_eyescan_func = select_perform_func(args.parallel, args.chain_wide,
+                                               args.pipelined)
+    if args.runs is not None:
+        perform_eyescan_func = functools.partial(
+            perform_session_eyescan,
+            runs=args.runs,
+            perform_eyescan_func=perform_eyescan_func)
+    if args.dry_run:
+        latencies = operation_latencies(args.latencies,
+                                        args.ftdi_jtag_frequency)
+        estimate = estimate_scan(perform_eyescan_func, latencies,
+                                 args.pyftdi_url, **kwargs)
+        report_estimate(args.plan, estimate, sys.stdout)
+        return
+    if args.fleet or args.fleet_discover:
+        pyftdi_urls = list(dict.fromkeys(args.fleet or discover_adapters()))
+        if not pyftdi_urls:
+            raise SystemExit("No FTDI adapters found")
+        # Workers do not stream, the merged samples are streamed with the
+        # adapter URL in front
+        streams = (sys.stdout, ) if kwargs.pop("stream") else ()
+        failures = perform_fleet_eyescan(pyftdi_urls, args.output,
+                                         perform_eyescan_func, streams,
+                                         **kwargs)
+        if args.archive is not None:
+            archive_scan(args)
+        if failures:
+            raise SystemExit(1)
+        return
+    if args.daemon is not None:
+        # The daemon streams the samples back, --stream prints them
+        job = kwargs | dict(pyftdi_url=args.pyftdi_url,
+                            output_path=args.output,
+                            parallel=args.parallel,
+                            chain_wide=args.chain_wide,
+                            pipelined=args.pipelined,
+                            stream=False)
+        try:
+            status = submit_job(args.daemon, job,
+                                sys.stdout if args.stream else None,
+                                sys.stderr)
+        except OSError as error:
+            raise SystemExit(
+                f"Could not talk to the daemon at {args.daemon}: {error}")
+        if "error" in status:
+            raise SystemExit(f"Scan failed: {status['error']}")
+        statistics = WriterStatistics(**status["done"])
+    else:
+        with profiling(tuple(args.profile or ())):
+            statistics = perform_eyescan_func(pyftdi_url=args.pyftdi_url,
+                                              output_path=args.output,
+                                              **kwargs)
+    if statistics.stalls:
+        print(
+            f"Scan waited {statistics.stall_seconds:.3f} s for the "
+            f"output in {statistics.stalls} of {statistics.batches} "
+            "batches",
+            file=sys.stderr)
+    if args.archive is not None:
+        archive_scan(args)
 
 
 if __name__ == "__main__":
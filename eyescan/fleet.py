@@ -0,0 +1,107 @@
+import multiprocessing
+import multiprocessing.connection
+import pathlib
+import sys
+from typing import Callable, TextIO
+from pyftdi.ftdi import Ftdi
+from pyftdi.usbtools import UsbTools
+
+# Fleet scanning. Every FTDI adapter on the host drives its own board chain,
+# so each one is scanned by a separate worker process with its own JTAG
+# session. Workers write their own part files, and while they run the
+# complete lines of every part are merged into the result file with the
+# adapter URL prepended to its samples.
+
+# Interface used for JTAG on multi-interface FTDI chips
+JTAG_INTERFACE = 1
+# Seconds between merges of the part files of running workers
+MERGE_INTERVAL = 1
+
+
+def discover_adapters() -> list[str]:
+    devices = UsbTools.list_devices('ftdi:///?', Ftdi.VENDOR_IDS,
+                                    Ftdi.PRODUCT_IDS, Ftdi.DEFAULT_VENDOR)
+    return [
+        url for url, _ in UsbTools.build_dev_strings('ftdi', Ftdi.VENDOR_IDS,
+                                                     Ftdi.PRODUCT_IDS, devices)
+        if url.endswith(f"/{JTAG_INTERFACE}")
+    ]
+
+
+def part_path(output_path: str | pathlib.Path, index: int) -> pathlib.Path:
+    output_path = pathlib.Path(output_path)
+    return output_path.with_name(f"{output_path.name}.{index}")
+
+
+def merge_part(files: tuple[TextIO, ...],
+               pyftdi_url: str,
+               path: pathlib.Path,
+               offset: int = 0) -> int:
+    # Merges the complete lines of a part file after offset into files,
+    # returns the offset past them
+    try:
+        with open(path, "rb") as part:
+            part.seek(offset)
+            data = part.read()
+    except FileNotFoundError:
+        return offset
+    end = data.rfind(b"\n") + 1
+    text = "".join(f"{pyftdi_url}\t{line}"
+                   for line in data[:end].decode().splitlines(True))
+    for file in files:
+        file.write(text)
+    return offset + end
+
+
+def perform_fleet_eyescan(pyftdi_urls: list[str],
+                          output_path: pathlib.Path,
+                          perform_eyescan_func: Callable,
+                          streams: tuple[TextIO, ...] = (),
+                          **kwargs) -> dict[str, int]:
+    # Returns the exit codes of the adapters that failed. The samples they
+    # wrote before failing are merged and left in their part files, the
+    # other adapters are not affected. streams get the merged samples too.
+    context = multiprocessing.get_context("spawn")
+    workers = {}
+    for index, pyftdi_url in enumerate(pyftdi_urls):
+        # A part left by an earlier run would be merged before the worker
+        # truncates it
+        part_path(output_path, index).unlink(missing_ok=True)
+        process = context.Process(
+            target=perform_eyescan_func,
+            name=pyftdi_url,
+            kwargs=kwargs | {
+                "pyftdi_url": pyftdi_url,
+                "output_path": part_path(output_path, index)
+            })
+        process.start()
+        workers[process.sentinel] = (index, pyftdi_url, process)
+    offsets = [0] * len(pyftdi_urls)
+    failures = {}
+    with open(output_path, "w") as file:
+        while workers:
+            finished = multiprocessing.connection.wait(list(workers),
+                                                       MERGE_INTERVAL)
+            # Finished workers are merged to the end of their part files
+            for index, pyftdi_url, _ in workers.values():
+                offsets[index] = merge_part((file, *streams), pyftdi_url,
+                                            part_path(output_path, index),
+                                            offsets[index])
+            for merged in (file, *streams):
+                merged.flush()
+            for sentinel in finished:
+                index, pyftdi_url, process = workers.pop(sentinel)
+                process.join()
+                path = part_path(output_path, index)
+                if process.exitcode != 0:
+                    print(
+                        f"Adapter {pyftdi_url} failed with exit code "
+                        f"{process.exitcode}",
+                        file=sys.stderr)
+                    if path.exists():
+                        print(f"Partial samples of {pyftdi_url} are in {path}",
+                              file=sys.stderr)
+                    failures[pyftdi_url] = process.exitcode
+                    continue
+                path.unlink()
+    return failures
@@ -1,3 +1,4 @@
+from dataclasses import dataclass
 from enum import Enum
 
 
@@ -29,12 +30,83 @@ COMMANDS = [
     }
 ]
 
+LANES = 4
 
-def format_field(value, length):
-    return format(value, f'#0{length + 2}b')[-length:][::-1]
 
+class Field:
+    """Bit-field of a register, replicated `count` times every `stride` bits
+    for fields present once per lane"""
 
-class ws_char:
+    __slots__ = ("offset", "width", "count", "stride", "mask", "replicate")
+
+    def __init__(self, offset: int, width: int, count=1, stride=0):
+        self.offset = offset
+        self.width = width
+        self.count = count
+        self.stride = stride
+        self.mask = (1 << width) - 1
+        self.replicate = sum(1 << (offset + index * stride)
+                             for index in range(count))
+
+    def __get__(self, register, owner=None):
+        if register is None:
+            return self
+        return (register.value >> self.offset) & self.mask
+
+    def __set__(self, register, value):
+        register.value = (register.value
+                          & ~(self.mask * self.replicate)) | self.encode(value)
+
+    def encode(self, value) -> int:
+        return (int(value) & self.mask) * self.replicate
+
+    def lanes(self, value: int) -> tuple[int, ...]:
+        return tuple((value >> (self.offset + index * self.stride)) & self.mask
+                     for index in range(self.count))
+
+
+class Register:
+    # Bit p of value holds bit p of the register as listed in the TI
+    # documentation, frames are shifted starting from the most significant bit
+    __slots__ = ("value", )
+    LENGTH = 0
+
+    def __init__(self, **fields):
+        value = 0
+        for name, field_value in fields.items():
+            value |= getattr(type(self), name).encode(field_value)
+        self.value = value
+
+    @classmethod
+    def from_int(cls, value: int):
+        register = cls.__new__(cls)
+        register.value = value & ((1 << cls.LENGTH) - 1)
+        return register
+
+    def to_binary(self) -> str:
+        return format(self.value, f'0{self.LENGTH}b')[::-1]
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.value == other.value
+
+    def __hash__(self):
+        return hash((type(self), self.value))
+
+
+class ws_char(Register):
+    __slots__ = ()
+    LENGTH = 195
+    testfail = Field(2, 1, LANES, 48)
+    ecount = Field(3, 12, LANES, 48)
+    esword = Field(15, 8, LANES, 48)
+    es = Field(23, 4, LANES, 48)
+    phase_offset = Field(27, 7, LANES, 48)
+    bit_select = Field(34, 5, LANES, 48)
+    voltage_offset = Field(39, 6, LANES, 48)
+    voltage_offset_override = Field(45, 1, LANES, 48)
+    scan_len = Field(46, 2, LANES, 48)
+    scan_run = Field(48, 1, LANES, 48)
+    scan_done = Field(49, 1, LANES, 48)
 
     def __init__(self,
                  phase_offset,
@@ -48,27 +120,31 @@ class ws_char:
                  scan_len=0,
                  scan_run=False,
                  scan_done=False):
-        self.phase_offset = format_field(phase_offset, 7)
-        self.bit_select = format_field(bit_select, 5)
-        self.voltage_offset = format_field(voltage_offset, 6)
-        self.testfail = format_field(testfail, 1)
-        self.ecount = format_field(ecount, 12)
-        self.esword = format_field(esword, 8)
-        self.es = format_field(es, 4)
-        self.voltage_offset_override = format_field(voltage_offset_override, 1)
-        self.scan_len = format_field(scan_len, 2)
-        self.scan_run = format_field(scan_run, 1)
-        self.scan_done = format_field(scan_done, 1)
-
-    def to_binary(self):
-        body = (self.testfail + self.ecount + self.esword + self.es +
-                self.phase_offset + self.bit_select + self.voltage_offset +
-                self.voltage_offset_override + self.scan_len + self.scan_run +
-                self.scan_done) * 4
-        return "0" + "0" + body + "0"
-
-
-class ws_cfg:
+        super().__init__(phase_offset=phase_offset,
+                         bit_select=bit_select,
+                         voltage_offset=voltage_offset,
+                         testfail=testfail,
+                         ecount=ecount,
+                         esword=esword,
+                         es=es,
+                         voltage_offset_override=voltage_offset_override,
+                         scan_len=scan_len,
+                         scan_run=scan_run,
+                         scan_done=scan_done)
+
+
+class ws_cfg(Register):
+    __slots__ = ()
+    LENGTH = 27
+    core_we_head = Field(2, 1)
+    core_we = Field(3, 1, LANES, 5)
+    tuning_we = Field(4, 1, LANES, 5)
+    debug_we = Field(5, 1, LANES, 5)
+    char_we = Field(6, 1, LANES, 5)
+    unshadowed_we = Field(7, 1, LANES, 5)
+    core_we_tail = Field(23, 1)
+    tuning_we_tail = Field(24, 1)
+    debug_we_tail = Field(25, 1)
 
     def __init__(self,
                  core_we_head=False,
@@ -80,23 +156,32 @@ class ws_cfg:
                  core_we_tail=False,
                  tuning_we_tail=False,
                  debug_we_tail=False):
-        self.core_we_head = format_field(core_we_head, 1)
-        self.core_we = format_field(core_we, 1)
-        self.tuning_we = format_field(tuning_we, 1)
-        self.debug_we = format_field(debug_we, 1)
-        self.char_we = format_field(char_we, 1)
-        self.unshadowed_we = format_field(unshadowed_we, 1)
-        self.core_we_tail = format_field(core_we_tail, 1)
-        self.tuning_we_tail = format_field(tuning_we_tail, 1)
-        self.debug_we_tail = format_field(debug_we_tail, 1)
-
-    def to_binary(self):
-        body = (self.core_we + self.tuning_we + self.debug_we + self.char_we +
-                self.unshadowed_we) * 4
-        return "0" + "0" + self.core_we_head + body + self.core_we_tail + self.tuning_we_tail + self.debug_we_tail + "0"
+        super().__init__(core_we_head=core_we_head,
+                         core_we=core_we,
+                         tuning_we=tuning_we,
+                         debug_we=debug_we,
+                         char_we=char_we,
+                         unshadowed_we=unshadowed_we,
+                         core_we_tail=core_we_tail,
+                         tuning_we_tail=tuning_we_tail,
+                         debug_we_tail=debug_we_tail)
 
 
-class ws_tuning:
+class ws_tuning(Register):
+    __slots__ = ()
+    LENGTH = 175
+    patterrthr = Field(2, 3, LANES, 37)
+    patt_timer = Field(5, 1, LANES, 37)
+    rxdsel = Field(6, 4, LANES, 37)
+    encor = Field(10, 1, LANES, 37)
+    eqzero = Field(11, 5, LANES, 37)
+    eqz_ovr = Field(16, 1, LANES, 37)
+    eqlevel = Field(17, 16, LANES, 37)
+    eq_ovr = Field(33, 1, LANES, 37)
+    eqboost = Field(34, 2, LANES, 37)
+    rxasel = Field(36, 3, LANES, 37)
+    asel = Field(150, 4)
+    usr_patt = Field(154, 20)
 
     def __init__(self,
                  patterrthr=0,
@@ -111,24 +196,18 @@ class ws_tuning:
                  rxasel=0,
                  asel=0,
                  usr_patt=0):
-        self.patterrthr = format_field(patterrthr, 3)
-        self.patt_timer = format_field(patt_timer, 1)
-        self.rxdsel = format_field(rxdsel, 4)
-        self.encor = format_field(encor, 1)
-        self.eqzero = format_field(eqzero, 5)
-        self.eqz_ovr = format_field(eqz_ovr, 1)
-        self.eqlevel = format_field(eqlevel, 16)
-        self.eq_ovr = format_field(eq_ovr, 1)
-        self.eqboost = format_field(eqboost, 2)
-        self.rxasel = format_field(rxasel, 3)
-        self.asel = format_field(asel, 4)
-        self.usr_patt = format_field(usr_patt, 20)
-
-    def to_binary(self):
-        body = (self.patterrthr + self.patt_timer + self.rxdsel + self.encor +
-                self.eqzero + self.eqz_ovr + self.eqlevel + self.eq_ovr +
-                self.eqboost + self.rxasel) * 4
-        return "0" + "0" + body + self.asel + self.usr_patt + "0"
+        super().__init__(patterrthr=patterrthr,
+                         patt_timer=patt_timer,
+                         rxdsel=rxdsel,
+                         encor=encor,
+                         eqzero=eqzero,
+                         eqz_ovr=eqz_ovr,
+                         eqlevel=eqlevel,
+                         eq_ovr=eq_ovr,
+                         eqboost=eqboost,
+                         rxasel=rxasel,
+                         asel=asel,
+                         usr_patt=usr_patt)
 
 
 class TestPattern(Enum):
@@ -143,7 +222,52 @@ class TestPattern(Enum):
         return self.name
 
 
-class ws_core:
+class ws_core(Register):
+    __slots__ = ()
+    LENGTH = 197
+    enpll = Field(2, 1)
+    mpy = Field(3, 8)
+    vrange = Field(11, 1)
+    endivclk = Field(12, 1)
+    lb = Field(13, 2)
+    enrx = Field(15, 1, LANES, 42)
+    sleeprx = Field(16, 1, LANES, 42)
+    buswidth = Field(17, 3, LANES, 42)
+    rate = Field(20, 2, LANES, 42)
+    invpair = Field(22, 1, LANES, 42)
+    term = Field(23, 3, LANES, 42)
+    align = Field(26, 2, LANES, 42)
+    los = Field(28, 3, LANES, 42)
+    cdr = Field(31, 3, LANES, 42)
+    eq = Field(34, 3, LANES, 42)
+    eqhld = Field(37, 1, LANES, 42)
+    enoc = Field(38, 1, LANES, 42)
+    loopback = Field(39, 2, LANES, 42)
+    bsinrxp = Field(41, 1, LANES, 42)
+    bsinrxn = Field(42, 1, LANES, 42)
+    reserved1 = Field(43, 1, LANES, 42)
+    testpatt = Field(44, 3, LANES, 42)
+    testfail = Field(47, 1, LANES, 42)
+    losdtct_rl = Field(48, 1, LANES, 42)
+    bsrxp = Field(49, 1, LANES, 42)
+    bsrxn = Field(50, 1, LANES, 42)
+    ocip = Field(51, 1, LANES, 42)
+    eqover = Field(52, 1, LANES, 42)
+    equnder = Field(53, 1, LANES, 42)
+    losdtct_st = Field(54, 1, LANES, 42)
+    sync = Field(55, 1, LANES, 42)
+    clkbyp = Field(183, 2)
+    sleeppll = Field(185, 1)
+    reserved2 = Field(186, 1)
+    lock = Field(187, 1)
+    bsinitclk = Field(188, 1)
+    enbstx = Field(189, 1)
+    enbsrx = Field(190, 1)
+    enbspt = Field(191, 1)
+    reserved3 = Field(192, 1)
+    nearlock = Field(193, 1)
+    unlock = Field(194, 1)
+    cfg_ovr = Field(195, 1)
 
     def __init__(self,
                  enpll=False,
@@ -186,56 +310,58 @@ class ws_core:
                  nearlock=False,
                  unlock=False,
                  cfg_ovr=False):
-        self.enpll = format_field(enpll, 1)
-        self.mpy = format_field(int(mpy * 4), 8)
-        self.vrange = format_field(vrange, 1)
-        self.endivclk = format_field(endivclk, 1)
-        self.lb = format_field(lb, 2)
-        self.enrx = format_field(enrx, 1)
-        self.sleeprx = format_field(sleeprx, 1)
-        self.buswidth = format_field(buswidth, 3)
-        self.rate = format_field(rate, 2)
-        self.invpair = format_field(invpair, 1)
-        self.term = format_field(term, 3)
-        self.align = format_field(align, 2)
-        self.los = format_field(los, 3)
-        self.cdr = format_field(cdr, 3)
-        self.eq = format_field(eq, 3)
-        self.eqhld = format_field(eqhld, 1)
-        self.enoc = format_field(enoc, 1)
-        self.loopback = format_field(loopback, 2)
-        self.bsinrxp = format_field(bsinrxp, 1)
-        self.bsinrxn = format_field(bsinrxn, 1)
-        self.reserved1 = format_field(False, 1)
-        self.testpatt = format_field(testpatt.value, 3)
-        self.testfail = format_field(testfail, 1)
-        self.losdtct_rl = format_field(losdtct_rl, 1)
-        self.bsrxp = format_field(bsrxp, 1)
-        self.bsrxn = format_field(bsrxn, 1)
-        self.ocip = format_field(ocip, 1)
-        self.eqover = format_field(eqover, 1)
-        self.equnder = format_field(equnder, 1)
-        self.losdtct_st = format_field(losdtct_st, 1)
-        self.sync = format_field(sync, 1)
-        self.clkbyp = format_field(clkbyp, 2)
-        self.sleeppll = format_field(sleeppll, 1)
-        self.reserved2 = format_field(False, 1)
-        self.lock = format_field(lock, 1)
-        self.bsinitclk = format_field(bsinitclk, 1)
-        self.enbstx = format_field(enbstx, 1)
-        self.enbsrx = format_field(enbsrx, 1)
-        self.enbspt = format_field(enbspt, 1)
-        self.reserved3 = format_field(False, 1)
-        self.nearlock = format_field(nearlock, 1)
-        self.unlock = format_field(unlock, 1)
-        self.cfg_ovr = format_field(cfg_ovr, 1)
-
-    def to_binary(self):
-        body = (self.enrx + self.sleeprx + self.buswidth + self.rate +
-                self.invpair + self.term + self.align + self.los + self.cdr +
-                self.eq + self.eqhld + self.enoc + self.loopback +
-                self.bsinrxp + self.bsinrxn + self.reserved1 + self.testpatt +
-                self.testfail + self.losdtct_rl + self.bsrxp + self.bsrxn +
-                self.ocip + self.eqover + self.equnder + self.losdtct_st +
-                self.sync + "0") * 4
-        return "0" + "0" + self.enpll + self.mpy + self.vrange + self.endivclk + self.lb + body + self.clkbyp + self.sleeppll + self.reserved2 + self.lock + self.bsinitclk + self.enbstx + self.enbsrx + self.enbspt + self.reserved3 + self.nearlock + self.unlock + self.cfg_ovr + "0"
+        super().__init__(enpll=enpll,
+                         mpy=int(mpy * 4),
+                         vrange=vrange,
+                         endivclk=endivclk,
+                         lb=lb,
+                         enrx=enrx,
+                         sleeprx=sleeprx,
+                         buswidth=buswidth,
+                         rate=rate,
+                         invpair=invpair,
+                         term=term,
+                         align=align,
+                         los=los,
+                         cdr=cdr,
+                         eq=eq,
+                         eqhld=eqhld,
+                         enoc=enoc,
+                         loopback=loopback,
+                         bsinrxp=bsinrxp,
+                         bsinrxn=bsinrxn,
+                         testpatt=testpatt.value,
+                         testfail=testfail,
+                         losdtct_rl=losdtct_rl,
+                         bsrxp=bsrxp,
+                         bsrxn=bsrxn,
+                         ocip=ocip,
+                         eqover=eqover,
+                         equnder=equnder,
+                         losdtct_st=losdtct_st,
+                         sync=sync,
+                         clkbyp=clkbyp,
+                         sleeppll=sleeppll,
+                         lock=lock,
+                         bsinitclk=bsinitclk,
+                         enbstx=enbstx,
+                         enbsrx=enbsrx,
+                         enbspt=enbspt,
+                         nearlock=nearlock,
+                         unlock=unlock,
+                         cfg_ovr=cfg_ovr)
+
+
+@dataclass(frozen=True)
+class ReceiverSettings:
+    # ws_core and ws_tuning fields of a receiver block that shape its eye,
+    # written to all of its lanes
+    term: int = 1
+    cdr: int = 0
+    eq: int = 1
+    encor: bool = True
+    eqzero: int = 0
+    eqz_ovr: bool = False
+    eqlevel: int = 0
+    eq_ovr: bool = False
+    eqboost: int = 0
@@ -0,0 +1,215 @@
+import bisect
+import contextlib
+import functools
+import json
+import os
+import pathlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+# Opt-in profiling of the scan. Functions decorated with profiled() and the
+# JTAG engine returned by profile_jtag() record their operation counts, TCK
+# bits, bytes and latencies into the active Profiler. Without one, profiled()
+# costs a single check per call and profile_jtag() returns the engine as is.
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (1E-5, 1E-4, 1E-3, 1E-2, 1E-1, 1, 10)
+# Seconds between exports while the scan runs
+EXPORT_INTERVAL = 5
+
+_profiler = None
+
+
+@dataclass
+class OperationStatistics:
+    count: int = 0
+    bits: int = 0
+    bytes: int = 0
+    seconds: float = 0
+    # Samples per LATENCY_BUCKETS bucket, the last one is +Inf
+    buckets: list[int] = field(
+        default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+
+
+class Profiler:
+
+    def __init__(self):
+        self.operations = {}
+        self.lock = threading.Lock()
+
+    def record(self,
+               operation: str,
+               seconds: float,
+               bits: int = 0,
+               size: int = 0):
+        with self.lock:
+            statistics = self.operations.setdefault(operation,
+                                                    OperationStatistics())
+            statistics.count += 1
+            statistics.bits += bits
+            statistics.bytes += size
+            statistics.seconds += seconds
+            statistics.buckets[bisect.bisect_left(LATENCY_BUCKETS,
+                                                  seconds)] += 1
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                operation: {
+                    "count":
+                    statistics.count,
+                    "bits":
+                    statistics.bits,
+                    "bytes":
+                    statistics.bytes,
+                    "seconds":
+                    statistics.seconds,
+                    "buckets":
+                    dict(
+                        zip([*map(str, LATENCY_BUCKETS), "+Inf"],
+                            statistics.buckets)),
+                }
+                for operation, statistics in sorted(self.operations.items())
+            }
+
+    def to_prometheus(self) -> str:
+        lines = []
+        operations = self.to_dict()
+        for metric, key, help_text in (
+            ("eyescan_operations_total", "count", "Operations performed"),
+            ("eyescan_tck_bits_total", "bits", "TCK bits shifted"),
+            ("eyescan_bytes_total", "bytes", "Bytes transferred over USB"),
+        ):
+            lines += [
+                f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"
+            ]
+            lines += [
+                f'{metric}{{operation="{operation}"}} {statistics[key]}'
+                for operation, statistics in operations.items()
+            ]
+        metric = "eyescan_operation_seconds"
+        lines += [
+            f"# HELP {metric} Operation latency", f"# TYPE {metric} histogram"
+        ]
+        for operation, statistics in operations.items():
+            total = 0
+            for bound, count in statistics["buckets"].items():
+                total += count
+                lines.append(f'{metric}_bucket{{operation="{operation}",'
+                             f'le="{bound}"}} {total}')
+            lines += [
+                f'{metric}_sum{{operation="{operation}"}} '
+                f'{statistics["seconds"]}',
+                f'{metric}_count{{operation="{operation}"}} '
+                f'{statistics["count"]}'
+            ]
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: pathlib.Path):
+        # Prometheus textfile for a .prom suffix, JSON otherwise. The file is
+        # replaced atomically so that collectors never see a partial one.
+        if path.suffix == ".prom":
+            data = self.to_prometheus()
+        else:
+            data = json.dumps(self.to_dict(), indent=2)
+        temporary = path.with_name(f"{path.name}.tmp")
+        temporary.write_text(data)
+        os.replace(temporary, path)
+
+
+def profiled(operation: str,
+             bits: Callable[..., int] | None = None,
+             size: Callable[..., int] | None = None):
+    # bits and size get the arguments of the decorated function
+    def decorator(function):
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler
+            if profiler is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.record(operation,
+                                time.perf_counter() - start,
+                                bits(*args, **kwargs) if bits else 0,
+                                size(*args, **kwargs) if size else 0)
+
+        return wrapper
+
+    return decorator
+
+
+class ProfiledJtag:
+    """Passes everything through to the JtagEngine, timing IR writes and DR
+    shifts. MPSSE batches bypass it and are profiled by their transfers."""
+
+    def __init__(self, jtag, profiler: Profiler):
+        self.jtag = jtag
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self.jtag, name)
+
+    def write_ir(self, instruction):
+        start = time.perf_counter()
+        self.jtag.write_ir(instruction)
+        self.profiler.record("jtag_write_ir",
+                             time.perf_counter() - start, len(instruction))
+
+    def shift_and_update_register(self, data):
+        start = time.perf_counter()
+        readback = self.jtag.shift_and_update_register(data)
+        self.profiler.record("jtag_shift_dr",
+                             time.perf_counter() - start, len(data))
+        return readback
+
+
+def profile_jtag(jtag):
+    return jtag if _profiler is None else ProfiledJtag(jtag, _profiler)
+
+
+@contextlib.contextmanager
+def recording(profiler: Profiler):
+    # Makes profiler the active one while the block runs, the one active
+    # before, e.g. of --profile around a dry run, is active again after it
+    global _profiler
+    previous = _profiler
+    _profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _profiler = previous
+
+
+@contextlib.contextmanager
+def profiling(paths: tuple[pathlib.Path, ...]):
+    # Activates a Profiler exported to every path while the block runs and
+    # once more at its end, does nothing without paths
+    if not paths:
+        yield None
+        return
+    profiler = Profiler()
+    stop = threading.Event()
+
+    def export():
+        while not stop.wait(EXPORT_INTERVAL):
+            for path in paths:
+                profiler.export(path)
+
+    thread = threading.Thread(target=export,
+                              name="eyescan-profiler",
+                              daemon=True)
+    thread.start()
+    try:
+        with recording(profiler):
+            yield profiler
+    finally:
+        stop.set()
+        thread.join()
+        for path in paths:
+            profiler.export(path)
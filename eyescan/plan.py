@@ -0,0 +1,236 @@
+import dataclasses
+import json
+import pathlib
+import tempfile
+from dataclasses import dataclass
+from typing import Callable, TextIO
+from instructions import LANES
+from instrumentation import Profiler, recording
+from results import ScanGrid, WriterStatistics
+from simulator import SimulatedJtagEngine
+
+# Scan plans. A plan lists the voltages, phases and bit selects of a scan,
+# its receiver blocks, lanes and devices, and whether its (voltage, bit) rows
+# go voltage or bit major. The phases of a row are measured in one batch.
+# Voltages and phases are scanned from the highest to the lowest, like the
+# sweep grid, a center_first plan starts with the rows of the voltage closest
+# to 0, which tell open lanes from dead ones. A dry run scans the plan on a
+# simulated chain to predict its JTAG traffic and duration.
+
+VOLTAGES = range(-32, 32)
+PHASES = range(-16, 16)
+BITS = range(32)
+ORDERS = ("voltage", "bit")
+# Operations that spend host and USB latency on top of their TCK cycles
+TIMED_OPERATIONS = ("jtag_write_ir", "jtag_shift_dr", "usb_transfer")
+# Latencies of the operations missing from the profile, in seconds
+DEFAULT_LATENCIES = {
+    "jtag_write_ir": 2E-4,
+    "jtag_shift_dr": 1E-3,
+    "usb_transfer": 1E-3,
+}
+
+
+@dataclass(frozen=True)
+class ScanPlan:
+    voltages: tuple[int, ...]
+    phases: tuple[int, ...]
+    bits: tuple[int, ...]
+    receiver_blocks: tuple[int, ...] = (0, 1)
+    lanes: tuple[int, ...] = tuple(range(2 * LANES))
+    # None scans every device the readout reads
+    devices: tuple[int, ...] | None = None
+    order: str = "voltage"
+    center_first: bool = False
+
+    def __post_init__(self):
+        for name, values, allowed in (
+            ("voltages", self.voltages, VOLTAGES),
+            ("phases", self.phases, PHASES),
+            ("bits", self.bits, BITS),
+            ("receiver_blocks", self.receiver_blocks, range(2)),
+            ("lanes", self.lanes, range(2 * LANES)),
+        ):
+            if not values:
+                raise ValueError(f"Scan plan has no {name}")
+            if not all(value in allowed for value in values):
+                raise ValueError(
+                    f"Scan plan {name} have to be between {allowed[0]} and "
+                    f"{allowed[-1]}")
+            if len(set(values)) != len(values):
+                raise ValueError(f"Scan plan has duplicate {name}")
+        for name, values in (("voltages", self.voltages), ("phases",
+                                                           self.phases)):
+            if list(values) != sorted(values, reverse=True):
+                raise ValueError(
+                    f"Scan plan {name} have to be in descending order")
+        for receiver_block in self.receiver_blocks:
+            if not any(lane // LANES == receiver_block for lane in self.lanes):
+                raise ValueError(
+                    f"Scan plan has no lanes of receiver block {receiver_block}"
+                )
+        if self.devices is not None and (not self.devices
+                                         or min(self.devices) < 1):
+            raise ValueError("Scan plan devices start at 1")
+        if self.order not in ORDERS:
+            raise ValueError(f"Scan plan order has to be one of {ORDERS}")
+        if not isinstance(self.center_first, bool):
+            raise ValueError("Scan plan center_first has to be true or false")
+
+    @classmethod
+    def sweep(cls, bit_number: int, voltage_increment: int,
+              phase_increment: int) -> 'ScanPlan':
+        return cls(tuple(range(31, -33, -1 * voltage_increment)),
+                   tuple(range(15, -17, -1 * phase_increment)),
+                   tuple(range(bit_number)))
+
+    @classmethod
+    def from_dict(cls,
+                  plan: dict,
+                  base: 'ScanPlan | None' = None) -> 'ScanPlan':
+        # Sets are lists or {"start", "stop", "step"} ranges, in any order.
+        # Fields missing from plan are taken from base.
+        names = {field.name for field in dataclasses.fields(cls)}
+        unknown = set(plan) - names
+        if unknown:
+            raise ValueError(
+                f"Unknown scan plan fields: {', '.join(sorted(unknown))}")
+        fields = {}
+        for name, values in plan.items():
+            if name in ("order", "center_first") or values is None:
+                fields[name] = values
+                continue
+            if isinstance(values, dict):
+                values = range(values["start"], values["stop"],
+                               values.get("step", 1))
+            fields[name] = tuple(
+                sorted(set(values), reverse=name in ("voltages", "phases")))
+        if base is None:
+            return cls(**fields)
+        return dataclasses.replace(base, **fields)
+
+    @classmethod
+    def load(cls,
+             path: str | pathlib.Path,
+             base: 'ScanPlan | None' = None) -> 'ScanPlan':
+        with open(path) as file:
+            return cls.from_dict(json.load(file), base)
+
+    def rows(self) -> list[tuple[int, int]]:
+        # (voltage, bit) rows in scan order
+        if self.order == "bit":
+            rows = [(voltage, bit) for bit in self.bits
+                    for voltage in self.voltages]
+        else:
+            rows = [(voltage, bit) for voltage in self.voltages
+                    for bit in self.bits]
+        if self.center_first:
+            center = min(self.voltages, key=abs)
+            rows.sort(key=lambda row: row[0] != center)
+        return rows
+
+    def select_devices(self, devices: list[int]) -> tuple[int, ...]:
+        # The devices of a readout that the plan keeps
+        selected = tuple(device for device in devices
+                         if self.devices is None or device in self.devices)
+        if not selected:
+            raise ValueError("None of the scanned devices is in the scan plan")
+        return selected
+
+    def grid(self, devices: tuple[int, ...]) -> ScanGrid:
+        # Lanes and bits left out of the plan stay unwritten in binary output
+        return ScanGrid(devices, 2 * LANES,
+                        max(self.bits) + 1, self.voltages, self.phases)
+
+    def select(self, readout, devices: tuple[int, ...]):
+        # Drops the samples of lanes and devices left out of the plan
+        lanes = set(self.lanes)
+        devices = set(devices)
+        return (sample for sample in readout
+                if sample[1] in lanes and sample[0] in devices)
+
+
+@dataclass
+class ScanEstimate:
+    samples: int
+    ir_writes: int
+    dr_shifts: int
+    tck_cycles: int
+    usb_round_trips: int
+    # TCK cycles and dwell windows at the scan frequency
+    bus_seconds: float
+    latency_seconds: float
+
+    @property
+    def seconds(self) -> float:
+        return self.bus_seconds + self.latency_seconds
+
+
+def operation_latencies(profile: dict | None,
+                        frequency: float) -> dict[str, float]:
+    # Mean host and USB latency of every timed operation in the --profile
+    # JSON of an earlier scan at the same frequency, without the time its
+    # TCK cycles took
+    latencies = dict(DEFAULT_LATENCIES)
+    for operation, statistics in (profile or {}).items():
+        if operation in TIMED_OPERATIONS and statistics["count"]:
+            latencies[operation] = max(
+                (statistics["seconds"] - statistics["bits"] / frequency) /
+                statistics["count"], 0)
+    return latencies
+
+
+def estimate_scan(perform_eyescan_func: Callable[..., WriterStatistics],
+                  latencies: dict[str, float], pyftdi_url: str,
+                  ftdi_jtag_frequency: float, daisy_chain_device_count: int,
+                  **kwargs) -> ScanEstimate:
+    # Runs the scan on a simulated chain that keeps time without sleeping.
+    # Its TCK cycles and dwell windows are exact for the plan, the dwell
+    # policy and adaptive scans follow the synthetic eyes of the simulator.
+    # Receiver settings do not change the traffic, the simulated adapter has
+    # no tuned ones.
+    engines = []
+
+    def jtag_factory(**settings) -> SimulatedJtagEngine:
+        engines.append(
+            SimulatedJtagEngine(device_count=daisy_chain_device_count,
+                                realtime=False,
+                                **settings))
+        return engines[-1]
+
+    profiler = Profiler()
+    with tempfile.TemporaryDirectory() as directory, recording(profiler):
+        statistics = perform_eyescan_func(
+            pyftdi_url=pyftdi_url,
+            ftdi_jtag_frequency=ftdi_jtag_frequency,
+            daisy_chain_device_count=daisy_chain_device_count,
+            output_path=pathlib.Path(directory) / "dry-run",
+            jtag_factory=jtag_factory,
+            **kwargs | dict(stream=False, resume=False, tuned=False))
+    operations = profiler.to_dict()
+    simulated = engines[0].statistics
+    return ScanEstimate(
+        statistics.samples, simulated.ir_shifts, simulated.dr_shifts,
+        simulated.tck_cycles, simulated.usb_round_trips, simulated.bus_time,
+        sum(operations[operation]["count"] * latencies[operation]
+            for operation in TIMED_OPERATIONS if operation in operations))
+
+
+def report_estimate(plan: ScanPlan, estimate: ScanEstimate, file: TextIO):
+    print(
+        f"Scan plan: {len(plan.voltages)} voltages, {len(plan.phases)} "
+        f"phases, {len(plan.bits)} bits, {len(plan.lanes)} lanes, receiver "
+        f"blocks {', '.join(map(str, plan.receiver_blocks))}, "
+        f"{plan.order} major{', center first' if plan.center_first else ''}",
+        file=file)
+    print(
+        f"JTAG traffic: {estimate.ir_writes} IR writes, {estimate.dr_shifts} "
+        f"DR shifts, {estimate.tck_cycles} TCK cycles, "
+        f"{estimate.usb_round_trips} USB round trips",
+        file=file)
+    print(
+        f"Estimated scan time: {estimate.seconds:.1f} s "
+        f"({estimate.bus_seconds:.1f} s TCK and dwell, "
+        f"{estimate.latency_seconds:.1f} s operation latency) for "
+        f"{estimate.samples} samples",
+        file=file)
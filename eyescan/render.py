@@ -0,0 +1,311 @@
+import argparse
+import concurrent.futures
+import datetime
+import html
+import os
+import pathlib
+import struct
+import sys
+import time
+import zlib
+import numpy
+from analysis import load_scans, result_files
+from archive import INDEX_NAME, open_archive, store_path
+from instructions import ws_char
+from plan import PHASES, VOLTAGES
+from results import ScanGrid, replace_file
+
+# Eye diagram rendering. Every (device, lane) is drawn as a voltage x phase
+# heatmap of the worst error count over its bits, on a log scale, from open
+# (dark) to saturated (bright). Points not measured yet are gray. A lane is
+# dead once the point closest to voltage 0 and phase 0 is measured and none of
+# its points is without errors. Rendered scans measure the rows through the
+# center first, before that a lane has no open point yet without being dead.
+# The renderer sink of a scan updates its heatmaps with every batch of samples
+# and writes a snapshot at most every RENDER_INTERVAL seconds, the batch report
+# renders result files or an eyescan-archive in worker processes.
+
+RENDER_INTERVAL = 5
+ECOUNT_MAX = ws_char.ecount.mask
+# Pixels per grid point and between tiles
+POINT_SIZE = 4
+TILE_SPACING = 2
+UNMEASURED_COLOR = (128, 128, 128)
+BACKGROUND_COLOR = (255, 255, 255)
+# (position, RGB) stops of the colormap
+COLOR_STOPS = ((0, (13, 8, 135)), (0.33, (156, 23, 158)),
+               (0.66, (237, 121, 83)), (1, (240, 249, 33)))
+SNAPSHOT_IMAGE = "eye.png"
+SNAPSHOT_PAGE = "index.html"
+
+
+def lookup_table(values: tuple[int, ...], lowest: int) -> numpy.ndarray:
+    # Grid index of every value from lowest up
+    table = numpy.full(max(values) - lowest + 1, -1)
+    table[numpy.asarray(values) - lowest] = numpy.arange(len(values))
+    return table
+
+
+def colorize(ecount: numpy.ndarray) -> numpy.ndarray:
+    # RGB of every error count, NaN for points not measured
+    position = numpy.log1p(numpy.clip(numpy.nan_to_num(ecount), 0,
+                                      ECOUNT_MAX)) / numpy.log1p(ECOUNT_MAX)
+    stops, colors = zip(*COLOR_STOPS)
+    rgb = numpy.stack(
+        [numpy.interp(position, stops, channel) for channel in zip(*colors)],
+        axis=-1)
+    rgb[numpy.isnan(ecount)] = UNMEASURED_COLOR
+    return rgb.round().astype(numpy.uint8)
+
+
+def mosaic(heatmaps: numpy.ndarray) -> numpy.ndarray:
+    # heatmaps are (device, lane, voltage, phase) with voltages and phases in
+    # descending order, tiles go left to right by lane and top to bottom by
+    # device with the phase rising to the right
+    devices, lanes, voltages, phases = heatmaps.shape
+    tiles = colorize(heatmaps[..., ::-1]).repeat(POINT_SIZE,
+                                                 axis=2).repeat(POINT_SIZE,
+                                                                axis=3)
+    height, width = voltages * POINT_SIZE, phases * POINT_SIZE
+    image = numpy.empty((TILE_SPACING + devices * (height + TILE_SPACING),
+                         TILE_SPACING + lanes * (width + TILE_SPACING), 3),
+                        numpy.uint8)
+    image[...] = BACKGROUND_COLOR
+    for device in range(devices):
+        for lane in range(lanes):
+            top = TILE_SPACING + device * (height + TILE_SPACING)
+            left = TILE_SPACING + lane * (width + TILE_SPACING)
+            image[top:top + height, left:left + width] = tiles[device, lane]
+    return image
+
+
+def encode_png(image: numpy.ndarray) -> bytes:
+    # 8-bit RGB without filtering
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (struct.pack(">I", len(data)) + kind + data +
+                struct.pack(">I", zlib.crc32(kind + data)))
+
+    height, width, _ = image.shape
+    rows = numpy.concatenate((numpy.zeros(
+        (height, 1), numpy.uint8), image.reshape(height, -1)),
+                             axis=1)
+    return (
+        b"\x89PNG\r\n\x1a\n" +
+        chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) +
+        chunk(b"IDAT", zlib.compress(rows.tobytes())) + chunk(b"IEND", b""))
+
+
+def eye_center(voltages, phases) -> tuple[int, int]:
+    # Grid index of the point closest to voltage 0 and phase 0
+    return (int(numpy.abs(numpy.asarray(voltages)).argmin()),
+            int(numpy.abs(numpy.asarray(phases)).argmin()))
+
+
+def lane_status(heatmaps: numpy.ndarray,
+                center: tuple[int, int]) -> tuple[numpy.ndarray, ...]:
+    # Measured and error-free points of every (device, lane), and whether it
+    # is dead
+    measured = (~numpy.isnan(heatmaps)).sum(axis=(-2, -1))
+    error_free = (heatmaps == 0).sum(axis=(-2, -1))
+    center_measured = ~numpy.isnan(heatmaps[..., center[0], center[1]])
+    return measured, error_free, center_measured & (error_free == 0)
+
+
+def status_table(devices: list[int], heatmaps: numpy.ndarray,
+                 center: tuple[int, int]) -> str:
+    measured, error_free, dead = lane_status(heatmaps, center)
+    rows = [
+        "<tr><th>device</th><th>lane</th><th>measured</th>"
+        "<th>error-free</th><th>status</th></tr>"
+    ]
+    for index in numpy.ndindex(measured.shape):
+        if dead[index]:
+            status = "dead"
+        elif error_free[index]:
+            status = "open"
+        elif measured[index]:
+            status = "no open point yet"
+        else:
+            status = "not measured"
+        rows.append(f"<tr><td>{devices[index[0]]}</td><td>{index[1]}</td>"
+                    f"<td>{measured[index]}</td><td>{error_free[index]}</td>"
+                    f"<td>{status}</td></tr>")
+    return f"<table>{''.join(rows)}</table>"
+
+
+def dead_lanes(devices: list[int], heatmaps: numpy.ndarray,
+               center: tuple[int, int]) -> list[str]:
+    dead = lane_status(heatmaps, center)[2]
+    return [
+        f"device {devices[device]} lane {lane}"
+        for device, lane in zip(*numpy.nonzero(dead))
+    ]
+
+
+def dead_paragraph(dead: list[str]) -> str:
+    if not dead:
+        return ""
+    return f"<p><b>Dead: {html.escape(', '.join(dead))}</b></p>"
+
+
+def page(title: str, body: str, refresh: int | None = None) -> str:
+    meta = (f'<meta http-equiv="refresh" content="{refresh}">'
+            if refresh is not None else "")
+    return (f'<!DOCTYPE html>\n<html><head><meta charset="utf-8">{meta}'
+            f"<title>{html.escape(title)}</title></head><body>"
+            f"<h1>{html.escape(title)}</h1>{body}</body></html>\n")
+
+
+class EyeRenderer:
+    """Sink of a BackgroundWriter that keeps the heatmaps of every lane
+    updated and writes snapshots of them to a directory."""
+
+    def __init__(self,
+                 directory: str | pathlib.Path,
+                 grid: ScanGrid,
+                 title: str,
+                 interval: float = RENDER_INTERVAL):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.devices = list(grid.devices)
+        self.title = title
+        self.interval = interval
+        self.heatmaps = numpy.full((len(
+            grid.devices), grid.lanes, len(grid.voltages), len(grid.phases)),
+                                   numpy.nan)
+        self.center = eye_center(grid.voltages, grid.phases)
+        self.lookups = (lookup_table(grid.devices, 0),
+                        lookup_table(grid.voltages, VOLTAGES[0]),
+                        lookup_table(grid.phases, PHASES[0]))
+        self.samples = 0
+        self.rendered = time.monotonic()
+
+    def write_batch(self, samples: list[tuple]):
+        data = numpy.array([sample[:6] for sample in samples], numpy.int64)
+        devices, voltages, phases = self.lookups
+        index = (devices[data[:,
+                              0]], data[:,
+                                        1], voltages[data[:, 3] - VOLTAGES[0]],
+                 phases[data[:, 4] - PHASES[0]])
+        numpy.fmax.at(self.heatmaps, index, data[:, 5])
+        self.samples += len(samples)
+        if time.monotonic() - self.rendered >= self.interval:
+            self.render()
+
+    def render(self):
+        self.rendered = time.monotonic()
+        (self.directory / f"{SNAPSHOT_IMAGE}.tmp").write_bytes(
+            encode_png(mosaic(self.heatmaps)))
+        os.replace(self.directory / f"{SNAPSHOT_IMAGE}.tmp",
+                   self.directory / SNAPSHOT_IMAGE)
+        dead = dead_lanes(self.devices, self.heatmaps, self.center)
+        body = (f"<p>{self.samples} samples, updated "
+                f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S}</p>" +
+                dead_paragraph(dead) + f'<img src="{SNAPSHOT_IMAGE}">' +
+                status_table(self.devices, self.heatmaps, self.center))
+        replace_file(self.directory / SNAPSHOT_PAGE,
+                     page(self.title, body, max(1, round(self.interval))))
+
+    def flush(self):
+        pass
+
+    def sync(self):
+        pass
+
+    def close(self):
+        self.render()
+
+
+def render_scan(path: pathlib.Path) -> list[tuple[str, bytes, list[str]]]:
+    # Tag, PNG and dead lanes of every scan of the file
+    rendered = []
+    for tag, data in load_scans(path).items():
+        # Worst error count over the bits, points without any measured bit
+        # stay NaN
+        heatmaps = numpy.fmax.reduce(data.ecount, axis=2)
+        rendered.append((tag, encode_png(mosaic(heatmaps)),
+                         dead_lanes(data.devices.tolist(), heatmaps,
+                                    eye_center(data.voltages, data.phases))))
+    return rendered
+
+
+def report_scans(paths: list[pathlib.Path]) -> list[tuple[pathlib.Path, str]]:
+    # (result file, title) of every scan, the scans of an eyescan-archive
+    # directory oldest first
+    scans = []
+    for path in paths:
+        if not (path / INDEX_NAME).exists():
+            scans += [(file, str(file)) for file in result_files([path])]
+            continue
+        connection = open_archive(path)
+        try:
+            for row in connection.execute(
+                    "SELECT id, source, tag, test_pattern, "
+                    "timestamp FROM scans ORDER BY timestamp, id"):
+                time_text = datetime.datetime.fromtimestamp(
+                    row["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
+                title = " ".join(
+                    filter(None, (row["source"], row["tag"],
+                                  row["test_pattern"], time_text)))
+                scans.append((store_path(path, row["id"]), title))
+        finally:
+            connection.close()
+    return scans
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog='eyescan-render',
+        description='TI DAC Eyescan report',
+        epilog=
+        'Renders the eye diagrams of every lane of eyescan result files to an HTML report'
+    )
+    parser.add_argument(
+        'paths',
+        type=pathlib.Path,
+        nargs='+',
+        help="result files, directories of them or eyescan-archive directories"
+    )
+    parser.add_argument('-o',
+                        '--output',
+                        type=pathlib.Path,
+                        required=True,
+                        help="report directory")
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help="number of worker processes")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    scans = report_scans(args.paths)
+    args.output.mkdir(parents=True, exist_ok=True)
+    sections = []
+    failed = False
+    with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+        futures = [executor.submit(render_scan, path) for path, _ in scans]
+        for index, ((path, title), future) in enumerate(zip(scans, futures)):
+            try:
+                rendered = future.result()
+            except Exception as error:
+                print(f"Could not render {path}: {error}", file=sys.stderr)
+                failed = True
+                continue
+            for tag_index, (tag, image, dead) in enumerate(rendered):
+                name = f"scan-{index}-{tag_index}.png"
+                (args.output / name).write_bytes(image)
+                sections.append(
+                    f"<h2>{html.escape(' '.join(filter(None, (title, tag))))}"
+                    "</h2>" + dead_paragraph(dead) + f'<img src="{name}">')
+    replace_file(args.output / SNAPSHOT_PAGE,
+                 page("Eyescan report", "".join(sections)))
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+import functools
+import json
+import mmap
+import os
+import pathlib
+import queue
+import struct
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import TextIO
+from instructions import LANES
+from instrumentation import profiled
+
+# Result files. TSV has one line per sample. The binary format is a JSON
+# header followed by one fixed-width record per point of the sweep grid in
+# (device, lane, bit, voltage, phase) order, so it can be mapped as a dense
+# array, e.g. with numpy.memmap. Records are written in place while the scan
+# runs, the ones not written yet have no FLAG_WRITTEN.
+#
+# Samples reach the writers through BackgroundWriter, so a slow output path
+# does not stretch the readout loop until its queue fills up.
+#
+# The journal next to the output lists the (receiver block, device, voltage,
+# bit) slices whose samples are all synced to it, a resumed scan keeps only
+# those and measures the rest.
+
+OUTPUT_FORMATS = ("tsv", "binary")
+BINARY_MAGIC = b"EYESCAN\0"
+BINARY_VERSION = 1
+# Records start at a multiple of this offset
+BINARY_ALIGNMENT = 64
+HEADER_LENGTH = struct.Struct("<I")
+RECORD = struct.Struct("<BBBbbHfB")
+# numpy dtype of RECORD, dwell is in miliseconds
+RECORD_FIELDS = (("device", "u1"), ("lane", "u1"), ("bit", "u1"),
+                 ("voltage", "i1"), ("phase", "i1"), ("ecount", "<u2"),
+                 ("dwell", "<f4"), ("flags", "u1"))
+FLAG_WRITTEN = 1
+FLAG_INFERRED = 2
+# Records written between flushes of the mapped file
+FLUSH_RECORDS = 1 << 12
+# Batches queued for the writer thread before the scan has to wait
+WRITER_QUEUE_SIZE = 64
+WRITER_BATCH_SIZE = 1 << 10
+# Longest time a sample waits for its batch to fill up, in seconds
+WRITER_LATENCY = 0.1
+
+
+@dataclass(frozen=True)
+class ScanGrid:
+    devices: tuple[int, ...]
+    lanes: int
+    bits: int
+    voltages: tuple[int, ...]
+    phases: tuple[int, ...]
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return (len(self.devices), self.lanes, self.bits, len(self.voltages),
+                len(self.phases))
+
+    @property
+    def size(self) -> int:
+        return functools.reduce(lambda a, b: a * b, self.shape)
+
+    @functools.cached_property
+    def _indices(self) -> tuple[dict[int, int], ...]:
+        return tuple({
+            value: index
+            for index, value in enumerate(values)
+        } for values in (self.devices, self.voltages, self.phases))
+
+    def index(self, device: int, lane: int, bit: int, voltage: int,
+              phase: int) -> int:
+        devices, voltages, phases = self._indices
+        index = devices[device]
+        for value, size in ((lane, self.lanes), (bit, self.bits),
+                            (voltages[voltage], len(self.voltages)),
+                            (phases[phase], len(self.phases))):
+            index = index * size + value
+        return index
+
+
+def sample_slice(sample: tuple) -> tuple[int, int, int, int]:
+    device, lane, bit, voltage = sample[:4]
+    return lane // LANES, device, voltage, bit
+
+
+def replace_file(path: pathlib.Path, data: str):
+    # Replaces the file atomically, it has either the old or the new data
+    temporary = path.with_name(f"{path.name}.tmp")
+    with open(temporary, "w") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+class TsvWriter:
+
+    def __init__(self,
+                 path: str | pathlib.Path,
+                 completed: set[tuple[int, int, int, int]] | None = None):
+        # With completed, the samples of the completed slices are kept
+        path = pathlib.Path(path)
+        if completed is not None and path.exists():
+            with open(path) as file:
+                replace_file(
+                    path, "".join(
+                        line for line in file
+                        if line.endswith("\n") and sample_slice(
+                            tuple(map(int,
+                                      line.split("\t")[:4]))) in completed))
+        self.file = open(path, "w" if completed is None else "a")
+
+    def write(self, sample: tuple):
+        self.file.write("\t".join(map(str, sample)) + "\n")
+
+    def write_batch(self, samples: list[tuple]):
+        for sample in samples:
+            self.write(sample)
+
+    def flush(self):
+        self.file.flush()
+
+    def sync(self):
+        self.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TsvStream(TsvWriter):
+    """Writes TSV lines to an already open stream, e.g. stdout, and flushes
+    them after every batch."""
+
+    def __init__(self, stream: TextIO):
+        self.file = stream
+
+    def write_batch(self, samples: list[tuple]):
+        super().write_batch(samples)
+        self.flush()
+
+    def sync(self):
+        self.flush()
+
+    def close(self):
+        self.flush()
+
+
+class BinaryWriter(TsvWriter):
+
+    def __init__(self,
+                 path: str | pathlib.Path,
+                 grid: ScanGrid,
+                 dwell_time: float,
+                 resume: bool = False):
+        # A resumed scan overwrites the records of the slices it measures
+        path = pathlib.Path(path)
+        self.grid = grid
+        # Samples without a dwell column were all measured with dwell_time
+        self.dwell = dwell_time * 1000
+        header = json.dumps({
+            "version": BINARY_VERSION,
+            "grid": asdict(grid),
+            "record": RECORD_FIELDS,
+            "dwell_time": self.dwell,
+        }).encode()
+        prefix_length = len(BINARY_MAGIC) + HEADER_LENGTH.size
+        self.data_offset = -(-(prefix_length + len(header)) //
+                             BINARY_ALIGNMENT) * BINARY_ALIGNMENT
+        header = header.ljust(self.data_offset - prefix_length)
+        if resume and path.exists():
+            if read_header(path)[0]["grid"] != json.loads(
+                    json.dumps(asdict(grid))):
+                raise ValueError(f"{path} has a different sweep grid")
+            self.file = open(path, "r+b")
+        else:
+            self.file = open(path, "w+b")
+            self.file.write(BINARY_MAGIC + HEADER_LENGTH.pack(len(header)) +
+                            header)
+            self.file.truncate(self.data_offset + RECORD.size * grid.size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.pending = 0
+
+    def write(self, sample: tuple):
+        device, lane, bit, voltage, phase, ecount, *extra = sample
+        inferred, dwell = extra or (0, self.dwell)
+        RECORD.pack_into(
+            self.map, self.data_offset +
+            RECORD.size * self.grid.index(device, lane, bit, voltage, phase),
+            device, lane, bit, voltage, phase, ecount, dwell,
+            FLAG_WRITTEN | (FLAG_INFERRED if inferred else 0))
+        self.pending += 1
+        if self.pending >= FLUSH_RECORDS:
+            self.flush()
+
+    def flush(self):
+        self.map.flush()
+        self.pending = 0
+
+    def sync(self):
+        self.flush()
+
+    def close(self):
+        self.flush()
+        self.map.close()
+        self.file.close()
+
+
+class Journal:
+
+    def __init__(self, path: str | pathlib.Path | None, grid: ScanGrid,
+                 resume: bool):
+        # The first line is the sweep grid, a resumed journal has to match it.
+        # Without a path nothing is journaled.
+        self.grid = grid
+        self.completed = set()
+        self.resumed = False
+        self.file = None
+        self.path = None if path is None else pathlib.Path(path)
+        if path is None:
+            return
+        path = self.path
+        self.resumed = resume and path.exists()
+        header = json.dumps(asdict(grid))
+        if self.resumed:
+            with open(path) as file:
+                if file.readline().rstrip("\n") != header:
+                    raise ValueError(
+                        f"{path} belongs to a scan with a different sweep grid"
+                    )
+                # A line cut short by a crash is not a completed slice
+                self.completed = {
+                    tuple(map(int, line.split("\t")))
+                    for line in file if line.endswith("\n")
+                }
+        replace_file(
+            path, "".join(f"{line}\n" for line in [
+                header, *("\t".join(map(str, entry))
+                          for entry in sorted(self.completed))
+            ]))
+        self.file = open(path, "a")
+
+    def record(self, slices: set[tuple[int, int, int, int]]):
+        if self.file is None:
+            return
+        self.file.write("".join("\t".join(map(str, entry)) + "\n"
+                                for entry in sorted(slices)))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def rows(self, receiver_blocks: list[int]) -> frozenset[tuple[int, int]]:
+        # (voltage, bit) rows completed for every block and device
+        return frozenset(
+            (voltage, bit) for voltage in self.grid.voltages
+            for bit in range(self.grid.bits)
+            if all((receiver_block, device, voltage, bit) in self.completed
+                   for receiver_block in receiver_blocks
+                   for device in self.grid.devices))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def remove(self):
+        # A finished scan has nothing to resume
+        self.close()
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+
+
+def journal_path(
+        output_path: str | pathlib.Path | None) -> pathlib.Path | None:
+    if output_path is None:
+        return None
+    output_path = pathlib.Path(output_path)
+    return output_path.with_name(f"{output_path.name}.journal")
+
+
+@dataclass
+class WriterStatistics:
+    samples: int = 0
+    batches: int = 0
+    # Batches that found the queue full and the time the scan waited for them
+    stalls: int = 0
+    stall_seconds: float = 0
+    max_queue_depth: int = 0
+
+
+class BackgroundWriter:
+    """Collects samples into batches and writes them to every sink from a
+    separate thread. close() writes out everything queued, an error of a sink
+    is raised by the next write() or close()."""
+
+    def __init__(self,
+                 sinks: list[TsvWriter],
+                 journal: Journal | None = None,
+                 queue_size: int = WRITER_QUEUE_SIZE,
+                 batch_size: int = WRITER_BATCH_SIZE,
+                 latency: float = WRITER_LATENCY):
+        self.sinks = sinks
+        self.journal = journal
+        self.batch_size = batch_size
+        self.latency = latency
+        self.queue = queue.Queue(queue_size)
+        self.batch = []
+        self.batch_start = 0
+        self.statistics = WriterStatistics()
+        self.error = None
+        self.thread = threading.Thread(target=self._run,
+                                       name="eyescan-writer",
+                                       daemon=True)
+        self.thread.start()
+
+    def write(self, sample: tuple):
+        if self.error is not None:
+            raise self.error
+        now = time.monotonic()
+        if not self.batch:
+            self.batch_start = now
+        self.batch.append(sample)
+        if len(self.batch
+               ) >= self.batch_size or now - self.batch_start >= self.latency:
+            self._put()
+
+    def checkpoint(self, slices: set[tuple[int, int, int, int]]):
+        # The slices are journaled once the samples written so far are synced
+        if self.journal is None or not slices:
+            return
+        if self.batch:
+            self._put()
+        self.batch = frozenset(slices)
+        self._put()
+
+    def _put(self):
+        batch, self.batch = self.batch, []
+        try:
+            self.queue.put_nowait(batch)
+        except queue.Full:
+            self._wait_put(batch)
+        self.statistics.max_queue_depth = max(self.statistics.max_queue_depth,
+                                              self.queue.qsize())
+
+    @profiled("output_stall")
+    def _wait_put(self, batch: list[tuple] | frozenset):
+        start = time.perf_counter()
+        self.queue.put(batch)
+        self.statistics.stalls += 1
+        self.statistics.stall_seconds += time.perf_counter() - start
+
+    @profiled("output")
+    def _write_batch(self, batch: list[tuple]):
+        for sink in self.sinks:
+            sink.write_batch(batch)
+
+    @profiled("output_sync")
+    def _sync(self, slices: frozenset):
+        for sink in self.sinks:
+            sink.sync()
+        self.journal.record(slices)
+
+    def _run(self):
+        # Keeps draining the queue after an error so that write() never blocks
+        # Checkpoints come in as frozensets of slices
+        while (batch := self.queue.get()) is not None:
+            if self.error is not None:
+                continue
+            try:
+                if isinstance(batch, frozenset):
+                    self._sync(batch)
+                    continue
+                self._write_batch(batch)
+            except BaseException as error:
+                self.error = error
+                continue
+            self.statistics.samples += len(batch)
+            self.statistics.batches += 1
+
+    def close(self):
+        if self.batch:
+            self._put()
+        self.queue.put(None)
+        self.thread.join()
+        for sink in self.sinks:
+            sink.close()
+        if self.journal is not None:
+            self.journal.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_results(
+    output_path: str | pathlib.Path | None,
+    output_format: str,
+    grid: ScanGrid,
+    dwell_time: float,
+    streams: tuple[TextIO, ...] = (),
+    journal: Journal | None = None,
+    render: str | pathlib.Path | None = None,
+    sinks: tuple = ()
+) -> BackgroundWriter:
+    # Samples are also written as TSV to every stream, and to the extra sinks
+    # as they are. A resumed journal keeps the samples of its completed slices
+    # in the output, without output_path no output file is written. With
+    # render, eye diagram snapshots are written to that directory, which
+    # requires numpy.
+    resume = journal is not None and journal.resumed
+    writers = []
+    if output_path is not None and output_format == "binary":
+        writers.append(BinaryWriter(output_path, grid, dwell_time, resume))
+    elif output_path is not None:
+        writers.append(
+            TsvWriter(output_path, journal.completed if resume else None))
+    writers += [*map(TsvStream, streams), *sinks]
+    if render is not None:
+        from render import EyeRenderer
+        writers.append(
+            EyeRenderer(
+                render, grid, "eyescan"
+                if output_path is None else pathlib.Path(output_path).name))
+    return BackgroundWriter(writers, journal)
+
+
+def read_header(path: str | pathlib.Path) -> tuple[dict, int]:
+    # Returns the header of a binary result file and the offset of its records
+    with open(path, "rb") as file:
+        if file.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"{path} is not a binary eyescan result file")
+        (length, ) = HEADER_LENGTH.unpack(file.read(HEADER_LENGTH.size))
+        header = json.loads(file.read(length))
+    if header["version"] != BINARY_VERSION:
+        raise ValueError(
+            f"Unsupported binary eyescan result version {header['version']}")
+    return header, len(BINARY_MAGIC) + HEADER_LENGTH.size + length
+
+
+def load_results(path: str | pathlib.Path):
+    # Maps the records of a binary result file as a numpy array shaped like
+    # its (device, lane, bit, voltage, phase) grid, requires numpy
+    import numpy
+    header, offset = read_header(path)
+    grid = ScanGrid(**header["grid"])
+    return header, numpy.memmap(
+        path,
+        dtype=numpy.dtype([tuple(field) for field in header["record"]]),
+        mode="r",
+        offset=offset,
+        shape=grid.shape)
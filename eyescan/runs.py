@@ -0,0 +1,113 @@
+import json
+import pathlib
+from dataclasses import dataclass
+from typing import TextIO
+from instructions import TestPattern
+from plan import ScanPlan
+
+# Scan runs. A session scans the same chain several times in a row, e.g.
+# with every PRBS test pattern, on one JTAG session: the chain is reset and
+# configured once, and between runs only the registers whose values change
+# are written again, usually just ws_core for testpatt. The samples of all
+# runs go to one output with the label of their run as the first column,
+# after a header line per run with its label, test pattern and dwell time.
+
+RUN_FIELDS = ("label", "test_pattern", "dwell_time", "plan", "tuned")
+RUN_HEADER = "# run"
+
+
+@dataclass(frozen=True)
+class ScanRun:
+    label: str
+    test_pattern: TestPattern
+    # None keeps the option of the session
+    dwell_time: float | None = None
+    plan: ScanPlan | None = None
+    tuned: bool | None = None
+
+    def options(self) -> dict:
+        # The perform function arguments the run overrides
+        options = dict(test_pattern=self.test_pattern)
+        for name in ("dwell_time", "plan", "tuned"):
+            if getattr(self, name) is not None:
+                options[name] = getattr(self, name)
+        return options
+
+
+def pattern_runs(test_patterns: list[TestPattern]) -> list[ScanRun]:
+    return [
+        ScanRun(test_pattern.name, test_pattern)
+        for test_pattern in test_patterns
+    ]
+
+
+def load_runs(path: str | pathlib.Path,
+              test_pattern: TestPattern,
+              base: ScanPlan | None = None) -> list[ScanRun]:
+    # A JSON list of runs. Every run can set its label, test_pattern,
+    # dwell_time (in miliseconds) and tuned, and a plan whose missing fields
+    # come from base. test_pattern defaults to the one of the session, the
+    # label to the test pattern name.
+    with open(path) as file:
+        entries = json.load(file)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("Scan runs have to be a non-empty list")
+    runs = []
+    for entry in entries:
+        unknown = set(entry) - set(RUN_FIELDS)
+        if unknown:
+            raise ValueError(
+                f"Unknown scan run fields: {', '.join(sorted(unknown))}")
+        pattern = TestPattern[entry.get("test_pattern", test_pattern.name)]
+        dwell_time = entry.get("dwell_time")
+        plan = entry.get("plan")
+        runs.append(
+            ScanRun(str(entry.get("label", pattern.name)), pattern,
+                    None if dwell_time is None else float(dwell_time) / 1000,
+                    None if plan is None else ScanPlan.from_dict(plan, base),
+                    entry.get("tuned")))
+    labels = [run.label for run in runs]
+    if len(set(labels)) != len(labels):
+        raise ValueError("Scan runs need distinct labels")
+    # Readers tell the label column from samples and run headers by it
+    for label in labels:
+        if (not label or label.lstrip("-").isdigit() or label.startswith("#")
+                or any(character in label for character in "\t\r\n")):
+            raise ValueError(f"Invalid scan run label {label!r}")
+    return runs
+
+
+def run_header(run: ScanRun, dwell_time: float) -> str:
+    # dwell_time is the one of the session when the run has none
+    dwell_time = dwell_time if run.dwell_time is None else run.dwell_time
+    return "\t".join(
+        (RUN_HEADER, run.label, run.test_pattern.name, str(
+            dwell_time * 1000))) + "\n"
+
+
+def read_run_headers(path: str | pathlib.Path) -> dict[str, ScanRun]:
+    # Runs of a scan run output by label, from its header lines
+    runs = {}
+    with open(path) as file:
+        for line in file:
+            if not line.startswith(f"{RUN_HEADER}\t"):
+                break
+            _, label, test_pattern, dwell_time = line.rstrip("\n").split("\t")
+            runs[label] = ScanRun(label, TestPattern[test_pattern],
+                                  float(dwell_time) / 1000)
+    return runs
+
+
+class TaggedStream:
+    """Prepends a label column to the TSV lines written to a text stream."""
+
+    def __init__(self, stream: TextIO, label: str):
+        self.stream = stream
+        self.prefix = f"{label}\t"
+
+    def write(self, text: str):
+        self.stream.write("".join(self.prefix + line
+                                  for line in text.splitlines(True)))
+
+    def flush(self):
+        self.stream.flush()
@@ -0,0 +1,1252 @@
+from pyftdi.jtag import JtagEngine
+from pyftdi.bits import BitSequence
+import dataclasses
+import functools
+import pathlib
+import sys
+from typing import Callable, Iterable, NamedTuple, TextIO
+from adaptive import trace_eye
+from calibration import MIN_FREQUENCY, ChainIntegrityError, TuningError, back_off, cached_frequency, cached_receiver_settings, calibrate, store_frequency
+from dwell import DwellPolicy
+from instrumentation import profile_jtag, profiled
+from plan import ScanPlan
+from runs import ScanRun, TaggedStream, run_header
+from results import BackgroundWriter, Journal, WriterStatistics, journal_path, open_results, sample_slice
+from transport import JtagBatch, batch_factory
+from instructions import IEEE_1500_IR_COMMAND, IEEE_1500_DR_COMMAND, BYPASS_COMMAND, COMMANDS, RESET_STATE_COMMAND, LANES, Register, ws_char, ws_cfg, ws_core, ws_tuning, ReceiverSettings, TestPattern
+
+# Captured ecount fields come back one bit below their ws_char offsets for
+# both receiver blocks
+CHAR_READBACK_ECOUNT_OFFSETS = tuple(ws_char.ecount.offset - 1 +
+                                     lane * ws_char.ecount.stride
+                                     for lane in range(LANES))
+FRAME_CACHE_SIZE = 1 << 17
+# Set once compile_char_frame starts evicting frames
+frame_cache_full = False
+# Shifted through the bypass registers by the chain integrity check, along
+# with its complement
+INTEGRITY_PATTERN = 0xAAAACCCCF0F0FF00
+INTEGRITY_PATTERN_LENGTH = 64
+
+# See https://e2e.ti.com/cfs-file/__key/communityserver-discussions-components-files/73/2625.DAC38J84-RX-Tests-_2D00_-Version-1p1.pdf
+
+# INSTRUCTIONS:
+# https://www.ti.com/lit/ds/symlink/dac38j82.pdf?ts=1763026988732&ref_url=https%253A%252F%252Fwww.ti.com%252Fproduct%252FDAC38J82 (page 47)
+# INSTRUCTION OPCODE DESCRIPTION
+# ws_bypass 0x00 Bypass. Selects a 1-bit bypass data register. Use when accessing other macros on the same IEEE1500 scan chain.
+# ws_cfg 0x35 Configuration. Write protection options for other instructions.
+# ws_core 0x30 Core. Fields also accessible via dedicated core-side ports.
+# ws_tuning 0x31 Tuning. Fields for fine tuning macro performance.
+# ws_debug 0x32 Debug. Fields for advanced control, manufacturing test, silicon characterization and debug
+# ws_unshadowed 0x34 Unshadowed. Fields for silicon characterization.
+# ws_char 0x33 Char. Fields used for eye scan.
+
+
+class ChainState:
+    """Last known TAP IR, IEEE 1500 WIR and configuration registers of every
+    device in the chain, used to skip writes that would not change anything."""
+
+    def __init__(self, daisy_chain_device_count: int):
+        self.daisy_chain_device_count = daisy_chain_device_count
+        self.invalidate()
+
+    def invalidate(self):
+        self.ir = [None] * self.daisy_chain_device_count
+        self.wir = [None] * self.daisy_chain_device_count
+        self.reset_pending = [False] * self.daisy_chain_device_count
+        # (device, receiver block, select command name) -> Register
+        self.registers = {}
+
+    def selected(self, daisy_chain_device_number: int) -> str | None:
+        return self.wir[daisy_chain_device_number - 1]
+
+    def update_ir(self, ir: list[str]):
+        self.ir = ir
+        for index, command in enumerate(ir):
+            if command == RESET_STATE_COMMAND:
+                self.reset_pending[index] = False
+
+    def update_wir(self, daisy_chain_device_number: int, command: str):
+        self.wir[daisy_chain_device_number - 1] = command
+        self.reset_pending[daisy_chain_device_number - 1] = True
+
+
+def chain_ir(data: str, daisy_chain_device_number: int,
+             daisy_chain_device_count: int) -> list[str]:
+    ir = [BYPASS_COMMAND] * daisy_chain_device_count
+    ir[daisy_chain_device_number - 1] = data
+    return ir
+
+
+def write_chain_ir(ir: list[str],
+                   jtag: JtagEngine | JtagBatch,
+                   chain_state: ChainState | None = None):
+    if chain_state is not None and chain_state.ir == ir:
+        return
+    jtag.write_ir(BitSequence("".join(reversed(ir)), msb=False))
+    if chain_state is not None:
+        chain_state.update_ir(ir)
+
+
+def write_ir(data: str,
+             jtag: JtagEngine | JtagBatch,
+             daisy_chain_device_number: int,
+             daisy_chain_device_count: int,
+             chain_state: ChainState | None = None):
+    write_chain_ir(
+        chain_ir(data, daisy_chain_device_number, daisy_chain_device_count),
+        jtag, chain_state)
+
+
+def register_frame(register: Register, receiver_block: int) -> BitSequence:
+    # R1 frames are followed by one extra bit
+    return BitSequence(register.value << receiver_block,
+                       msb=True,
+                       length=register.LENGTH + receiver_block)
+
+
+def shift_dr(data: BitSequence, jtag: JtagEngine,
+             daisy_chain_device_number: int,
+             daisy_chain_device_count: int) -> int:
+    # Returns the readback with the first bit shifted out as the MSB
+    encoded_data = BitSequence(length=daisy_chain_device_count -
+                               daisy_chain_device_number) + data
+    encoded_data.append(BitSequence(length=daisy_chain_device_number - 1))
+    readback = shift_encoded_dr(encoded_data, jtag)
+    return (readback >>
+            (daisy_chain_device_number - 1)) & ((1 << len(data)) - 1)
+
+
+@profiled("shift_dr", bits=lambda encoded_data, jtag: len(encoded_data))
+def shift_encoded_dr(encoded_data: BitSequence, jtag: JtagEngine) -> int:
+    jtag.change_state('shift_dr')
+    readback = jtag.shift_and_update_register(encoded_data)
+    jtag.go_idle()
+    return int(readback.reverse())
+
+
+@profiled("select_command")
+def select_command(jtag: JtagEngine,
+                   daisy_chain_device_number: int,
+                   daisy_chain_device_count: int,
+                   command: str,
+                   chain_state: ChainState | None = None):
+    if chain_state is not None and chain_state.selected(
+            daisy_chain_device_number) == command:
+        write_ir(IEEE_1500_DR_COMMAND, jtag, daisy_chain_device_number,
+                 daisy_chain_device_count, chain_state)
+        return
+    write_ir(IEEE_1500_IR_COMMAND, jtag, daisy_chain_device_number,
+             daisy_chain_device_count, chain_state)
+    shift_dr(BitSequence(command, msb=False), jtag, daisy_chain_device_number,
+             daisy_chain_device_count)
+    if chain_state is not None:
+        chain_state.update_wir(daisy_chain_device_number, command)
+    write_ir(RESET_STATE_COMMAND, jtag, daisy_chain_device_number,
+             daisy_chain_device_count, chain_state)
+    write_ir(IEEE_1500_DR_COMMAND, jtag, daisy_chain_device_number,
+             daisy_chain_device_count, chain_state)
+
+
+def chain_frames(frames: list[BitSequence]) -> BitSequence:
+    # frames[0] is shifted into device 1
+    encoded_data = BitSequence()
+    for frame in reversed(frames):
+        encoded_data.append(frame)
+    return encoded_data
+
+
+def shift_chain_dr(frames: list[BitSequence], jtag: JtagEngine) -> list[int]:
+    # Readbacks are split the same way as frames
+    readback = shift_encoded_dr(chain_frames(frames), jtag)
+    readbacks = []
+    for frame in frames:
+        readbacks.append(readback & ((1 << len(frame)) - 1))
+        readback >>= len(frame)
+    return readbacks
+
+
+@profiled("select_command")
+def select_command_whole_chain(jtag: JtagEngine,
+                               daisy_chain_device_count: int,
+                               command: str,
+                               chain_state: ChainState | None = None):
+    batch = JtagBatch(jtag)
+    queue_select_command_whole_chain(batch, daisy_chain_device_count, command,
+                                     chain_state)
+    batch.execute()
+
+
+def queue_select_command_whole_chain(batch: JtagBatch,
+                                     daisy_chain_device_count: int,
+                                     command: str,
+                                     chain_state: ChainState | None = None):
+    if chain_state is not None and all(
+            chain_state.selected(daisy_chain_device_number) == command
+            for daisy_chain_device_number in range(
+                1, daisy_chain_device_count + 1)):
+        write_chain_ir([IEEE_1500_DR_COMMAND] * daisy_chain_device_count,
+                       batch, chain_state)
+        return
+    write_chain_ir([IEEE_1500_IR_COMMAND] * daisy_chain_device_count, batch,
+                   chain_state)
+    batch.shift_dr(
+        chain_frames([BitSequence(command, msb=False)] *
+                     daisy_chain_device_count))
+    if chain_state is not None:
+        for daisy_chain_device_number in range(1,
+                                               daisy_chain_device_count + 1):
+            chain_state.update_wir(daisy_chain_device_number, command)
+    write_chain_ir([RESET_STATE_COMMAND] * daisy_chain_device_count, batch,
+                   chain_state)
+    write_chain_ir([IEEE_1500_DR_COMMAND] * daisy_chain_device_count, batch,
+                   chain_state)
+
+
+def char_frame(voltage_off: int, phase_off: int, bit_select: int,
+               is_r0: bool) -> BitSequence:
+    return register_frame(
+        ws_char(phase_off,
+                bit_select,
+                voltage_off,
+                es=0b0001,
+                esword=255,
+                voltage_offset_override=True), 0 if is_r0 else 1)
+
+
+class CompiledFrame(NamedTuple):
+    bits: BitSequence
+    # Lane ecount offsets in the whole readback, one tuple per device read
+    ecount_offsets: tuple[tuple[int, ...], ...]
+
+    @profiled("decode")
+    def decode(self, readback: int) -> list[tuple[int, ...]]:
+        return [
+            tuple((readback >> offset) & ws_char.ecount.mask
+                  for offset in offsets) for offsets in self.ecount_offsets
+        ]
+
+
+@functools.lru_cache(maxsize=FRAME_CACHE_SIZE)
+def compile_char_frame(voltage_off: int, phase_off: int, bit_select: int,
+                       is_r0: bool, daisy_chain_device_number: int,
+                       daisy_chain_device_count: int) -> CompiledFrame:
+    # Frames are compiled the first time a readout uses them and stay cached
+    # across scans in the process. daisy_chain_device_number 0 addresses
+    # every device in the chain at once.
+    global frame_cache_full
+    cached_frames = compile_char_frame.cache_info().currsize
+    if cached_frames >= FRAME_CACHE_SIZE and not frame_cache_full:
+        frame_cache_full = True
+        print(
+            f"ws_char frame cache full at {FRAME_CACHE_SIZE} frames, frames "
+            "evicted from it are compiled again",
+            file=sys.stderr)
+    frame = char_frame(voltage_off, phase_off, bit_select, is_r0)
+    if daisy_chain_device_number == 0:
+        bits = BitSequence()
+        for _ in range(daisy_chain_device_count):
+            bits.append(frame)
+        return CompiledFrame(
+            bits,
+            tuple(
+                tuple(index * len(frame) + offset
+                      for offset in CHAR_READBACK_ECOUNT_OFFSETS)
+                for index in range(daisy_chain_device_count)))
+    bits = BitSequence(length=daisy_chain_device_count -
+                       daisy_chain_device_number) + frame
+    bits.append(BitSequence(length=daisy_chain_device_number - 1))
+    return CompiledFrame(bits,
+                         (tuple(daisy_chain_device_number - 1 + offset
+                                for offset in CHAR_READBACK_ECOUNT_OFFSETS), ))
+
+
+@profiled("read_back_from_char")
+def read_back_from_char(jtag: JtagEngine,
+                        daisy_chain_device_number: int,
+                        daisy_chain_device_count: int,
+                        voltage_off: int,
+                        phase_off: int,
+                        bit_select: int,
+                        is_r0=True):
+    frame = compile_char_frame(voltage_off, phase_off, bit_select, is_r0,
+                               daisy_chain_device_number,
+                               daisy_chain_device_count)
+    return frame.decode(shift_encoded_dr(frame.bits, jtag))[0]
+
+
+def queue_read_back_from_char(batch: JtagBatch,
+                              daisy_chain_device_number: int,
+                              daisy_chain_device_count: int,
+                              voltage_off: int,
+                              phase_off: int,
+                              bit_select: int,
+                              is_r0=True) -> tuple[CompiledFrame, int]:
+    # Decode with frame.decode(batch.execute()[index])
+    frame = compile_char_frame(voltage_off, phase_off, bit_select, is_r0,
+                               daisy_chain_device_number,
+                               daisy_chain_device_count)
+    return frame, batch.shift_dr(frame.bits)
+
+
+@profiled("read_back_from_char")
+def read_back_from_char_whole_chain(jtag: JtagEngine,
+                                    daisy_chain_device_count: int,
+                                    voltage_off: int,
+                                    phase_off: int,
+                                    bit_select: int,
+                                    is_r0=True):
+    frame = compile_char_frame(voltage_off, phase_off, bit_select, is_r0, 0,
+                               daisy_chain_device_count)
+    return frame.decode(shift_encoded_dr(frame.bits, jtag))
+
+
+def write_register(jtag: JtagEngine,
+                   daisy_chain_device_number: int,
+                   daisy_chain_device_count: int,
+                   receiver_block: int,
+                   select: str,
+                   register: Register,
+                   chain_state: ChainState | None = None):
+    key = (daisy_chain_device_number, receiver_block, select)
+    if chain_state is not None and chain_state.registers.get(key) == register:
+        return
+    select_command(jtag, daisy_chain_device_number, daisy_chain_device_count,
+                   COMMANDS[receiver_block][select], chain_state)
+    shift_dr(register_frame(register, receiver_block), jtag,
+             daisy_chain_device_number, daisy_chain_device_count)
+    if chain_state is not None:
+        chain_state.registers[key] = register
+
+
+def check_bypass(jtag: JtagEngine,
+                 daisy_chain_device_count: int,
+                 chain_state: ChainState | None = None) -> bool:
+    # Every bypass register captures 0 and delays the pattern by one bit. The
+    # IR known to chain_state is restored afterwards, so that the check can
+    # run in the middle of a readout.
+    ir = chain_state.ir if chain_state is not None else None
+    write_chain_ir([BYPASS_COMMAND] * daisy_chain_device_count, jtag,
+                   chain_state)
+    passed = True
+    for pattern in (INTEGRITY_PATTERN,
+                    INTEGRITY_PATTERN ^ ((1 << INTEGRITY_PATTERN_LENGTH) - 1)):
+        data = BitSequence(pattern, msb=True, length=INTEGRITY_PATTERN_LENGTH)
+        data.append(BitSequence(length=daisy_chain_device_count))
+        passed &= shift_encoded_dr(data, jtag) == pattern
+    if ir is not None and None not in ir:
+        write_chain_ir(ir, jtag, chain_state)
+    return passed
+
+
+def check_cfg_readback(jtag: JtagEngine, daisy_chain_device_number: int,
+                       daisy_chain_device_count: int,
+                       receiver_block: int) -> bool:
+    # Writes ws_cfg values in turn and back to the first one, every write
+    # shifts out the value written before it
+    values = [
+        ws_cfg(),
+        ws_cfg(core_we_head=True,
+               core_we=True,
+               char_we=True,
+               tuning_we=True,
+               core_we_tail=True,
+               tuning_we_tail=True),
+        ws_cfg()
+    ]
+    select_command(jtag, daisy_chain_device_number, daisy_chain_device_count,
+                   COMMANDS[receiver_block]["SELECT_CFG"])
+    readbacks = [
+        shift_dr(register_frame(value, receiver_block), jtag,
+                 daisy_chain_device_number, daisy_chain_device_count)
+        for value in values
+    ]
+    return readbacks[1:] == [
+        value.value << receiver_block for value in values[:-1]
+    ]
+
+
+def check_chain_integrity(jtag: JtagEngine,
+                          daisy_chain_device_count: int) -> bool:
+    # Bypass patterns and ws_cfg write/readback of every receiver block,
+    # leaves the chain state unknown
+    return check_bypass(jtag, daisy_chain_device_count) and all(
+        check_cfg_readback(jtag, daisy_chain_device_number,
+                           daisy_chain_device_count, receiver_block)
+        for daisy_chain_device_number in range(1, daisy_chain_device_count + 1)
+        for receiver_block in range(2))
+
+
+def configure_receiver_block(jtag: JtagEngine,
+                             daisy_chain_device_number: int,
+                             daisy_chain_device_count: int,
+                             receiver_block: int,
+                             test_pattern: TestPattern,
+                             chain_state: ChainState | None = None,
+                             settings: ReceiverSettings = ReceiverSettings()):
+    # Registers already holding these values in chain_state are not written
+    cfg = ws_cfg(core_we_head=True,
+                 core_we=True,
+                 char_we=True,
+                 tuning_we=True,
+                 core_we_tail=True,
+                 tuning_we_tail=True)
+    if chain_state is None or chain_state.registers.get(
+        (daisy_chain_device_number, receiver_block, "SELECT_CFG")) != cfg:
+        write_register(jtag, daisy_chain_device_number,
+                       daisy_chain_device_count, receiver_block, "SELECT_CFG",
+                       ws_cfg(), chain_state)
+        write_register(jtag, daisy_chain_device_number,
+                       daisy_chain_device_count, receiver_block, "SELECT_CFG",
+                       cfg, chain_state)
+    write_register(
+        jtag, daisy_chain_device_number, daisy_chain_device_count,
+        receiver_block, "SELECT_CORE_INPUTS",
+        ws_core(enpll=True,
+                mpy=5,
+                enrx=True,
+                buswidth=2,
+                term=settings.term,
+                cdr=settings.cdr,
+                eq=settings.eq,
+                enoc=True,
+                cfg_ovr=True,
+                testpatt=test_pattern), chain_state)
+    write_register(
+        jtag, daisy_chain_device_number, daisy_chain_device_count,
+        receiver_block, "SELECT_TUNING",
+        ws_tuning(encor=settings.encor,
+                  eqzero=settings.eqzero,
+                  eqz_ovr=settings.eqz_ovr,
+                  eqlevel=settings.eqlevel,
+                  eq_ovr=settings.eq_ovr,
+                  eqboost=settings.eqboost), chain_state)
+
+
+def readout_receiver_block(
+        jtag: JtagEngine,
+        daisy_chain_device_number: int,
+        daisy_chain_device_count: int,
+        plan: ScanPlan,
+        receiver_block: int,
+        dwell_time: float,
+        chain_state: ChainState | None = None,
+        make_batch: Callable[[JtagEngine], JtagBatch] = JtagBatch,
+        completed_rows: frozenset[tuple[int, int]] | None = None):
+    for voltage, bit_select in plan.rows():
+        if completed_rows and (voltage, bit_select) in completed_rows:
+            continue
+        select_command(jtag, daisy_chain_device_number,
+                       daisy_chain_device_count,
+                       COMMANDS[receiver_block]["SELECT_READBACK"],
+                       chain_state)
+        batch = make_batch(jtag)
+        queue_read_back_from_char(batch, daisy_chain_device_number,
+                                  daisy_chain_device_count, voltage & 0xff, 0,
+                                  bit_select, receiver_block == 0)
+        reads = []
+        for phase in plan.phases:
+            queue_read_back_from_char(batch, daisy_chain_device_number,
+                                      daisy_chain_device_count, voltage & 0xff,
+                                      phase & 0xff, bit_select,
+                                      receiver_block == 0)
+            batch.idle(dwell_time)
+            reads.append((phase, *queue_read_back_from_char(
+                batch, daisy_chain_device_number, daisy_chain_device_count,
+                voltage & 0xff, phase & 0xff, bit_select, receiver_block
+                == 0)))
+        readbacks = batch.execute()
+        for phase, frame, index in reads:
+            amplitudes = frame.decode(readbacks[index])[0]
+            for lane, amp in enumerate(amplitudes):
+                yield lane + 4 * receiver_block, bit_select, voltage, phase, amp
+
+
+def reset_state_whole_chain(jtag: JtagEngine | JtagBatch,
+                            daisy_chain_device_number,
+                            daisy_chain_device_count,
+                            chain_state: ChainState | None = None):
+    # RESET_STATE_COMMAND is only required after a write to IEEE 1500 IR
+    if chain_state is not None and not any(chain_state.reset_pending):
+        return
+    write_chain_ir([RESET_STATE_COMMAND] * daisy_chain_device_count, jtag,
+                   chain_state)
+
+
+def parallel_readout_receiver_block(
+        jtag: JtagEngine,
+        daisy_chain_device_count: int,
+        plan: ScanPlan,
+        receiver_block: int,
+        dwell_time: float,
+        chain_state: ChainState | None = None,
+        make_batch: Callable[[JtagEngine], JtagBatch] = JtagBatch,
+        completed_rows: frozenset[tuple[int, int]] | None = None):
+    for voltage, bit_select in plan.rows():
+        if completed_rows and (voltage, bit_select) in completed_rows:
+            continue
+        for daisy_chain_device_number in range(1,
+                                               daisy_chain_device_count + 1):
+            reset_state_whole_chain(jtag, daisy_chain_device_number,
+                                    daisy_chain_device_count, chain_state)
+            select_command(jtag, daisy_chain_device_number,
+                           daisy_chain_device_count,
+                           COMMANDS[receiver_block]["SELECT_READBACK"],
+                           chain_state)
+            read_back_from_char(jtag, daisy_chain_device_number,
+                                daisy_chain_device_count, voltage & 0xff, 0,
+                                bit_select, receiver_block == 0)
+        batch = make_batch(jtag)
+        reads = []
+        for phase in plan.phases:
+            for daisy_chain_device_number in range(
+                    1, daisy_chain_device_count + 1):
+                reset_state_whole_chain(batch, daisy_chain_device_number,
+                                        daisy_chain_device_count, chain_state)
+                write_ir(IEEE_1500_DR_COMMAND, batch,
+                         daisy_chain_device_number, daisy_chain_device_count,
+                         chain_state)
+                queue_read_back_from_char(batch, daisy_chain_device_number,
+                                          daisy_chain_device_count,
+                                          voltage & 0xff, phase & 0xff,
+                                          bit_select, receiver_block == 0)
+            batch.idle(dwell_time)
+            for daisy_chain_device_number in range(
+                    1, daisy_chain_device_count + 1):
+                reset_state_whole_chain(batch, daisy_chain_device_number,
+                                        daisy_chain_device_count, chain_state)
+                write_ir(IEEE_1500_DR_COMMAND, batch,
+                         daisy_chain_device_number, daisy_chain_device_count,
+                         chain_state)
+                reads.append(
+                    (daisy_chain_device_number,
+                     phase, *queue_read_back_from_char(
+                         batch, daisy_chain_device_number,
+                         daisy_chain_device_count, voltage & 0xff,
+                         phase & 0xff, bit_select, receiver_block == 0)))
+        readbacks = batch.execute()
+        for daisy_chain_device_number, phase, frame, index in reads:
+            amplitudes = frame.decode(readbacks[index])[0]
+            for lane, amp in enumerate(amplitudes):
+                yield daisy_chain_device_number, lane + 4 * receiver_block, bit_select, voltage, phase, amp
+
+
+def chain_readout_receiver_block(
+        jtag: JtagEngine,
+        daisy_chain_device_count: int,
+        plan: ScanPlan,
+        receiver_block: int,
+        dwell_time: float,
+        chain_state: ChainState | None = None,
+        make_batch: Callable[[JtagEngine], JtagBatch] = JtagBatch,
+        completed_rows: frozenset[tuple[int, int]] | None = None):
+    for voltage, bit_select in plan.rows():
+        if completed_rows and (voltage, bit_select) in completed_rows:
+            continue
+        select_command_whole_chain(jtag, daisy_chain_device_count,
+                                   COMMANDS[receiver_block]["SELECT_READBACK"],
+                                   chain_state)
+        batch = make_batch(jtag)
+        queue_read_back_from_char(batch, 0, daisy_chain_device_count,
+                                  voltage & 0xff, 0, bit_select,
+                                  receiver_block == 0)
+        reads = []
+        for phase in plan.phases:
+            queue_read_back_from_char(batch, 0, daisy_chain_device_count,
+                                      voltage & 0xff, phase & 0xff, bit_select,
+                                      receiver_block == 0)
+            batch.idle(dwell_time)
+            reads.append((phase, *queue_read_back_from_char(
+                batch, 0, daisy_chain_device_count, voltage & 0xff,
+                phase & 0xff, bit_select, receiver_block == 0)))
+        readbacks = batch.execute()
+        for phase, frame, index in reads:
+            for daisy_chain_device_number, amplitudes in enumerate(
+                    frame.decode(readbacks[index]), start=1):
+                for lane, amp in enumerate(amplitudes):
+                    yield daisy_chain_device_number, lane + 4 * receiver_block, bit_select, voltage, phase, amp
+
+
+def pipelined_readout_receiver_blocks(
+        jtag: JtagEngine,
+        daisy_chain_device_count: int,
+        plan: ScanPlan,
+        receiver_blocks: tuple[int, ...],
+        dwell_time: float,
+        chain_state: ChainState | None = None,
+        make_batch: Callable[[JtagEngine], JtagBatch] = JtagBatch,
+        completed_rows: frozenset[tuple[int, int]] | None = None):
+    # Every receiver block of every device accumulates errors during one
+    # shared dwell window. The DR shift reading a point back also arms the
+    # next one, the block counters keep running while the others are selected.
+    # The receiver blocks are visited in alternating order, so the block
+    # selected last for a point is read first for the next one and every
+    # point switches the WIR only once. This still takes more shifts per
+    # point than the other readouts and only pays off when the dwell time,
+    # which is spent once for both blocks, outweighs them.
+    # (voltage, bit_select, phase, recorded), every row starts with the
+    # unrecorded phase 0 point like in the other readouts
+    points = []
+    for voltage, bit_select in plan.rows():
+        if completed_rows and (voltage, bit_select) in completed_rows:
+            continue
+        points.append((voltage, bit_select, 0, False))
+        for phase in plan.phases:
+            points.append((voltage, bit_select, phase, True))
+    # Arming the last point once more reads it back
+    points.append((*points[-1][:3], False))
+    armed = None
+    batch = make_batch(jtag)
+    reads = []
+    order = list(receiver_blocks)
+    for voltage, bit_select, phase, recorded in points:
+        for receiver_block in order:
+            queue_select_command_whole_chain(
+                batch, daisy_chain_device_count,
+                COMMANDS[receiver_block]["SELECT_READBACK"], chain_state)
+            frame, index = queue_read_back_from_char(batch, 0,
+                                                     daisy_chain_device_count,
+                                                     voltage & 0xff,
+                                                     phase & 0xff, bit_select,
+                                                     receiver_block == 0)
+            if armed is not None:
+                reads.append((*armed, receiver_block, frame, index))
+        order.reverse()
+        if recorded:
+            armed = (voltage, bit_select, phase)
+            batch.idle(dwell_time)
+            continue
+        armed = None
+        if reads:
+            readbacks = batch.execute()
+            for read_voltage, read_bit_select, read_phase, receiver_block, frame, index in reads:
+                for daisy_chain_device_number, amplitudes in enumerate(
+                        frame.decode(readbacks[index]), start=1):
+                    for lane, amp in enumerate(amplitudes):
+                        yield daisy_chain_device_number, lane + 4 * receiver_block, read_bit_select, read_voltage, read_phase, amp
+            batch = make_batch(jtag)
+            reads = []
+
+
+def select_readback(jtag: JtagEngine,
+                    daisy_chain_device_number: int,
+                    daisy_chain_device_count: int,
+                    receiver_block: int,
+                    chain_state: ChainState | None = None):
+    # daisy_chain_device_number 0 selects every device in the chain
+    command = COMMANDS[receiver_block]["SELECT_READBACK"]
+    if daisy_chain_device_number == 0:
+        select_command_whole_chain(jtag, daisy_chain_device_count, command,
+                                   chain_state)
+    else:
+        select_command(jtag, daisy_chain_device_number,
+                       daisy_chain_device_count, command, chain_state)
+
+
+@profiled("measure_char_points")
+def measure_char_points(
+        jtag: JtagEngine, daisy_chain_device_number: int,
+        daisy_chain_device_count: int, bit_select: int, is_r0: bool,
+        make_batch: Callable[[JtagEngine], JtagBatch], dwell_time: float,
+        points: list[tuple[int, int]]) -> list[tuple[int, ...]]:
+    # Arms and reads back every (voltage, phase) point in one batch, returns
+    # the amplitudes of every lane of every device read
+    batch = make_batch(jtag)
+    reads = []
+    for voltage, phase in points:
+        queue_read_back_from_char(batch, daisy_chain_device_number,
+                                  daisy_chain_device_count, voltage & 0xff,
+                                  phase & 0xff, bit_select, is_r0)
+        batch.idle(dwell_time)
+        reads.append(
+            queue_read_back_from_char(batch, daisy_chain_device_number,
+                                      daisy_chain_device_count, voltage & 0xff,
+                                      phase & 0xff, bit_select, is_r0))
+    readbacks = batch.execute()
+    return [
+        tuple(amp for amplitudes in frame.decode(readbacks[index])
+              for amp in amplitudes) for frame, index in reads
+    ]
+
+
+def measure_with_dwell_policy(
+        measure: Callable[[float, list[tuple[int, int]]],
+                          list[tuple[int, ...]]], dwell_policy: DwellPolicy,
+        dwells: dict[tuple[int, int], float],
+        points: list[tuple[int, int]]) -> list[tuple[int, ...]]:
+    # Records the dwell every point was measured with in dwells
+    results = dwell_policy.measure(measure, points)
+    for point, (_, dwell) in zip(points, results):
+        dwells[point] = dwell
+    return [amplitudes for amplitudes, _ in results]
+
+
+def adaptive_readout_receiver_block(
+        jtag: JtagEngine,
+        daisy_chain_device_number: int,
+        daisy_chain_device_count: int,
+        plan: ScanPlan,
+        receiver_block: int,
+        dwell_time: float,
+        chain_state: ChainState | None = None,
+        make_batch: Callable[[JtagEngine], JtagBatch] = JtagBatch,
+        dwell_policy: DwellPolicy | None = None,
+        completed_rows: frozenset[tuple[int, int]] | None = None):
+    # Only the open/closed boundary of every lane is measured, the rest of
+    # the grid is inferred and flagged in an extra column. Inferred samples
+    # have a dwell of 0. Every bit select is traced on its own, whatever the
+    # order of the plan.
+    voltages = list(plan.voltages)
+    phases = list(plan.phases)
+    daisy_chain_device_numbers = list(range(1, daisy_chain_device_count + 1))
+    if daisy_chain_device_number:
+        daisy_chain_device_numbers = [daisy_chain_device_number]
+    for bit_select in plan.bits:
+        if completed_rows and all(
+            (voltage, bit_select) in completed_rows for voltage in voltages):
+            continue
+        select_readback(jtag, daisy_chain_device_number,
+                        daisy_chain_device_count, receiver_block, chain_state)
+        measure = functools.partial(measure_char_points, jtag,
+                                    daisy_chain_device_number,
+                                    daisy_chain_device_count, bit_select,
+                                    receiver_block == 0, make_batch)
+        dwells = {}
+        for sample in trace_eye(
+                voltages, phases,
+                functools.partial(
+                    measure_with_dwell_policy, measure, dwell_policy
+                    or DwellPolicy.fixed(dwell_time), dwells),
+                len(daisy_chain_device_numbers) * LANES):
+            device_index, lane = divmod(sample.index, LANES)
+            device = daisy_chain_device_numbers[device_index]
+            dwell = 0 if sample.inferred else dwells[sample.voltage,
+                                                     sample.phase]
+            yield device, lane + 4 * receiver_block, bit_select, sample.voltage, sample.phase, sample.amplitude, int(
+                sample.inferred), dwell * 1000
+
+
+def dwell_policy_readout_receiver_block(
+        jtag: JtagEngine,
+        daisy_chain_device_number: int,
+        daisy_chain_device_count: int,
+        plan: ScanPlan,
+        receiver_block: int,
+        dwell_policy: DwellPolicy,
+        chain_state: ChainState | None = None,
+        make_batch: Callable[[JtagEngine], JtagBatch] = JtagBatch,
+        completed_rows: frozenset[tuple[int, int]] | None = None):
+    # Every row is measured with the shortest dwell first, points whose error
+    # counts are not conclusive yet are measured again with longer ones. The
+    # output has the adaptive readout columns, nothing is inferred.
+    daisy_chain_device_numbers = list(range(1, daisy_chain_device_count + 1))
+    if daisy_chain_device_number:
+        daisy_chain_device_numbers = [daisy_chain_device_number]
+    for voltage, bit_select in plan.rows():
+        if completed_rows and (voltage, bit_select) in completed_rows:
+            continue
+        select_readback(jtag, daisy_chain_device_number,
+                        daisy_chain_device_count, receiver_block, chain_state)
+        measure = functools.partial(measure_char_points, jtag,
+                                    daisy_chain_device_number,
+                                    daisy_chain_device_count, bit_select,
+                                    receiver_block == 0, make_batch)
+        points = [(voltage, phase) for phase in plan.phases]
+        for (_, phase), (amplitudes,
+                         dwell) in zip(points,
+                                       dwell_policy.measure(measure, points)):
+            for index, amp in enumerate(amplitudes):
+                device_index, lane = divmod(index, LANES)
+                device = daisy_chain_device_numbers[device_index]
+                yield device, lane + 4 * receiver_block, bit_select, voltage, phase, amp, 0, dwell * 1000
+
+
+def write_row(results: BackgroundWriter,
+              samples: list[tuple],
+              verify: Callable[[], bool] | None = None,
+              written_rows: set[tuple[int, int]] | None = None):
+    if not samples:
+        return
+    if verify is not None and not verify():
+        raise ChainIntegrityError("JTAG chain failed its integrity check")
+    slices = set()
+    for sample in samples:
+        slices.add(sample_slice(sample))
+        results.write(sample)
+    results.checkpoint(slices)
+    if written_rows is not None:
+        written_rows.update((voltage, bit) for _, _, voltage, bit in slices)
+
+
+def write_readout(results: BackgroundWriter,
+                  readout,
+                  adaptive: bool,
+                  verify: Callable[[], bool] | None = None,
+                  written_rows: set[tuple[int, int]] | None = None):
+    # A slice is journaled once the readout moves past its row, (voltage, bit)
+    # or just bit for adaptive readout. With verify, the samples of a row are
+    # written only if the chain passes the check after it, (voltage, bit) of
+    # the rows written are added to written_rows.
+    row = None
+    samples = []
+    for sample in readout:
+        sample_row = sample[2] if adaptive else (sample[3], sample[2])
+        if sample_row != row:
+            write_row(results, samples, verify, written_rows)
+            row = sample_row
+            samples = []
+        samples.append(sample)
+    write_row(results, samples, verify, written_rows)
+
+
+class ScanSession:
+    """Configured JtagEngine and the known state of its chain. Scans given a
+    session skip the adapter setup and the registers it already holds, the
+    daemon keeps one open per adapter.
+
+    Without ftdi_jtag_frequency, TCK runs at the frequency calibrated for the
+    adapter and chain length, which is calibrated first if there is none yet
+    or with recalibrate. Scans then verify the chain after every row and back
+    off when it fails."""
+
+    def __init__(self,
+                 pyftdi_url: str,
+                 ftdi_jtag_frequency: float | None,
+                 ftdi_direction: int,
+                 ftdi_initial_value: int,
+                 ftdi_reset_bit: int,
+                 daisy_chain_device_count: int,
+                 jtag_factory: Callable[..., JtagEngine] = JtagEngine,
+                 recalibrate: bool = False):
+        self.settings = (ftdi_jtag_frequency, ftdi_direction,
+                         ftdi_initial_value, ftdi_reset_bit,
+                         daisy_chain_device_count)
+        self.daisy_chain_device_count = daisy_chain_device_count
+        self.calibrated = ftdi_jtag_frequency is None
+        self.frequency = MIN_FREQUENCY if self.calibrated else ftdi_jtag_frequency
+        # Times IR writes and DR shifts while profiling
+        self.jtag = profile_jtag(
+            jtag_factory(frequency=self.frequency,
+                         direction=ftdi_direction,
+                         initial=ftdi_initial_value,
+                         rst_bit=ftdi_reset_bit))
+        self.jtag.configure(pyftdi_url)
+        self.jtag.reset(hw_reset=True, tap_reset=True)
+        if self.calibrated:
+            frequency = None if recalibrate else cached_frequency(
+                self.serial_number, daisy_chain_device_count)
+            if frequency is None:
+                frequency = calibrate(
+                    self.set_frequency,
+                    functools.partial(check_chain_integrity, self.jtag,
+                                      daisy_chain_device_count))
+                store_frequency(self.serial_number, daisy_chain_device_count,
+                                frequency)
+            self.set_frequency(frequency)
+            # The integrity check leaves ws_cfg written
+            self.jtag.reset(hw_reset=True, tap_reset=True)
+        self.chain_state = ChainState(daisy_chain_device_count)
+
+    @functools.cached_property
+    def serial_number(self) -> str:
+        return self.jtag.controller.ftdi.usb_dev.serial_number
+
+    def set_frequency(self, frequency: float) -> float:
+        self.frequency = self.jtag.controller.ftdi.set_frequency(frequency)
+        return self.frequency
+
+    def tuned_settings(
+            self,
+            board_id: str | None) -> dict[tuple[int, int], ReceiverSettings]:
+        # Receiver settings eyescan-tune found for the board and chain length,
+        # by (device, receiver block). They belong to the board, whichever
+        # adapter drives it.
+        if board_id is None:
+            raise TuningError("Tuned receiver settings need a board id")
+        settings = cached_receiver_settings(board_id,
+                                            self.daisy_chain_device_count)
+        if settings is None:
+            raise TuningError(
+                f"No receiver settings tuned for board {board_id} with "
+                f"{self.daisy_chain_device_count} devices, run eyescan-tune "
+                f"--board-id {board_id} first")
+        return settings
+
+    def verify(self) -> bool:
+        return check_bypass(self.jtag, self.daisy_chain_device_count,
+                            self.chain_state)
+
+    def back_off(self):
+        # Lowers the cached frequency as well, registers have to be written
+        # again afterwards
+        self.set_frequency(back_off(self.frequency))
+        store_frequency(self.serial_number, self.daisy_chain_device_count,
+                        self.frequency)
+        print(
+            f"JTAG chain failed its integrity check, TCK lowered to "
+            f"{self.frequency:.0f} Hz",
+            file=sys.stderr)
+        self.jtag.reset(hw_reset=False, tap_reset=True)
+        self.chain_state.invalidate()
+
+    def close(self):
+        self.jtag.close()
+        del self.jtag
+
+
+def scan_passes(
+    plan: ScanPlan, receiver_block_sets: list[tuple[int, ...]], adaptive: bool
+) -> list[tuple[tuple[int, ...], frozenset[tuple[int, int]]]]:
+    # (receiver blocks, rows skipped) of every pass of the scan. A center_first
+    # plan measures the center rows of every receiver block set before the
+    # other rows, so that every lane can be told dead early.
+    if not plan.center_first or adaptive or len(receiver_block_sets) < 2:
+        return [(receiver_blocks, frozenset())
+                for receiver_blocks in receiver_block_sets]
+    center = min(plan.voltages, key=abs)
+    center_rows = frozenset(row for row in plan.rows() if row[0] == center)
+    return [(receiver_blocks, skipped_rows)
+            for skipped_rows in (frozenset(plan.rows()) - center_rows,
+                                 center_rows)
+            for receiver_blocks in receiver_block_sets]
+
+
+def scan_chain(readout: Callable[..., Iterable[tuple]],
+               receiver_block_sets: list[tuple[int, ...]],
+               devices: tuple[int, ...],
+               plan: ScanPlan,
+               pyftdi_url: str,
+               ftdi_jtag_frequency: float,
+               ftdi_direction: int,
+               ftdi_initial_value: int,
+               ftdi_reset_bit: int,
+               daisy_chain_device_count: int,
+               output_path: str | pathlib.Path | None,
+               test_pattern: TestPattern,
+               dwell_time: float,
+               jtag_factory: Callable[..., JtagEngine] = JtagEngine,
+               transport: str = "direct",
+               adaptive: bool = False,
+               output_format: str = "tsv",
+               stream: bool = False,
+               resume: bool = False,
+               streams: tuple[TextIO, ...] = (),
+               session: ScanSession | None = None,
+               tuned: bool = False,
+               board_id: str | None = None,
+               receiver_settings: dict | None = None,
+               render: pathlib.Path | None = None,
+               sinks: tuple = (),
+               reset_state: bool = False) -> WriterStatistics:
+    # Session and output handling shared by the perform functions. Every
+    # device is configured for each set of receiver blocks, which is then
+    # scanned with readout(jtag, chain_state, receiver_blocks, make_batch,
+    # completed_rows), yielding the samples of the rows not completed yet.
+    # reset_state writes RESET_STATE to the chain after configuring a device.
+    scan_session = session or ScanSession(
+        pyftdi_url, ftdi_jtag_frequency, ftdi_direction, ftdi_initial_value,
+        ftdi_reset_bit, daisy_chain_device_count, jtag_factory)
+    try:
+        jtag = scan_session.jtag
+        chain_state = scan_session.chain_state
+        # Receiver blocks missing from receiver_settings, by (device, receiver
+        # block), keep the default settings
+        if tuned:
+            receiver_settings = scan_session.tuned_settings(board_id)
+        receiver_settings = receiver_settings or {}
+        make_batch = batch_factory(transport, scan_session.frequency)
+        # Rows are verified at a calibrated frequency
+        verify = scan_session.verify if scan_session.calibrated else None
+        grid = plan.grid(devices)
+        # stream also writes the samples to stdout and streams to other text
+        # streams, sinks get them as tuples. resume continues after the slices
+        # journaled by an interrupted scan, without output_path the samples
+        # only go to the streams and sinks.
+        journal = Journal(journal_path(output_path), grid, resume)
+        with open_results(output_path, output_format, grid, dwell_time,
+                          ((sys.stdout, ) if stream else
+                           ()) + streams, journal, render, sinks) as results:
+            for receiver_blocks, skipped_rows in scan_passes(
+                    plan, receiver_block_sets, adaptive):
+                completed_rows = journal.rows(receiver_blocks) | skipped_rows
+                while len(completed_rows) < len(plan.rows()):
+                    for receiver_block in receiver_blocks:
+                        for daisy_chain_device_number in range(
+                                1, daisy_chain_device_count + 1):
+                            configure_receiver_block(
+                                jtag, daisy_chain_device_number,
+                                daisy_chain_device_count, receiver_block,
+                                test_pattern, chain_state,
+                                receiver_settings.get(
+                                    (daisy_chain_device_number,
+                                     receiver_block), ReceiverSettings()))
+                            if reset_state:
+                                reset_state_whole_chain(
+                                    jtag, daisy_chain_device_number,
+                                    daisy_chain_device_count, chain_state)
+                    written_rows = set()
+                    try:
+                        write_readout(
+                            results,
+                            plan.select(
+                                readout(jtag, chain_state, receiver_blocks,
+                                        make_batch, completed_rows), devices),
+                            adaptive, verify, written_rows)
+                    except ChainIntegrityError:
+                        # The rows not written yet are scanned again
+                        scan_session.back_off()
+                        make_batch = batch_factory(transport,
+                                                   scan_session.frequency)
+                        completed_rows |= written_rows
+                        continue
+                    break
+        journal.remove()
+        return results.statistics
+    finally:
+        if session is None:
+            scan_session.close()
+
+
+def perform_eyescan(
+    pyftdi_url: str,
+    ftdi_jtag_frequency: float,
+    ftdi_direction: int,
+    ftdi_initial_value: int,
+    ftdi_reset_bit: int,
+    daisy_chain_device_number: int,
+    daisy_chain_device_count: int,
+    output_path: str | pathlib.Path | None,
+    bit_number: int,
+    test_pattern: TestPattern,
+    dwell_time: float,
+    voltage_increment: int,
+    phase_increment: int,
+    jtag_factory: Callable[..., JtagEngine] = JtagEngine,
+    transport: str = "direct",
+    adaptive: bool = False,
+    dwell_policy: DwellPolicy | None = None,
+    output_format: str = "tsv",
+    stream: bool = False,
+    resume: bool = False,
+    streams: tuple[TextIO, ...] = (),
+    session: ScanSession | None = None,
+    plan: ScanPlan | None = None,
+    tuned: bool = False,
+    board_id: str | None = None,
+    receiver_settings: dict | None = None,
+    render: pathlib.Path | None = None,
+    sinks: tuple = ()) -> WriterStatistics:
+    # A plan replaces bit_number and the increments
+    plan = plan or ScanPlan.sweep(bit_number, voltage_increment,
+                                  phase_increment)
+
+    def readout(jtag, chain_state, receiver_blocks, make_batch,
+                completed_rows):
+        # Adaptive and dwell policy readouts add inferred and dwell columns
+        receiver_block, = receiver_blocks
+        if adaptive:
+            return adaptive_readout_receiver_block(
+                jtag, daisy_chain_device_number, daisy_chain_device_count,
+                plan, receiver_block, dwell_time, chain_state, make_batch,
+                dwell_policy, completed_rows)
+        if dwell_policy is not None:
+            return dwell_policy_readout_receiver_block(
+                jtag, daisy_chain_device_number, daisy_chain_device_count,
+                plan, receiver_block, dwell_policy, chain_state, make_batch,
+                completed_rows)
+        return ((daisy_chain_device_number, *sample)
+                for sample in readout_receiver_block(
+                    jtag, daisy_chain_device_number, daisy_chain_device_count,
+                    plan, receiver_block, dwell_time, chain_state, make_batch,
+                    completed_rows))
+
+    return scan_chain(readout, [(receiver_block, )
+                                for receiver_block in plan.receiver_blocks],
+                      plan.select_devices([daisy_chain_device_number]),
+                      plan,
+                      pyftdi_url,
+                      ftdi_jtag_frequency,
+                      ftdi_direction,
+                      ftdi_initial_value,
+                      ftdi_reset_bit,
+                      daisy_chain_device_count,
+                      output_path,
+                      test_pattern,
+                      dwell_time,
+                      jtag_factory=jtag_factory,
+                      transport=transport,
+                      adaptive=adaptive,
+                      output_format=output_format,
+                      stream=stream,
+                      resume=resume,
+                      streams=streams,
+                      session=session,
+                      tuned=tuned,
+                      board_id=board_id,
+                      receiver_settings=receiver_settings,
+                      render=render,
+                      sinks=sinks)
+
+
+def perform_parallel_eyescan(pyftdi_url: str,
+                             ftdi_jtag_frequency: float,
+                             ftdi_direction: int,
+                             ftdi_initial_value: int,
+                             ftdi_reset_bit: int,
+                             daisy_chain_device_count: int,
+                             output_path: str | pathlib.Path | None,
+                             bit_number: int,
+                             test_pattern: TestPattern,
+                             dwell_time: float,
+                             voltage_increment: int,
+                             phase_increment: int,
+                             jtag_factory: Callable[...,
+                                                    JtagEngine] = JtagEngine,
+                             chain_wide: bool = False,
+                             pipelined: bool = False,
+                             transport: str = "direct",
+                             adaptive: bool = False,
+                             dwell_policy: DwellPolicy | None = None,
+                             output_format: str = "tsv",
+                             stream: bool = False,
+                             resume: bool = False,
+                             streams: tuple[TextIO, ...] = (),
+                             session: ScanSession | None = None,
+                             plan: ScanPlan | None = None,
+                             tuned: bool = False,
+                             board_id: str | None = None,
+                             receiver_settings: dict | None = None,
+                             render: pathlib.Path | None = None,
+                             sinks: tuple = (),
+                             **kwargs) -> WriterStatistics:
+    if pipelined and (adaptive or dwell_policy is not None):
+        raise ValueError(
+            "Pipelined readout does not use adaptive scan or a dwell policy")
+    # A plan replaces bit_number and the increments
+    plan = plan or ScanPlan.sweep(bit_number, voltage_increment,
+                                  phase_increment)
+
+    def readout(jtag, chain_state, receiver_blocks, make_batch,
+                completed_rows):
+        if adaptive:
+            return adaptive_readout_receiver_block(jtag, 0,
+                                                   daisy_chain_device_count,
+                                                   plan, receiver_blocks[0],
+                                                   dwell_time, chain_state,
+                                                   make_batch, dwell_policy,
+                                                   completed_rows)
+        if dwell_policy is not None:
+            return dwell_policy_readout_receiver_block(
+                jtag, 0, daisy_chain_device_count, plan, receiver_blocks[0],
+                dwell_policy, chain_state, make_batch, completed_rows)
+        if pipelined:
+            return pipelined_readout_receiver_blocks(
+                jtag, daisy_chain_device_count, plan, receiver_blocks,
+                dwell_time, chain_state, make_batch, completed_rows)
+        readout_func = chain_readout_receiver_block if chain_wide else parallel_readout_receiver_block
+        return readout_func(jtag, daisy_chain_device_count, plan,
+                            receiver_blocks[0], dwell_time, chain_state,
+                            make_batch, completed_rows)
+
+    # Pipelined readout scans both receiver blocks at once
+    if pipelined:
+        receiver_block_sets = [plan.receiver_blocks]
+    else:
+        receiver_block_sets = [(receiver_block, )
+                               for receiver_block in plan.receiver_blocks]
+    return scan_chain(readout,
+                      receiver_block_sets,
+                      plan.select_devices(
+                          range(1, daisy_chain_device_count + 1)),
+                      plan,
+                      pyftdi_url,
+                      ftdi_jtag_frequency,
+                      ftdi_direction,
+                      ftdi_initial_value,
+                      ftdi_reset_bit,
+                      daisy_chain_device_count,
+                      output_path,
+                      test_pattern,
+                      dwell_time,
+                      jtag_factory=jtag_factory,
+                      transport=transport,
+                      adaptive=adaptive,
+                      output_format=output_format,
+                      stream=stream,
+                      resume=resume,
+                      streams=streams,
+                      session=session,
+                      tuned=tuned,
+                      board_id=board_id,
+                      receiver_settings=receiver_settings,
+                      render=render,
+                      sinks=sinks,
+                      reset_state=True)
+
+
+def select_perform_func(parallel: bool, chain_wide: bool,
+                        pipelined: bool) -> Callable[..., WriterStatistics]:
+    perform_eyescan_func = perform_parallel_eyescan if parallel else perform_eyescan
+    if chain_wide:
+        perform_eyescan_func = functools.partial(perform_parallel_eyescan,
+                                                 chain_wide=True)
+    if pipelined:
+        perform_eyescan_func = functools.partial(perform_parallel_eyescan,
+                                                 pipelined=True)
+    return perform_eyescan_func
+
+
+def perform_session_eyescan(runs: list[ScanRun],
+                            perform_eyescan_func: Callable[...,
+                                                           WriterStatistics],
+                            pyftdi_url: str,
+                            ftdi_jtag_frequency: float,
+                            ftdi_direction: int,
+                            ftdi_initial_value: int,
+                            ftdi_reset_bit: int,
+                            daisy_chain_device_count: int,
+                            output_path: str | pathlib.Path,
+                            jtag_factory: Callable[...,
+                                                   JtagEngine] = JtagEngine,
+                            stream: bool = False,
+                            streams: tuple[TextIO, ...] = (),
+                            session: ScanSession | None = None,
+                            **kwargs) -> WriterStatistics:
+    # Scans every run on one session. Samples are written to output_path as
+    # they come, with the run label as the first column, after the header
+    # lines of the runs.
+    scan_session = session or ScanSession(
+        pyftdi_url, ftdi_jtag_frequency, ftdi_direction, ftdi_initial_value,
+        ftdi_reset_bit, daisy_chain_device_count, jtag_factory)
+    statistics = WriterStatistics()
+    try:
+        with open(output_path, "w") as output:
+            output.write("".join(
+                run_header(run, kwargs["dwell_time"]) for run in runs))
+            for run in runs:
+                run_statistics = perform_eyescan_func(
+                    pyftdi_url=pyftdi_url,
+                    ftdi_jtag_frequency=ftdi_jtag_frequency,
+                    ftdi_direction=ftdi_direction,
+                    ftdi_initial_value=ftdi_initial_value,
+                    ftdi_reset_bit=ftdi_reset_bit,
+                    daisy_chain_device_count=daisy_chain_device_count,
+                    output_path=None,
+                    streams=tuple(
+                        TaggedStream(run_stream, run.label)
+                        for run_stream in ((output, ) +
+                                           ((sys.stdout, ) if stream else ()) +
+                                           streams)),
+                    session=scan_session,
+                    **kwargs | run.options())
+                statistics = WriterStatistics(
+                    *(max(total, value) if field.name ==
+                      "max_queue_depth" else total + value
+                      for field, total, value in zip(
+                          dataclasses.fields(WriterStatistics),
+                          dataclasses.astuple(statistics),
+                          dataclasses.astuple(run_statistics))))
+        return statistics
+    finally:
+        if session is None:
+            scan_session.close()
@@ -0,0 +1,70 @@
+import dataclasses
+import json
+import pathlib
+import socket
+from typing import TextIO
+from dwell import DwellPolicy
+from instructions import TestPattern
+from plan import ScanPlan
+
+# Protocol of the scan daemon. A client sends one JSON line with the scan
+# job: the keyword arguments of the perform function and the readout flags.
+# The daemon answers with JSON status lines and streams the samples of the
+# scan as tsv lines in between them, which never start with "{".
+
+
+def encode_job(job: dict) -> str:
+    encoded = dict(job)
+    encoded["test_pattern"] = job["test_pattern"].name
+    if job["dwell_policy"] is not None:
+        encoded["dwell_policy"] = dataclasses.asdict(job["dwell_policy"])
+    if job["plan"] is not None:
+        encoded["plan"] = dataclasses.asdict(job["plan"])
+    # The daemon has its own working directory
+    encoded["output_path"] = str(pathlib.Path(job["output_path"]).absolute())
+    if job["render"] is not None:
+        encoded["render"] = str(pathlib.Path(job["render"]).absolute())
+    return json.dumps(encoded) + "\n"
+
+
+def decode_job(line: str) -> dict:
+    job = json.loads(line)
+    job["test_pattern"] = TestPattern[job["test_pattern"]]
+    if job["dwell_policy"] is not None:
+        job["dwell_policy"] = DwellPolicy(**job["dwell_policy"])
+    if job["plan"] is not None:
+        job["plan"] = ScanPlan.from_dict(job["plan"])
+    job["output_path"] = pathlib.Path(job["output_path"])
+    if job["render"] is not None:
+        job["render"] = pathlib.Path(job["render"])
+    return job
+
+
+def encode_status(**status) -> str:
+    return json.dumps(status) + "\n"
+
+
+def submit_job(socket_path: str | pathlib.Path,
+               job: dict,
+               samples: TextIO | None = None,
+               messages: TextIO | None = None) -> dict:
+    # Returns the final status of the job, samples and queue messages are
+    # written to the given streams while it runs
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(str(socket_path))
+        with connection.makefile("rw") as stream:
+            stream.write(encode_job(job))
+            stream.flush()
+            for line in stream:
+                if not line.startswith("{"):
+                    if samples is not None:
+                        samples.write(line)
+                    continue
+                status = json.loads(line)
+                if "queued" in status:
+                    if messages is not None and status["queued"]:
+                        print(f"Queued behind {status['queued']} scans",
+                              file=messages)
+                    continue
+                return status
+    return {"error": "Daemon closed the connection"}
@@ -0,0 +1,595 @@
+import time
+from dataclasses import dataclass, field
+from pyftdi.bits import BitSequence
+from pyftdi.ftdi import Ftdi
+from pyftdi.jtag import JtagStateMachine
+
+# Software model of a DAC38J8x JTAG daisy-chain, usable in place of
+# pyftdi.jtag.JtagEngine. Device 1 is the one closest to TDI, which matches
+# the padding used by write_ir/shift_dr in scan.py.
+
+IEEE_1500_IR_OPCODE = 0x6D
+IEEE_1500_DR_OPCODE = 0x9B
+RESET_STATE_OPCODE = 0xBE
+BYPASS_OPCODE = 0xFF
+
+WS_BYPASS_OPCODE = 0x00
+WS_CFG_OPCODE = 0x35
+WS_CORE_OPCODE = 0x30
+WS_TUNING_OPCODE = 0x31
+WS_CHAR_OPCODE = 0x33
+
+IR_LENGTH = 8
+WIR_LENGTH = 24
+# Frame lengths for receiver block 0, block 1 frames carry one extra pad bit
+WDR_LENGTHS = {
+    WS_CFG_OPCODE: 27,
+    WS_CORE_OPCODE: 197,
+    WS_TUNING_OPCODE: 175,
+    WS_CHAR_OPCODE: 195,
+}
+LANES_PER_BLOCK = 4
+LANE_STRIDE = 48
+ECOUNT_BITS = 12
+ECOUNT_MAX = (1 << ECOUNT_BITS) - 1
+# Offsets of ws_char fields, counted from the TDO end of a written frame
+CHAR_PHASE_OFFSET = 27
+CHAR_BIT_SELECT_OFFSET = 34
+CHAR_VOLTAGE_OFFSET = 39
+# Offset of the lane 0 ecount LSB, counted from the TDI end of a readback
+CHAR_ECOUNT_OFFSET = 2
+CORE_ENRX_OFFSET = 15
+# Offsets of the lane 0 eq and eqboost fields, every lane is one stride further
+CORE_EQ_OFFSET = 34
+CORE_LANE_STRIDE = 42
+TUNING_EQBOOST_OFFSET = 34
+TUNING_LANE_STRIDE = 37
+# Captured into every IR, LSB first
+IR_CAPTURE = "10000000"
+
+SHIFT_STATES = ('shift_dr', 'shift_ir')
+STABLE_STATES = ('run_test_idle', 'pause_dr', 'pause_ir')
+
+# MPSSE data shifting command bits
+MPSSE_BITS = 0x02
+MPSSE_LSB = 0x08
+MPSSE_WRITE = 0x10
+MPSSE_READ = 0x20
+MPSSE_TMS = 0x40
+MPSSE_FIFO_SIZE = 4096
+# Above max_frequency, every this many TDO bits one comes back inverted
+CORRUPTED_BIT_INTERVAL = 61
+SERIAL_NUMBER = "SIMULATED"
+
+
+class SimulationError(Exception):
+    pass
+
+
+def _field(frame: str, offset: int, length: int, signed=False) -> int:
+    value = int(frame[offset:offset + length][::-1], 2)
+    if signed and value & (1 << (length - 1)):
+        value -= 1 << length
+    return value
+
+
+@dataclass
+class SyntheticEye:
+    height: float
+    width: float
+    voltage_center: float = 0
+    phase_center: float = 0
+    edge: float = 0.5
+    bit_jitter: float = 1
+    dead: bool = False
+    # eq and eqboost the eye is the widest at, every step away from them
+    # shrinks it by detuning
+    eq: int = 1
+    eqboost: int = 0
+    detuning: float = 0.25
+
+    def ecount(self,
+               voltage: int,
+               phase: int,
+               bit_select: int,
+               settings: tuple[int, int] | None = None) -> int:
+        # settings are the (eq, eqboost) of the lane, None for the best ones
+        if self.dead:
+            return ECOUNT_MAX
+        scale = 1
+        if settings is not None:
+            eq, eqboost = settings
+            scale += self.detuning * (abs(eq - self.eq) +
+                                      abs(eqboost - self.eqboost))
+        phase_center = self.phase_center + (
+            (bit_select * 7) % 3 - 1) * self.bit_jitter
+        distance = scale * (abs(voltage - self.voltage_center) / self.height +
+                            abs(phase - phase_center) / self.width)
+        if distance <= 1:
+            return 0
+        return min(ECOUNT_MAX, int(ECOUNT_MAX * (distance - 1) / self.edge))
+
+
+def default_eye(device: int, lane: int) -> SyntheticEye:
+    return SyntheticEye(height=12 + (3 * lane + device) % 5,
+                        width=8 + (lane + 2 * device) % 4)
+
+
+@dataclass
+class SimulationStatistics:
+    ir_shifts: int = 0
+    dr_shifts: int = 0
+    tck_cycles: int = 0
+    usb_round_trips: int = 0
+    bus_time: float = 0
+
+    @property
+    def shifts(self) -> int:
+        return self.ir_shifts + self.dr_shifts
+
+
+@dataclass
+class SimulatedDevice:
+    number: int
+    eyes: list[SyntheticEye]
+    ir: int = BYPASS_OPCODE
+    wir: int = 0
+    registers: dict = field(default_factory=dict)
+    char_point: dict = field(default_factory=dict)
+    enabled: dict = field(default_factory=dict)
+    # Receiver block -> eq and eqboost of every lane
+    eq: dict = field(default_factory=dict)
+    eqboost: dict = field(default_factory=dict)
+
+    def reset(self):
+        self.ir = BYPASS_OPCODE
+        self.wir = 0
+        self.registers.clear()
+        self.char_point.clear()
+        self.enabled.clear()
+        self.eq.clear()
+        self.eqboost.clear()
+
+    def selection(self) -> tuple[int, int]:
+        r0_opcode, r1_opcode = (self.wir >> 8) & 0xff, self.wir & 0xff
+        if r0_opcode != WS_BYPASS_OPCODE and r1_opcode != WS_BYPASS_OPCODE:
+            raise SimulationError(
+                f"device {self.number}: both receiver blocks selected")
+        if r1_opcode != WS_BYPASS_OPCODE:
+            return 1, r1_opcode
+        return 0, r0_opcode
+
+    def dr_length(self) -> int:
+        if self.ir == IEEE_1500_IR_OPCODE:
+            return WIR_LENGTH
+        if self.ir != IEEE_1500_DR_OPCODE:
+            return 1
+        receiver_block, opcode = self.selection()
+        if opcode not in WDR_LENGTHS:
+            return 1
+        return WDR_LENGTHS[opcode] + receiver_block
+
+    def ecounts(self, receiver_block: int) -> list[int]:
+        if receiver_block not in self.char_point:
+            return [ECOUNT_MAX] * LANES_PER_BLOCK
+        voltage, phase, bit_select = self.char_point[receiver_block]
+        if not self.enabled.get(receiver_block, False):
+            return [ECOUNT_MAX] * LANES_PER_BLOCK
+        eq = self.eq.get(receiver_block)
+        eqboost = self.eqboost.get(receiver_block)
+        return [
+            self.eyes[lane + LANES_PER_BLOCK * receiver_block].ecount(
+                voltage, phase, bit_select,
+                None if eq is None or eqboost is None else
+                (eq[lane], eqboost[lane])) for lane in range(LANES_PER_BLOCK)
+        ]
+
+    def capture_dr(self) -> str:
+        length = self.dr_length()
+        if self.ir == IEEE_1500_IR_OPCODE:
+            return format(self.wir, f'0{WIR_LENGTH}b')[::-1]
+        if self.ir != IEEE_1500_DR_OPCODE or length == 1:
+            return "0" * length
+        receiver_block, opcode = self.selection()
+        if opcode != WS_CHAR_OPCODE:
+            return self.registers.get((receiver_block, opcode), "0" * length)
+        readback = ["0"] * length
+        for lane, ecount in enumerate(self.ecounts(receiver_block)):
+            for bit in range(ECOUNT_BITS):
+                if ecount >> bit & 1:
+                    readback[length - 1 - CHAR_ECOUNT_OFFSET -
+                             LANE_STRIDE * lane - bit] = "1"
+        return "".join(readback)
+
+    def update_dr(self, frame: str):
+        if self.ir == IEEE_1500_IR_OPCODE:
+            self.wir = int(frame[::-1], 2)
+            return
+        if self.ir != IEEE_1500_DR_OPCODE or len(frame) == 1:
+            return
+        receiver_block, opcode = self.selection()
+        self.registers[(receiver_block, opcode)] = frame
+        frame = frame[:WDR_LENGTHS[opcode]][::-1]
+        if opcode == WS_CORE_OPCODE:
+            self.enabled[receiver_block] = frame[CORE_ENRX_OFFSET] == "1"
+            self.eq[receiver_block] = tuple(
+                _field(frame, CORE_EQ_OFFSET + CORE_LANE_STRIDE * lane, 3)
+                for lane in range(LANES_PER_BLOCK))
+        elif opcode == WS_TUNING_OPCODE:
+            self.eqboost[receiver_block] = tuple(
+                _field(frame, TUNING_EQBOOST_OFFSET +
+                       TUNING_LANE_STRIDE * lane, 2)
+                for lane in range(LANES_PER_BLOCK))
+        elif opcode == WS_CHAR_OPCODE:
+            self.char_point[receiver_block] = (_field(frame,
+                                                      CHAR_VOLTAGE_OFFSET,
+                                                      6,
+                                                      signed=True),
+                                               _field(frame,
+                                                      CHAR_PHASE_OFFSET,
+                                                      7,
+                                                      signed=True),
+                                               _field(frame,
+                                                      CHAR_BIT_SELECT_OFFSET,
+                                                      5))
+
+
+class SimulatedChain:
+    """Bit-level model of the TAP controllers of a daisy-chain. All devices
+    share TCK and TMS, so a single state machine tracks every one of them."""
+
+    def __init__(self,
+                 devices: list[SimulatedDevice],
+                 frequency: float,
+                 statistics: SimulationStatistics,
+                 shift_latency: float = 0,
+                 usb_latency: float = 0,
+                 max_frequency: float | None = None,
+                 realtime: bool = True):
+        self.devices = devices
+        self.frequency = frequency
+        self.statistics = statistics
+        self.shift_latency = shift_latency
+        self.usb_latency = usb_latency
+        self.max_frequency = max_frequency
+        self.realtime = realtime
+        self._tdo_bits = 0
+        self._sm = JtagStateMachine()
+        self._register = ""
+        self._shifted = 0
+        self._pending_sleep = 0
+
+    def state(self) -> str:
+        return str(self._sm.state())
+
+    def clock(self, tms: int, tdi: int = 0) -> int:
+        tdo = "0"
+        if self.state() in SHIFT_STATES:
+            tdo = self._shift_bits(str(tdi))
+        self._spend_cycles(1)
+        self._sm.handle_events([tms])
+        self._enter(self.state())
+        return int(tdo)
+
+    def shift(self, bits: str) -> str:
+        # TMS is held low, which keeps the TAP in any of the stable states
+        state = self.state()
+        if state in SHIFT_STATES:
+            self._spend_cycles(len(bits))
+            return self._shift_bits(bits)
+        if state in STABLE_STATES:
+            self._spend_cycles(len(bits))
+            return "0" * len(bits)
+        return "".join(str(self.clock(0, int(bit))) for bit in bits)
+
+    def round_trip(self):
+        self.statistics.usb_round_trips += 1
+        self.spend(self.usb_latency)
+
+    def spend(self, seconds: float):
+        self.statistics.bus_time += seconds
+        if not self.realtime:
+            return
+        self._pending_sleep += seconds
+        if self._pending_sleep >= 1E-3:
+            self.flush()
+
+    def flush(self):
+        if self._pending_sleep > 0:
+            time.sleep(self._pending_sleep)
+        self._pending_sleep = 0
+
+    def _spend_cycles(self, cycles: int):
+        self.statistics.tck_cycles += cycles
+        self.spend(cycles / self.frequency)
+
+    def _shift_bits(self, bits: str) -> str:
+        register = self._register + bits
+        self._register = register[len(bits):]
+        self._shifted += len(bits)
+        tdo = register[:len(bits)]
+        if self.max_frequency is not None and self.frequency > self.max_frequency:
+            tdo = "".join(
+                str(
+                    int(bit)
+                    ^ ((self._tdo_bits + index) % CORRUPTED_BIT_INTERVAL == 0))
+                for index, bit in enumerate(tdo))
+        self._tdo_bits += len(bits)
+        return tdo
+
+    def _enter(self, state: str):
+        if state == 'test_logic_reset':
+            for device in self.devices:
+                device.ir = BYPASS_OPCODE
+        elif state == 'capture_ir':
+            self._capture(IR_CAPTURE * len(self.devices))
+        elif state == 'capture_dr':
+            self._capture("".join(device.capture_dr()
+                                  for device in reversed(self.devices)))
+        elif state == 'update_ir':
+            self._check_shift("IR")
+            self.statistics.ir_shifts += 1
+            for position, device in enumerate(reversed(self.devices)):
+                device.ir = int(
+                    self._register[position * IR_LENGTH:(position + 1) *
+                                   IR_LENGTH][::-1], 2)
+        elif state == 'update_dr':
+            self._check_shift("DR")
+            self.statistics.dr_shifts += 1
+            position = 0
+            for device in reversed(self.devices):
+                length = device.dr_length()
+                device.update_dr(self._register[position:position + length])
+                position += length
+
+    def _capture(self, register: str):
+        self._register = register
+        self._shifted = 0
+
+    def _check_shift(self, name: str):
+        # Longer shifts through the bypass registers only pass data through
+        bypass = name == "DR" and all(device.ir == BYPASS_OPCODE
+                                      for device in self.devices)
+        if self._shifted != len(self._register) and not (
+                bypass and self._shifted > len(self._register)):
+            raise SimulationError(
+                f"{name} shift of {self._shifted} bits, chain expects "
+                f"{len(self._register)}")
+        self.spend(self.shift_latency)
+
+
+@dataclass
+class SimulatedUsbDevice:
+    serial_number: str = SERIAL_NUMBER
+
+
+class SimulatedFtdi:
+    """MPSSE command interpreter in front of a SimulatedChain, standing in
+    for the parts of pyftdi.ftdi.Ftdi used to drive JTAG."""
+
+    def __init__(self, chain: SimulatedChain):
+        self.chain = chain
+        self._read_buffer = bytearray()
+        self._usb_dev = SimulatedUsbDevice()
+
+    @property
+    def is_connected(self) -> bool:
+        return True
+
+    @property
+    def usb_dev(self) -> SimulatedUsbDevice:
+        return self._usb_dev
+
+    def set_frequency(self, frequency: float) -> float:
+        self.chain.frequency = frequency
+        return frequency
+
+    @property
+    def fifo_sizes(self) -> tuple[int, int]:
+        return MPSSE_FIFO_SIZE, MPSSE_FIFO_SIZE
+
+    def purge_buffers(self):
+        self._read_buffer.clear()
+
+    def write_data(self, data: bytes | bytearray) -> int:
+        position = 0
+        while position < len(data):
+            position = self._execute(data, position)
+        return len(data)
+
+    def read_data_bytes(self,
+                        size: int,
+                        attempt: int = 1,
+                        request_gen=None) -> bytearray:
+        self.chain.round_trip()
+        data = self._read_buffer[:size]
+        del self._read_buffer[:size]
+        return data
+
+    def _execute(self, data: bytes | bytearray, position: int) -> int:
+        opcode = data[position]
+        if opcode & 0x80:
+            return self._execute_control(data, position)
+        if not opcode & MPSSE_LSB:
+            raise SimulationError(f"MSB first MPSSE command 0x{opcode:02x}")
+        read = opcode & MPSSE_READ
+        if opcode & MPSSE_TMS:
+            length = data[position + 1] + 1
+            byte = data[position + 2]
+            value = 0
+            for bit in range(length):
+                tdo = self.chain.clock((byte >> bit) & 1, byte >> 7)
+                value = (value >> 1) | (tdo << 7)
+            if read:
+                self._read_buffer.append(value)
+            return position + 3
+        write = opcode & MPSSE_WRITE
+        if opcode & MPSSE_BITS:
+            length = data[position + 1] + 1
+            byte = data[position + 2] if write else 0
+            tdo = self.chain.shift(format(byte, '08b')[::-1][:length])
+            if read:
+                self._read_buffer.append(int(tdo[::-1], 2) << (8 - length))
+            return position + 3 if write else position + 2
+        length = (data[position + 1] | data[position + 2] << 8) + 1
+        payload = data[position + 3:position + 3 +
+                       length] if write else bytes(length)
+        tdo = self.chain.shift(
+            format(int.from_bytes(payload, 'little'), f'0{8 * length}b')[::-1])
+        if read:
+            self._read_buffer.extend(
+                int(tdo[::-1], 2).to_bytes(length, 'little'))
+        return position + 3 + length if write else position + 3
+
+    def _execute_control(self, data: bytes | bytearray, position: int) -> int:
+        opcode = data[position]
+        if opcode == Ftdi.CLK_BITS_NO_DATA:
+            self.chain.shift("0" * (data[position + 1] + 1))
+            return position + 2
+        if opcode == Ftdi.CLK_BYTES_NO_DATA:
+            self.chain.shift(
+                "0" * 8 * ((data[position + 1] | data[position + 2] << 8) + 1))
+            return position + 3
+        if opcode in (Ftdi.SET_BITS_LOW, Ftdi.SET_BITS_HIGH,
+                      Ftdi.SET_TCK_DIVISOR):
+            return position + 3
+        if opcode in (Ftdi.SEND_IMMEDIATE, Ftdi.LOOPBACK_START,
+                      Ftdi.LOOPBACK_END, Ftdi.DISABLE_CLK_DIV5,
+                      Ftdi.ENABLE_CLK_DIV5, Ftdi.ENABLE_CLK_3PHASE,
+                      Ftdi.DISABLE_CLK_3PHASE, Ftdi.DISABLE_CLK_ADAPTIVE):
+            return position + 1
+        raise SimulationError(f"Unsupported MPSSE command 0x{opcode:02x}")
+
+
+class SimulatedJtagController:
+
+    def __init__(self, ftdi: SimulatedFtdi):
+        self._ftdi = ftdi
+
+    @property
+    def ftdi(self) -> SimulatedFtdi:
+        return self._ftdi
+
+    def sync(self):
+        pass
+
+    def purge(self):
+        self._ftdi.purge_buffers()
+
+
+class SimulatedJtagEngine:
+    """Drop-in replacement for pyftdi.jtag.JtagEngine driving a simulated
+    chain of DAC38J8x devices."""
+
+    def __init__(self,
+                 frequency: float = 3E06,
+                 direction: int = 0,
+                 initial: int = 0,
+                 rst_bit: int = 0,
+                 device_count: int = 1,
+                 shift_latency: float = 0,
+                 usb_latency: float = 0,
+                 eyes: dict[tuple[int, int], SyntheticEye] | None = None,
+                 max_frequency: float | None = None,
+                 realtime: bool = True):
+        self.frequency = frequency
+        self.statistics = SimulationStatistics()
+        eyes = eyes or {}
+        self.devices = []
+        for number in range(1, device_count + 1):
+            self.devices.append(
+                SimulatedDevice(number, [
+                    eyes.get((number, lane), default_eye(number, lane))
+                    for lane in range(2 * LANES_PER_BLOCK)
+                ]))
+        # max_frequency models a cable that corrupts TDO above it, without
+        # realtime the chain keeps its time without sleeping
+        self.chain = SimulatedChain(self.devices, frequency, self.statistics,
+                                    shift_latency, usb_latency, max_frequency,
+                                    realtime)
+        self._ctrl = SimulatedJtagController(SimulatedFtdi(self.chain))
+        self._sm = JtagStateMachine()
+        self._last = 0
+        self._configured = False
+
+    @property
+    def state_machine(self):
+        return self._sm
+
+    @property
+    def controller(self) -> SimulatedJtagController:
+        return self._ctrl
+
+    def eye(self, device: int, lane: int) -> SyntheticEye:
+        return self.devices[device - 1].eyes[lane]
+
+    def configure(self, url: str):
+        self._configured = True
+
+    def close(self, freeze: bool = False):
+        self.chain.flush()
+        self._configured = False
+
+    def purge(self):
+        self._ctrl.purge()
+
+    def sync(self):
+        self.chain.flush()
+
+    def wait(self, seconds: float):
+        # Dwell of the host with TCK stopped, on the simulated clock
+        self.chain.spend(seconds)
+        self.chain.flush()
+
+    def reset(self, hw_reset: bool = False, tap_reset: bool = True):
+        if not self._configured:
+            raise SimulationError("JTAG engine not configured")
+        if hw_reset:
+            for device in self.devices:
+                device.reset()
+        self._write_tms(BitSequence('11111'))
+        self._sm.reset()
+
+    def change_state(self, statename: str):
+        events = self._sm.get_events(self._sm.find_path(statename))
+        self._write_tms(events)
+        self._sm.handle_events(events)
+
+    def go_idle(self):
+        self.change_state('run_test_idle')
+
+    def write_ir(self, instruction: BitSequence):
+        self.change_state('shift_ir')
+        self._write(instruction)
+        self.change_state('update_ir')
+
+    def write_dr(self, data: BitSequence):
+        self.change_state('shift_dr')
+        self._write(data)
+        self.change_state('update_dr')
+
+    def shift_and_update_register(self, out: BitSequence) -> BitSequence:
+        if not self._sm.state_of('shift'):
+            raise SimulationError(f'Invalid state: {self._sm.state()}')
+        if self._sm.state_of('capture'):
+            self._write_tms(BitSequence(False))
+            self._sm.handle_events(BitSequence(False))
+        readback = self._write(out)
+        events = BitSequence('11')
+        readback += str(self.chain.clock(1, self._last))
+        self._last = 0
+        self.chain.clock(1)
+        self._sm.handle_events(events)
+        self.chain.round_trip()
+        return BitSequence(readback, msb=False)
+
+    def _write(self, out: BitSequence) -> str:
+        # The last bit is clocked together with the TMS leaving the shift
+        bits = repr(out)[::-1]
+        self._last = int(bits[-1])
+        return self.chain.shift(bits[:-1])
+
+    def _write_tms(self, events: BitSequence):
+        for event in events:
+            self.chain.clock(int(event), self._last)
+            self._last = 0
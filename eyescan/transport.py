@@ -0,0 +1,207 @@
+import functools
+import time
+from typing import Callable
+from pyftdi.bits import BitSequence
+from pyftdi.ftdi import Ftdi
+from pyftdi.jtag import JtagEngine, JtagError
+from instrumentation import profiled
+
+# Batched JTAG transports. A batch queues IR writes, DR shifts and idle waits
+# and runs them in order on execute(). DR readbacks are returned with the
+# first bit shifted out as the MSB, like shift_encoded_dr in scan.py.
+
+TRANSPORTS = ("direct", "mpsse")
+
+WRITE_IR = 0
+SHIFT_DR = 1
+IDLE = 2
+
+# TMS sequences, first bit in the LSB, all of them start and end in
+# run_test_idle
+TMS_IDLE_TO_SHIFT_DR = (3, 0b001)
+TMS_IDLE_TO_SHIFT_IR = (4, 0b0011)
+TMS_SHIFT_TO_IDLE = (3, 0b011)
+# The last bit of a shift is clocked on the first TMS clock of the shift exit,
+# which leaves shift_dr/shift_ir. Bit reads shift every sampled TDO bit in at
+# the MSB, so after the TMS_SHIFT_TO_IDLE clocks that first sample is at bit
+# 8 - length of the byte read back.
+TMS_LAST_BIT_OFFSET = 8 - TMS_SHIFT_TO_IDLE[0]
+MAX_BYTES_PER_COMMAND = 0x10000
+COMMAND_CACHE_SIZE = 1 << 12
+READ_TIMEOUT = 1
+
+
+class JtagBatch:
+    """Runs the queued operations one by one through the JtagEngine."""
+
+    def __init__(self, jtag: JtagEngine):
+        self.jtag = jtag
+        self.operations = []
+        self.shift_count = 0
+
+    def write_ir(self, instruction: BitSequence):
+        self.operations.append((WRITE_IR, instruction))
+
+    def shift_dr(self, data: BitSequence) -> int:
+        # Returns the index of the readback in the list returned by execute
+        self.operations.append((SHIFT_DR, data))
+        self.shift_count += 1
+        return self.shift_count - 1
+
+    def idle(self, seconds: float):
+        if seconds > 0:
+            self.operations.append((IDLE, seconds))
+
+    @profiled("batch")
+    def execute(self) -> list[int]:
+        readbacks = []
+        for operation, argument in self.operations:
+            if operation == WRITE_IR:
+                self.jtag.write_ir(argument)
+            elif operation == SHIFT_DR:
+                self.jtag.change_state('shift_dr')
+                readback = self.jtag.shift_and_update_register(argument)
+                self.jtag.go_idle()
+                readbacks.append(int(readback.reverse()))
+            else:
+                dwell(argument, self.jtag)
+        return readbacks
+
+
+class MpsseBatch(JtagBatch):
+    """Compiles the queued operations into a single MPSSE command buffer. It
+    is sent with one USB write and its readbacks are collected with one bulk
+    read, split further only when they would overflow the FTDI FIFO."""
+
+    def __init__(self, jtag: JtagEngine, frequency: float):
+        super().__init__(jtag)
+        self.frequency = frequency
+
+    @profiled("batch")
+    def execute(self) -> list[int]:
+        # Hand the TAP over in run_test_idle, with pyftdi's buffer flushed
+        self.jtag.go_idle()
+        self.jtag.controller.sync()
+        ftdi = self.jtag.controller.ftdi
+        fifo_size = min(ftdi.fifo_sizes)
+        readbacks = []
+        commands = bytearray()
+        lengths = []
+        read_size = 0
+        # Approximate TCK count of the pending commands, for the read deadline
+        cycles = 0
+        for operation, argument in self.operations:
+            if operation == WRITE_IR:
+                commands += shift_commands(int(argument), len(argument), False)
+                cycles += len(argument) + TMS_IDLE_TO_SHIFT_IR[0]
+            elif operation == SHIFT_DR:
+                size = dr_read_size(len(argument))
+                if lengths and read_size + size > fifo_size:
+                    readbacks += self._transfer(ftdi, commands, lengths,
+                                                read_size, cycles)
+                    commands = bytearray()
+                    lengths = []
+                    read_size = 0
+                    cycles = 0
+                commands += shift_commands(int(argument), len(argument), True)
+                lengths.append(len(argument))
+                read_size += size
+                cycles += len(argument) + TMS_IDLE_TO_SHIFT_DR[0]
+            else:
+                idle_cycles = max(round(argument * self.frequency), 1)
+                commands += idle_commands(idle_cycles)
+                cycles += idle_cycles
+        if commands:
+            readbacks += self._transfer(ftdi, commands, lengths, read_size,
+                                        cycles)
+        return readbacks
+
+    @profiled(
+        "usb_transfer",
+        bits=lambda self, ftdi, commands, lengths, read_size, cycles: cycles,
+        size=lambda self, ftdi, commands, lengths, read_size, cycles: len(
+            commands) + read_size)
+    def _transfer(self, ftdi: Ftdi, commands: bytearray, lengths: list[int],
+                  read_size: int, cycles: int) -> list[int]:
+        commands.append(Ftdi.SEND_IMMEDIATE)
+        ftdi.write_data(commands)
+        data = bytearray()
+        deadline = time.monotonic() + cycles / self.frequency + READ_TIMEOUT
+        while len(data) < read_size:
+            data += ftdi.read_data_bytes(read_size - len(data), 4)
+            if len(data) < read_size and time.monotonic() > deadline:
+                raise JtagError(
+                    f"Read {len(data)} of {read_size} MPSSE readback bytes")
+        return split_readbacks(data, lengths)
+
+
+@profiled("dwell")
+def dwell(seconds: float, jtag: JtagEngine | None = None):
+    # Simulated engines keep their own clock
+    getattr(jtag, "wait", time.sleep)(seconds)
+
+
+def dr_read_size(length: int) -> int:
+    # Full bytes, the remaining bits and the last bit read with TMS
+    return (length - 1) // 8 + ((length - 1) % 8 != 0) + 1
+
+
+@functools.lru_cache(maxsize=COMMAND_CACHE_SIZE)
+def shift_commands(value: int, length: int, read: bool) -> bytes:
+    # value holds the first bit shifted in as the LSB, read selects a DR
+    # shift with readback, otherwise an IR write
+    tms_length, tms = TMS_IDLE_TO_SHIFT_DR if read else TMS_IDLE_TO_SHIFT_IR
+    commands = bytearray((Ftdi.WRITE_BITS_TMS_NVE, tms_length - 1, tms))
+    byte_count, bit_count = divmod(length - 1, 8)
+    if byte_count:
+        commands += bytes(
+            (Ftdi.RW_BYTES_PVE_NVE_LSB if read else Ftdi.WRITE_BYTES_NVE_LSB,
+             (byte_count - 1) & 0xff, (byte_count - 1) >> 8))
+        commands += (value & ((1 << 8 * byte_count) - 1)).to_bytes(
+            byte_count, 'little')
+    if bit_count:
+        commands += bytes(
+            (Ftdi.RW_BITS_PVE_NVE_LSB if read else Ftdi.WRITE_BITS_NVE_LSB,
+             bit_count - 1, (value >> 8 * byte_count) & 0xff))
+    tms_length, tms = TMS_SHIFT_TO_IDLE
+    commands += bytes(
+        (Ftdi.RW_BITS_TMS_PVE_NVE if read else Ftdi.WRITE_BITS_TMS_NVE,
+         tms_length - 1, tms | ((value >> (length - 1)) & 1) << 7))
+    return bytes(commands)
+
+
+def idle_commands(cycles: int) -> bytes:
+    commands = bytearray()
+    byte_count, bit_count = divmod(cycles, 8)
+    while byte_count:
+        count = min(byte_count, MAX_BYTES_PER_COMMAND)
+        commands += bytes(
+            (Ftdi.CLK_BYTES_NO_DATA, (count - 1) & 0xff, (count - 1) >> 8))
+        byte_count -= count
+    if bit_count:
+        commands += bytes((Ftdi.CLK_BITS_NO_DATA, bit_count - 1))
+    return bytes(commands)
+
+
+def split_readbacks(data: bytearray, lengths: list[int]) -> list[int]:
+    readbacks = []
+    position = 0
+    for length in lengths:
+        byte_count, bit_count = divmod(length - 1, 8)
+        value = int.from_bytes(data[position:position + byte_count], 'little')
+        position += byte_count
+        if bit_count:
+            value |= (data[position] >> (8 - bit_count)) << 8 * byte_count
+            position += 1
+        value |= ((data[position] >> TMS_LAST_BIT_OFFSET) & 1) << (length - 1)
+        position += 1
+        # Bits arrive first-out first, readbacks keep the first-out as MSB
+        readbacks.append(int(format(value, f'0{length}b')[::-1], 2))
+    return readbacks
+
+
+def batch_factory(transport: str,
+                  frequency: float) -> Callable[[JtagEngine], JtagBatch]:
+    if transport == "mpsse":
+        return functools.partial(MpsseBatch, frequency=frequency)
+    return JtagBatch
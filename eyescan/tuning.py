@@ -0,0 +1,336 @@
+import argparse
+import dataclasses
+import itertools
+import pathlib
+import sys
+import tempfile
+from typing import Callable, TextIO
+import numpy
+from analysis import DEFAULT_BIT_RATE, eye_metrics, load_binary, worst_bit
+from calibration import cached_receiver_settings, store_receiver_settings
+from scan import ScanSession, select_perform_func
+from instructions import LANES, ReceiverSettings, TestPattern
+from plan import ScanPlan
+from transport import TRANSPORTS
+
+# Receiver tuning. Every receiver block of the chain searches its candidate
+# settings at the same time, by successive halving: a round scans all the
+# candidates left with a cheap proxy plan, a few phase columns of a single
+# bit, and keeps the better half by the eye area of their worst lane. Every
+# round the proxy plan gets finer. The last TOP candidates get a full scan,
+# and the best one of every receiver block is cached for the board and chain
+# length.
+
+# Voltage and phase steps of the proxy plan of every round, later rounds
+# keep the last ones
+PROXY_STEPS = ((4, 8), (2, 4), (1, 2))
+# Proxy phase columns span this many phase steps on both sides of phase 0
+PROXY_PHASE_SPAN = 8
+DEFAULT_THRESHOLD = 1E-12
+DEFAULT_TOP = 2
+
+
+def candidate_space(eqs: list[int], eqboosts: list[int],
+                    cdrs: list[int]) -> list[ReceiverSettings]:
+    # The default settings come first, so they win ties
+    default = ReceiverSettings()
+    space = [
+        dataclasses.replace(default, eq=eq, eqboost=eqboost, cdr=cdr)
+        for eq, eqboost, cdr in itertools.product(eqs, eqboosts, cdrs)
+    ]
+    return sorted(dict.fromkeys(space),
+                  key=lambda settings: settings != default)
+
+
+def proxy_plan(round_number: int, bit: int) -> ScanPlan:
+    voltage_step, phase_step = PROXY_STEPS[min(round_number,
+                                               len(PROXY_STEPS) - 1)]
+    return ScanPlan(
+        tuple(range(31, -33, -voltage_step)),
+        tuple(range(PROXY_PHASE_SPAN, -PROXY_PHASE_SPAN - 1, -phase_step)),
+        (bit, ))
+
+
+def block_areas(area: numpy.ndarray,
+                keys: list[tuple[int, int]]) -> dict[tuple[int, int], float]:
+    # area is (device, lane) of devices 1 to N, the worst lane of every
+    # (device, receiver block)
+    return {
+        (device, receiver_block):
+        float(area[device - 1,
+                   receiver_block * LANES:(receiver_block + 1) * LANES].min())
+        for device, receiver_block in keys
+    }
+
+
+def score_candidates(
+    scan: Callable[[ScanPlan, dict], numpy.ndarray], plan: ScanPlan,
+    candidates: dict[tuple[int, int], list[ReceiverSettings]]
+) -> dict[tuple[int, int], list[float]]:
+    # Every receiver block has as many candidates, scan i configures every
+    # receiver block with its candidate i
+    scores = {key: [] for key in candidates}
+    for index in range(len(next(iter(candidates.values())))):
+        areas = block_areas(
+            scan(plan, {
+                key: settings[index]
+                for key, settings in candidates.items()
+            }), list(candidates))
+        for key, area in areas.items():
+            scores[key].append(area)
+    return scores
+
+
+def best(scores: list[float], count: int) -> list[int]:
+    # Indices of the count best scores in candidate order, earlier
+    # candidates win ties
+    ranked = sorted(range(len(scores)), key=lambda index: -scores[index])
+    return sorted(ranked[:count])
+
+
+def tune(scan: Callable[[ScanPlan, dict], numpy.ndarray],
+         keys: list[tuple[int, int]],
+         space: list[ReceiverSettings],
+         full_plan: ScanPlan,
+         bit: int = 0,
+         top: int = DEFAULT_TOP,
+         log: TextIO | None = None) -> dict[tuple[int, int], ReceiverSettings]:
+    # scan returns the worst-bit (device, lane) eye areas of a plan scanned
+    # with receiver settings by (device, receiver block)
+    candidates = {key: list(space) for key in keys}
+    count = len(space)
+    round_number = 0
+    while count > top:
+        plan = proxy_plan(round_number, bit)
+        if log is not None:
+            print(
+                f"Round {round_number + 1}: {count} candidates, "
+                f"{len(plan.voltages)} voltages and {len(plan.phases)} phases "
+                f"of bit {bit}",
+                file=log)
+        scores = score_candidates(scan, plan, candidates)
+        count = max(top, (count + 1) // 2)
+        candidates = {
+            key: [settings[index] for index in best(scores[key], count)]
+            for key, settings in candidates.items()
+        }
+        round_number += 1
+    if log is not None:
+        print(f"Full scans of {count} candidates", file=log)
+    scores = score_candidates(scan, full_plan, candidates)
+    return {
+        key: settings[best(scores[key], 1)[0]]
+        for key, settings in candidates.items()
+    }
+
+
+def report_settings(settings: dict[tuple[int, int], ReceiverSettings],
+                    file: TextIO):
+    names = [field.name for field in dataclasses.fields(ReceiverSettings)]
+    file.write("\t".join(["device", "receiver_block", *names]) + "\n")
+    for (device,
+         receiver_block), receiver_settings in sorted(settings.items()):
+        values = [int(getattr(receiver_settings, name)) for name in names]
+        file.write("\t".join(map(str, [device, receiver_block, *values])) +
+                   "\n")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog='eyescan-tune',
+        description='TI DAC Eyescan receiver tuning',
+        epilog=
+        'Searches the eq, eqboost and cdr settings of every receiver block for the widest eye of a board and caches them for eyescan --tuned'
+    )
+    parser.add_argument('-c',
+                        '--daisy-chain-count',
+                        type=int,
+                        default=1,
+                        help="how many devices in JTAG daisy-chain")
+    parser.add_argument('-b',
+                        '--bit-number',
+                        type=int,
+                        default=20,
+                        help="how many bits the full scans check")
+    parser.add_argument('--voltage-increment',
+                        type=int,
+                        default=1,
+                        help="voltage offset increment of the full scans")
+    parser.add_argument('--phase-increment',
+                        type=int,
+                        default=1,
+                        help="phase offset increment of the full scans")
+    parser.add_argument('--bit',
+                        type=int,
+                        default=0,
+                        help="bit select of the proxy scans")
+    parser.add_argument('-t',
+                        '--dwell-time',
+                        type=lambda x: float(x) / 1000,
+                        default=0,
+                        help="Dwell time in miliseconds")
+    parser.add_argument(
+        '-f',
+        '--ftdi-jtag-frequency',
+        type=lambda x: None if x == "auto" else float(x),
+        default=1E5,
+        help=
+        "frequency of JTAG clk, auto for the one calibrated for the adapter and chain length"
+    )
+    parser.add_argument('-d',
+                        '--ftdi-direction',
+                        type=lambda x: int(x, 0),
+                        default=0x308B,
+                        help="initial direction of GPIO pins")
+    parser.add_argument('-v',
+                        '--ftdi-initial-value',
+                        type=lambda x: int(x, 0),
+                        default=0x2088,
+                        help="initial value of GPIO pins")
+    parser.add_argument('-r',
+                        '--ftdi-reset-bit',
+                        type=lambda x: int(x, 0),
+                        default=0x2000,
+                        help="GPIO reset pin bitmask")
+    parser.add_argument(
+        '--board-id',
+        type=str,
+        required=True,
+        help=
+        "identifier of the board the settings are cached for, e.g. its serial number"
+    )
+    parser.add_argument('-u',
+                        '--pyftdi-url',
+                        type=str,
+                        default='ftdi:///1',
+                        help="pyftdi connection URL")
+    parser.add_argument('-p',
+                        '--test-pattern',
+                        choices=[pattern.name for pattern in TestPattern],
+                        default=TestPattern.PRBS_7_BIT.name,
+                        help="eyescan test pattern")
+    parser.add_argument('--eq',
+                        type=int,
+                        nargs='+',
+                        default=list(range(8)),
+                        help="ws_core eq values to search")
+    parser.add_argument('--eqboost',
+                        type=int,
+                        nargs='+',
+                        default=list(range(4)),
+                        help="ws_tuning eqboost values to search")
+    parser.add_argument('--cdr',
+                        type=int,
+                        nargs='+',
+                        default=[0],
+                        help="ws_core cdr values to search")
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=DEFAULT_TOP,
+        help="how many candidates of every receiver block get a full scan")
+    parser.add_argument(
+        '-T',
+        '--threshold',
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="BER threshold of the contour whose area is maximised")
+    parser.add_argument('--bit-rate',
+                        type=float,
+                        default=DEFAULT_BIT_RATE,
+                        help="bits per second checked by the error counter")
+    parser.add_argument(
+        '--chain-wide',
+        action='store_true',
+        help="Read all DACs in daisy-chain with a single DR shift")
+    parser.add_argument(
+        '--pipelined',
+        action='store_true',
+        help=
+        "Arm both receiver blocks of all DACs in daisy-chain and share one dwell window between them"
+    )
+    parser.add_argument(
+        '--transport',
+        choices=TRANSPORTS,
+        default="direct",
+        help=
+        "JTAG transport, mpsse sends every voltage/bit row of the scan as one USB transfer"
+    )
+    parser.add_argument(
+        '--retune',
+        action='store_true',
+        help="Search again even if the adapter already has tuned settings")
+    args = parser.parse_args()
+    args.test_pattern = TestPattern[args.test_pattern]
+    if args.top < 1:
+        parser.error("--top must be at least 1")
+    if not all(value in range(8) for value in args.eq + args.cdr) or not all(
+            value in range(4) for value in args.eqboost):
+        parser.error("--eq and --cdr are 0-7, --eqboost 0-3")
+    try:
+        args.plan = ScanPlan.sweep(args.bit_number, args.voltage_increment,
+                                   args.phase_increment)
+        proxy_plan(0, args.bit)
+    except ValueError as error:
+        parser.error(str(error))
+    return args
+
+
+def main():
+    args = parse_args()
+    session = ScanSession(args.pyftdi_url, args.ftdi_jtag_frequency,
+                          args.ftdi_direction, args.ftdi_initial_value,
+                          args.ftdi_reset_bit, args.daisy_chain_count)
+    perform_eyescan_func = select_perform_func(True, args.chain_wide,
+                                               args.pipelined)
+
+    def scan(plan: ScanPlan, receiver_settings: dict) -> numpy.ndarray:
+        with tempfile.TemporaryDirectory() as directory:
+            output_path = pathlib.Path(directory) / "tuning.bin"
+            perform_eyescan_func(
+                pyftdi_url=args.pyftdi_url,
+                ftdi_jtag_frequency=args.ftdi_jtag_frequency,
+                ftdi_direction=args.ftdi_direction,
+                ftdi_initial_value=args.ftdi_initial_value,
+                ftdi_reset_bit=args.ftdi_reset_bit,
+                daisy_chain_device_count=args.daisy_chain_count,
+                output_path=output_path,
+                bit_number=args.bit_number,
+                test_pattern=args.test_pattern,
+                dwell_time=args.dwell_time,
+                voltage_increment=args.voltage_increment,
+                phase_increment=args.phase_increment,
+                transport=args.transport,
+                output_format="binary",
+                session=session,
+                plan=plan,
+                receiver_settings=receiver_settings)
+            metrics, _ = worst_bit(
+                eye_metrics(load_binary(output_path), [args.threshold],
+                            args.bit_rate))
+            return metrics.area[0]
+
+    try:
+        settings = None if args.retune else cached_receiver_settings(
+            args.board_id, args.daisy_chain_count)
+        if settings is None:
+            keys = [(device, receiver_block)
+                    for device in range(1, args.daisy_chain_count + 1)
+                    for receiver_block in range(2)]
+            settings = tune(scan, keys,
+                            candidate_space(args.eq, args.eqboost, args.cdr),
+                            args.plan, args.bit, args.top, sys.stderr)
+            store_receiver_settings(args.board_id, args.daisy_chain_count,
+                                    settings)
+        else:
+            print(
+                f"Receiver settings already tuned for board {args.board_id}, "
+                "--retune searches again",
+                file=sys.stderr)
+        report_settings(settings, sys.stdout)
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import functools
+from typing import Callable
+import pytest
+import eyescan  # noqa: F401, puts the modules of the package on sys.path
+from instructions import TestPattern
+from scan import perform_eyescan
+from simulator import SimulatedJtagEngine
+
+DEVICE_COUNT = 2
+
+
+def simulated_chain(**kwargs) -> functools.partial:
+    # jtag_factory of a simulated chain that keeps its time without sleeping
+    return functools.partial(SimulatedJtagEngine,
+                             device_count=DEVICE_COUNT,
+                             realtime=False,
+                             **kwargs)
+
+
+def recorded_chain(engines: list,
+                   **kwargs) -> Callable[..., SimulatedJtagEngine]:
+    # jtag_factory of simulated_chain that appends every engine to engines
+    factory = simulated_chain(**kwargs)
+
+    def jtag_factory(**settings) -> SimulatedJtagEngine:
+        engines.append(factory(**settings))
+        return engines[-1]
+
+    return jtag_factory
+
+
+@pytest.fixture
+def scan_options() -> dict:
+    # Keyword arguments of the perform functions for a small scan of the
+    # simulated chain, without output_path
+    return dict(pyftdi_url="sim://",
+                ftdi_jtag_frequency=1E7,
+                ftdi_direction=0,
+                ftdi_initial_value=0,
+                ftdi_reset_bit=0,
+                daisy_chain_device_count=DEVICE_COUNT,
+                bit_number=2,
+                test_pattern=TestPattern.PRBS_7_BIT,
+                dwell_time=1E-5,
+                voltage_increment=8,
+                phase_increment=4,
+                jtag_factory=simulated_chain())
+
+
+def read_samples(path) -> list[str]:
+    return sorted(path.read_text().splitlines())
+
+
+@pytest.fixture
+def serial_samples(tmp_path, scan_options) -> list[str]:
+    # Samples of the scan_options scan read one device at a time
+    samples = []
+    for device in range(1, DEVICE_COUNT + 1):
+        path = tmp_path / f"serial-{device}.tsv"
+        perform_eyescan(output_path=path,
+                        daisy_chain_device_number=device,
+                        **scan_options)
+        samples += read_samples(path)
+    return sorted(samples)
@@ -0,0 +1,59 @@
+from adaptive import trace_eye
+from conftest import read_samples
+from scan import perform_parallel_eyescan
+from simulator import SyntheticEye
+
+VOLTAGES = list(range(-32, 32, 2))
+PHASES = list(range(-32, 32, 2))
+EYES = (SyntheticEye(height=12, width=8), SyntheticEye(height=20, width=6),
+        SyntheticEye(height=10, width=12, voltage_center=4, phase_center=-6),
+        SyntheticEye(height=12, width=8, dead=True))
+
+
+def traced(eyes) -> tuple[list, list]:
+    # trace_eye of the eyes, with the (voltage, phase) points it measured
+    measured = []
+
+    def measure(points):
+        measured.extend(points)
+        return [
+            tuple(eye.ecount(voltage, phase, 0) for eye in eyes)
+            for voltage, phase in points
+        ]
+
+    return trace_eye(VOLTAGES, PHASES, measure, len(eyes)), measured
+
+
+def test_traced_eye_matches_the_full_grid():
+    samples, measured = traced(EYES)
+    assert len(samples) == len(VOLTAGES) * len(PHASES) * len(EYES)
+    assert len(set(measured)) == len(measured)
+    assert len(measured) < len(VOLTAGES) * len(PHASES) / 2
+    for sample in samples:
+        ecount = EYES[sample.index].ecount(sample.voltage, sample.phase, 0)
+        assert (sample.amplitude == 0) == (ecount == 0)
+        if not sample.inferred:
+            assert sample.amplitude == ecount
+            assert (sample.voltage, sample.phase) in measured
+
+
+def test_closed_eye_is_measured_in_the_first_column_only():
+    samples, measured = traced(EYES[-1:])
+    assert {phase for _, phase in measured} == {0}
+    assert all(sample.amplitude for sample in samples)
+    assert all(sample.inferred for sample in samples if sample.phase != 0)
+
+
+def test_adaptive_scan_finds_the_open_points_of_the_full_scan(
+        tmp_path, scan_options):
+    open_points = []
+    for adaptive in (False, True):
+        path = tmp_path / f"{adaptive}.tsv"
+        perform_parallel_eyescan(output_path=path,
+                                 adaptive=adaptive,
+                                 **scan_options)
+        open_points.append([
+            sample.split("\t")[:5] for sample in read_samples(path)
+            if sample.split("\t")[5] == "0"
+        ])
+    assert open_points[0] and open_points[0] == open_points[1]
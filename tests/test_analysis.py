@@ -0,0 +1,106 @@
+import numpy
+import pytest
+from analysis import ScanData, analyze_file, ber_contours, eye_metrics, is_result_file, load_binary, load_scans, load_tsv
+from instructions import ws_char
+from scan import perform_parallel_eyescan
+
+
+def scan_data(ecount, dwell=1E-3, inferred=None) -> ScanData:
+    # One device, lane and bit over a 5 x 5 grid around the center
+    ecount = numpy.asarray(ecount, float).reshape(1, 1, 1, 5, 5)
+    return ScanData(
+        numpy.array([1]), numpy.array([8, 4, 0, -4, -8]),
+        numpy.array([4, 2, 0, -2, -4]), ecount,
+        numpy.full(ecount.shape, dwell),
+        numpy.zeros(ecount.shape, bool)
+        if inferred is None else numpy.asarray(inferred).reshape(ecount.shape))
+
+
+EYE = [[9, 9, 9, 9, 9], [9, 0, 0, 9, 9], [9, 0, 0, 0, 9], [9, 0, 0, 9, 9],
+       [9, 9, 9, 9, 9]]
+
+
+def test_eye_metrics_measure_the_open_runs_through_the_center():
+    metrics = eye_metrics(scan_data(EYE), [1E-12])
+    # Three open voltages, three open phases, seven open points
+    assert metrics.height[0, 0, 0, 0] == 3 * 4
+    assert metrics.width[0, 0, 0, 0] == 3 * 2
+    assert metrics.area[0, 0, 0, 0] == 7 * 4 * 2
+
+
+def test_ber_contours_allow_errors_by_threshold():
+    # 1E-3 s at 10 Gb/s checks 1E7 bits, a contour of 1E-6 allows 10 errors
+    data = scan_data(numpy.full(25, 10))
+    inside = ber_contours(data, [1E-6, 1E-9])
+    assert inside[0].all() and not inside[1].any()
+
+
+def test_ber_contours_need_error_free_points_without_dwell():
+    inside = ber_contours(scan_data(EYE, dwell=numpy.nan), [1E-6])
+    assert inside.sum() == 7
+
+
+def test_saturated_and_unmeasured_points_are_outside():
+    ecount = numpy.zeros(25)
+    ecount[0] = ws_char.ecount.mask
+    ecount[1] = numpy.nan
+    data = scan_data(ecount, dwell=1)
+    assert ber_contours(data, [1]).sum() == 23
+
+
+def test_inferred_points_are_outside_unless_asked_for():
+    inferred = numpy.zeros(25, bool)
+    inferred[12] = True
+    data = scan_data(EYE, inferred=inferred)
+    assert eye_metrics(data, [1E-12]).height[0, 0, 0, 0] == 0
+    assert eye_metrics(data, [1E-12], inferred=True).height[0, 0, 0, 0] == 12
+
+
+@pytest.mark.parametrize("output_format", ["tsv", "binary"])
+def test_adaptive_scan_flags_its_inferred_points(tmp_path, scan_options,
+                                                 output_format):
+    # A grid fine enough to have inferred points inside the eyes
+    path = tmp_path / "scan"
+    perform_parallel_eyescan(
+        output_path=path,
+        adaptive=True,
+        output_format=output_format,
+        **scan_options
+        | dict(bit_number=1, voltage_increment=2, phase_increment=2))
+    [data] = load_scans(path).values()
+    measured = ~numpy.isnan(data.ecount) & ~data.inferred
+    assert data.inferred.any() and measured.any()
+    inside = ber_contours(data, [1E-12])
+    assert not (inside & data.inferred).any()
+    assert (ber_contours(data, [1E-12], inferred=True) & data.inferred).any()
+
+
+def test_tsv_and_binary_results_load_alike(tmp_path, scan_options):
+    for output_format in ("tsv", "binary"):
+        perform_parallel_eyescan(output_path=tmp_path / output_format,
+                                 adaptive=True,
+                                 output_format=output_format,
+                                 **scan_options)
+    [tsv] = load_tsv(tmp_path / "tsv").values()
+    binary = load_binary(tmp_path / "binary")
+    for field in ("devices", "voltages", "phases", "ecount", "inferred"):
+        numpy.testing.assert_array_equal(getattr(tsv, field),
+                                         getattr(binary, field))
+
+
+def test_tagged_tsv_holds_a_scan_per_tag(tmp_path, scan_options):
+    path = tmp_path / "scan.tsv"
+    perform_parallel_eyescan(output_path=path, **scan_options)
+    samples = path.read_text().splitlines()
+    fleet = tmp_path / "fleet.tsv"
+    fleet.write_text("".join(f"{url}\t{sample}\n"
+                             for url in ("sim://a", "sim://b")
+                             for sample in samples[1:] + samples[:1]))
+    assert is_result_file(fleet)
+    scans = load_scans(fleet, 1E-5)
+    [untagged] = load_scans(path, 1E-5).values()
+    assert list(scans) == ["sim://a", "sim://b"]
+    for data in scans.values():
+        numpy.testing.assert_array_equal(data.ecount, untagged.ecount)
+    rows = analyze_file(fleet, [1E-12], 10E9, 1E-5, True, False)
+    assert {row[1] for row in rows} == {"sim://a", "sim://b"}
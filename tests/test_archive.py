@@ -0,0 +1,107 @@
+import os
+from archive import ScanMetadata, ingest, lane_trend, open_archive, store_path
+from analysis import DEFAULT_THRESHOLDS, analyze_file
+from conftest import simulated_chain
+from scan import perform_parallel_eyescan
+from simulator import SyntheticEye
+
+THRESHOLD = DEFAULT_THRESHOLDS[-1]
+
+
+def scan_file(tmp_path, scan_options, name: str, **kwargs):
+    path = tmp_path / name
+    perform_parallel_eyescan(output_path=path, **scan_options, **kwargs)
+    return path
+
+
+def test_archived_metrics_are_the_worst_bit_analysis(tmp_path, scan_options):
+    archive = tmp_path / "archive"
+    for output_format in ("tsv", "binary"):
+        path = scan_file(tmp_path,
+                         scan_options,
+                         output_format,
+                         output_format=output_format)
+        [scan_id] = ingest(archive, path,
+                           ScanMetadata("sim://", "PRBS_7_BIT", 1E-5))
+        assert store_path(archive, scan_id).exists()
+    expected = sorted(
+        (device, lane, bit, height, width, area)
+        for _, _, _, device, lane, bit, height, width, area in analyze_file(
+            path, [THRESHOLD], 10E9, None, True, False))
+    connection = open_archive(archive)
+    for scan_id in (1, 2):
+        assert sorted(
+            tuple(row) for row in connection.execute(
+                "SELECT device, lane, bit, height, width, area FROM metrics "
+                "WHERE scan = ? AND threshold = ?", (scan_id,
+                                                     THRESHOLD))) == expected
+    connection.close()
+
+
+def test_changed_sources_replace_their_scan(tmp_path, scan_options):
+    archive = tmp_path / "archive"
+    path = scan_file(tmp_path, scan_options, "scan.tsv")
+    [scan_id] = ingest(archive, path, ScanMetadata())
+    assert ingest(archive, path, ScanMetadata()) == []
+    os.utime(path, (0, 1))
+    [new_id] = ingest(archive, path, ScanMetadata())
+    assert new_id != scan_id
+    assert not store_path(archive, scan_id).exists()
+    connection = open_archive(archive)
+    assert [tuple(row) for row in connection.execute("SELECT id FROM scans")
+            ] == [(new_id, )]
+    assert connection.execute("SELECT COUNT(*) FROM metrics WHERE scan = ?",
+                              (scan_id, )).fetchone()[0] == 0
+    connection.close()
+
+
+def test_fleet_results_are_archived_per_adapter(tmp_path, scan_options):
+    samples = scan_file(tmp_path, scan_options,
+                        "scan.tsv").read_text().splitlines()
+    fleet = tmp_path / "fleet.tsv"
+    fleet.write_text("".join(f"{url}\t{sample}\n"
+                             for url in ("sim://a", "sim://b")
+                             for sample in samples))
+    archive = tmp_path / "archive"
+    assert len(ingest(archive, fleet, ScanMetadata())) == 2
+    connection = open_archive(archive)
+    assert sorted(
+        tuple(row)
+        for row in connection.execute("SELECT tag, adapter FROM scans")) == [
+            ("sim://a", "sim://a"), ("sim://b", "sim://b")
+        ]
+    connection.close()
+
+
+def test_lane_trend_reports_the_last_devices(tmp_path, scan_options):
+    # Lane 2 of device 1 dies in the second scan of sim://b
+    archive = tmp_path / "archive"
+    dead = simulated_chain(eyes={(1, 2): SyntheticEye(12, 8, dead=True)})
+    for index, (adapter, test_pattern, jtag_factory) in enumerate(
+        (("sim://a", "PRBS_7_BIT", scan_options["jtag_factory"]),
+         ("sim://b", "PRBS_7_BIT",
+          scan_options["jtag_factory"]), ("sim://b", "PRBS_31_BIT", dead))):
+        path = scan_file(tmp_path,
+                         scan_options | dict(jtag_factory=jtag_factory),
+                         f"{index}.tsv")
+        os.utime(path, (index, index))
+        ingest(archive, path, ScanMetadata(adapter, test_pattern))
+    connection = open_archive(archive)
+    rows = lane_trend(connection, 2, THRESHOLD)
+    assert [(row["timestamp"], row["device"]) for row in rows] == [(0, 1),
+                                                                   (0, 2),
+                                                                   (1, 1),
+                                                                   (1, 2),
+                                                                   (2, 1),
+                                                                   (2, 2)]
+    assert [row["area"] > 0 for row in rows] == [True] * 4 + [False, True]
+    last = lane_trend(connection, 2, THRESHOLD, last=3)
+    assert [tuple(row) for row in last] == [tuple(row) for row in rows[-3:]]
+    assert [(row["timestamp"], row["device"])
+            for row in lane_trend(connection,
+                                  2,
+                                  THRESHOLD,
+                                  device=1,
+                                  adapter="sim://b",
+                                  test_pattern="PRBS_7_BIT")] == [(1, 1)]
+    connection.close()
@@ -0,0 +1,133 @@
+import asyncio
+import contextlib
+import time
+import pytest
+from asyncscan import StationError, scan_samples, scan_stations
+from conftest import read_samples, recorded_chain
+from scan import perform_parallel_eyescan
+
+
+def unplugged(**settings):
+    raise OSError("No adapter")
+
+
+def station_options(scan_options: dict, **kwargs) -> dict:
+    # Keyword arguments of scan_samples for the scan options
+    options = dict(scan_options, parallel=True, **kwargs)
+    del options["pyftdi_url"]
+    return options
+
+
+def tsv(samples: list[tuple]) -> list[str]:
+    return sorted("\t".join(map(str, sample)) for sample in samples)
+
+
+async def first_samples(samples, count: int) -> list[tuple]:
+    # Closes samples after taking count of them
+    taken = []
+    async with contextlib.aclosing(samples):
+        async for sample in samples:
+            taken.append(sample)
+            if len(taken) == count:
+                break
+    return taken
+
+
+def test_scan_samples_yields_the_scan(tmp_path, scan_options):
+    path = tmp_path / "scan.tsv"
+    progress = []
+
+    async def scan():
+        return [
+            sample async for sample in scan_samples(
+                "sim://",
+                progress=progress.append,
+                **station_options(scan_options, output_path=path))
+        ]
+
+    samples = asyncio.run(scan())
+    assert tsv(samples) == read_samples(path)
+    assert progress[-1].samples == progress[-1].total == len(samples)
+    assert progress[-1].fraction == 1
+
+
+def test_closing_the_iterator_stops_the_scan(tmp_path, scan_options):
+    engines = []
+    perform_parallel_eyescan(output_path=tmp_path / "scan.tsv",
+                             **scan_options
+                             | dict(jtag_factory=recorded_chain(engines)))
+    samples = scan_samples(
+        "sim://",
+        **station_options(scan_options, jtag_factory=recorded_chain(engines)))
+    assert len(asyncio.run(first_samples(samples, 10))) == 10
+    full, closed = (engine.statistics for engine in engines)
+    dr_shifts = closed.dr_shifts
+    time.sleep(0.2)
+    assert closed.dr_shifts == dr_shifts < full.dr_shifts
+
+
+def test_cancelled_task_stops_the_scan(tmp_path, scan_options):
+    engines = []
+    perform_parallel_eyescan(output_path=tmp_path / "scan.tsv",
+                             **scan_options
+                             | dict(jtag_factory=recorded_chain(engines)))
+    started = []
+
+    async def scan():
+        samples = scan_samples(
+            "sim://",
+            **station_options(scan_options,
+                              jtag_factory=recorded_chain(engines)))
+        async with contextlib.aclosing(samples):
+            async for sample in samples:
+                started.append(sample)
+                await asyncio.sleep(1)
+
+    async def cancel():
+        task = asyncio.create_task(scan())
+        while not started:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+    full, cancelled = (engine.statistics for engine in engines)
+    dr_shifts = cancelled.dr_shifts
+    time.sleep(0.2)
+    assert cancelled.dr_shifts == dr_shifts < full.dr_shifts
+
+
+def test_scan_error_is_raised_by_the_iterator(scan_options):
+
+    async def scan():
+        return [
+            sample async for sample in scan_samples(
+                "sim://",
+                **station_options(scan_options, jtag_factory=unplugged))
+        ]
+
+    with pytest.raises(OSError, match="No adapter"):
+        asyncio.run(scan())
+
+
+def test_failing_station_does_not_stop_the_others(tmp_path, scan_options):
+    path = tmp_path / "scan.tsv"
+    perform_parallel_eyescan(output_path=path, **scan_options)
+    samples = []
+
+    async def scan():
+        async for url, sample in scan_stations(
+            {
+                "sim://a": station_options(scan_options),
+                "sim://b": station_options(scan_options,
+                                           jtag_factory=unplugged)
+            },
+                max_scans=1):
+            samples.append((url, sample))
+
+    with pytest.raises(StationError) as error:
+        asyncio.run(scan())
+    assert list(error.value.errors) == ["sim://b"]
+    assert {url for url, _ in samples} == {"sim://a"}
+    assert tsv([sample for _, sample in samples]) == read_samples(path)
@@ -0,0 +1,19 @@
+import pytest
+from benchmark import run_benchmark
+from simulator import LANES_PER_BLOCK
+
+
+@pytest.mark.parametrize("mode", ["serial", "parallel", "adaptive"])
+def test_benchmark_samples_match_the_simulated_eyes(mode):
+    result = run_benchmark(mode, 2, 1, 8, 4, 1E8, 0)
+    assert result.mismatches == 0
+    assert (result.inferred_samples > 0) == (mode == "adaptive")
+
+
+def test_benchmark_counts_measured_points_only():
+    full = run_benchmark("parallel", 2, 1, 4, 2, 1E8, 0)
+    adaptive = run_benchmark("adaptive", 2, 1, 4, 2, 1E8, 0)
+    assert adaptive.samples == full.samples
+    assert adaptive.points == (
+        (adaptive.samples - adaptive.inferred_samples) //
+        LANES_PER_BLOCK) < full.points
@@ -0,0 +1,112 @@
+import functools
+import pytest
+import calibration
+import scan
+from calibration import (CalibrationError, MIN_FREQUENCY, SAFETY_MARGIN,
+                         back_off, cached_frequency, cached_receiver_settings,
+                         calibrate, store_frequency, store_receiver_settings)
+from conftest import DEVICE_COUNT, read_samples, simulated_chain
+from instructions import ReceiverSettings
+from scan import ScanSession, perform_parallel_eyescan
+from simulator import SERIAL_NUMBER
+
+# Fastest TCK the simulated cable carries
+MAX_FREQUENCY = 3E6
+
+
+class Adapter:
+    """Adapter that runs at multiples of 100 kHz and passes the check below
+    max_frequency, and every failing_check-th check anyway."""
+
+    def __init__(self, max_frequency: float, failing_check: int = 0):
+        self.max_frequency = max_frequency
+        self.failing_check = failing_check
+        self.frequency = None
+        self.checks = 0
+
+    def set_frequency(self, frequency: float) -> float:
+        self.frequency = round(frequency, -5)
+        return self.frequency
+
+    def check(self) -> bool:
+        self.checks += 1
+        if self.failing_check and self.checks % self.failing_check == 0:
+            return False
+        return self.frequency <= self.max_frequency
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch) -> dict:
+    # Frequencies cached by scans go to tmp_path
+    paths = dict(path=tmp_path / "jtag-frequency.json")
+    for name in ("cached_frequency", "store_frequency"):
+        monkeypatch.setattr(
+            scan, name, functools.partial(getattr(calibration, name), **paths))
+    return paths
+
+
+def test_calibrate_keeps_a_margin_below_the_fastest_passing_frequency():
+    adapter = Adapter(3.5E6)
+    assert calibrate(adapter.set_frequency,
+                     adapter.check) == pytest.approx(2E6 * SAFETY_MARGIN)
+    adapter = Adapter(1E5)
+    assert calibrate(adapter.set_frequency, adapter.check) == 1E5
+
+
+def test_calibrate_needs_every_repeat_to_pass():
+    # The 20th check is the 4th repeat at 5E5 Hz
+    adapter = Adapter(30E6, failing_check=20)
+    assert calibrate(adapter.set_frequency,
+                     adapter.check) == pytest.approx(2E5 * SAFETY_MARGIN)
+    adapter = Adapter(0)
+    with pytest.raises(CalibrationError):
+        calibrate(adapter.set_frequency, adapter.check)
+
+
+def test_back_off_stops_at_the_slowest_frequency():
+    assert back_off(1E6) == 5E5
+    assert back_off(1.5E5) == MIN_FREQUENCY
+    with pytest.raises(CalibrationError):
+        back_off(MIN_FREQUENCY)
+
+
+def test_caches_are_kept_per_chain_length(tmp_path):
+    path = tmp_path / "cache.json"
+    assert cached_frequency("A", 2, path) is None
+    store_frequency("A", 2, 1E6, path)
+    store_frequency("A", 3, 2E6, path)
+    assert cached_frequency("A", 2, path) == 1E6
+    path.write_text("{")
+    assert cached_frequency("A", 2, path) is None
+    settings = {(1, 0): ReceiverSettings(eq=2), (2, 1): ReceiverSettings()}
+    store_receiver_settings("board", 2, settings, path)
+    assert cached_receiver_settings("board", 2, path) == settings
+    assert cached_receiver_settings("board", 3, path) is None
+
+
+def test_session_calibrates_once_per_adapter(cache):
+    jtag_factory = simulated_chain(max_frequency=MAX_FREQUENCY)
+    session = ScanSession("sim://", None, 0, 0, 0, DEVICE_COUNT, jtag_factory)
+    session.close()
+    frequency = cached_frequency(SERIAL_NUMBER, DEVICE_COUNT, **cache)
+    assert MIN_FREQUENCY < session.frequency == frequency <= MAX_FREQUENCY
+    store_frequency(SERIAL_NUMBER, DEVICE_COUNT, 1E6, **cache)
+    session = ScanSession("sim://", None, 0, 0, 0, DEVICE_COUNT, jtag_factory)
+    session.close()
+    assert session.frequency == 1E6
+
+
+def test_failing_scan_backs_off_and_matches_serial(tmp_path, scan_options,
+                                                   serial_samples, cache,
+                                                   capsys):
+    store_frequency(SERIAL_NUMBER, DEVICE_COUNT, 4 * MAX_FREQUENCY, **cache)
+    path = tmp_path / "scan.tsv"
+    perform_parallel_eyescan(
+        output_path=path,
+        **scan_options
+        | dict(ftdi_jtag_frequency=None,
+               jtag_factory=simulated_chain(max_frequency=MAX_FREQUENCY)))
+    assert read_samples(path) == serial_samples
+    assert cached_frequency(SERIAL_NUMBER, DEVICE_COUNT,
+                            **cache) <= MAX_FREQUENCY
+    assert "TCK lowered" in capsys.readouterr().err
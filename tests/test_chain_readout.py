@@ -0,0 +1,23 @@
+from conftest import read_samples, recorded_chain
+from scan import perform_parallel_eyescan
+
+
+def test_chain_wide_readout_matches_serial(tmp_path, scan_options,
+                                           serial_samples):
+    path = tmp_path / "scan.tsv"
+    perform_parallel_eyescan(output_path=path, chain_wide=True, **scan_options)
+    assert read_samples(path) == serial_samples
+
+
+def test_chain_wide_readout_shifts_every_device_at_once(
+        tmp_path, scan_options):
+    engines = []
+    for chain_wide in (False, True):
+        perform_parallel_eyescan(output_path=tmp_path / f"{chain_wide}.tsv",
+                                 chain_wide=chain_wide,
+                                 **scan_options
+                                 | dict(jtag_factory=recorded_chain(engines)))
+    parallel, chain = (engine.statistics for engine in engines)
+    # About one DR shift per point instead of one per point and device
+    assert chain.dr_shifts * 3 // 2 < parallel.dr_shifts
+    assert chain.ir_shifts < parallel.ir_shifts
@@ -0,0 +1,56 @@
+import dataclasses
+import instructions
+from conftest import DEVICE_COUNT, simulated_chain
+from plan import ScanPlan
+from scan import ScanSession, configure_receiver_block, readout_receiver_block
+
+
+def simulated_session() -> ScanSession:
+    return ScanSession("sim://", 1E7, 0, 0, 0, DEVICE_COUNT, simulated_chain())
+
+
+def configure_chain(session: ScanSession, test_pattern, chain_state):
+    for device in range(1, DEVICE_COUNT + 1):
+        configure_receiver_block(session.jtag, device, DEVICE_COUNT, 0,
+                                 test_pattern, chain_state)
+
+
+def test_configured_registers_are_not_written_again(scan_options):
+    session = simulated_session()
+    statistics = session.jtag.statistics
+    try:
+        configure_chain(session, scan_options["test_pattern"],
+                        session.chain_state)
+        configured = dataclasses.replace(statistics)
+        configure_chain(session, scan_options["test_pattern"],
+                        session.chain_state)
+        assert statistics == configured
+        # Another test pattern only changes ws_core
+        configure_chain(session, instructions.TestPattern.PRBS_23_BIT,
+                        session.chain_state)
+        assert 0 < statistics.dr_shifts - configured.dr_shifts < (
+            configured.dr_shifts)
+    finally:
+        session.close()
+
+
+def test_readout_skips_redundant_ir_writes(scan_options):
+    plan = ScanPlan.sweep(2, 16, 8)
+    readouts = []
+    for tracked in (False, True):
+        session = simulated_session()
+        chain_state = session.chain_state if tracked else None
+        try:
+            configure_chain(session, scan_options["test_pattern"], chain_state)
+            before = dataclasses.replace(session.jtag.statistics)
+            samples = list(
+                readout_receiver_block(session.jtag, 1, DEVICE_COUNT, plan, 0,
+                                       0, chain_state))
+            readouts.append(
+                (samples,
+                 session.jtag.statistics.ir_shifts - before.ir_shifts))
+        finally:
+            session.close()
+    (untracked_samples, untracked_irs), (samples, irs) = readouts
+    assert samples == untracked_samples
+    assert irs < untracked_irs
@@ -0,0 +1,85 @@
+import io
+import json
+import socket
+import threading
+import pytest
+from conftest import read_samples, simulated_chain
+from daemon import ScanDaemon
+from plan import ScanPlan
+from scan import perform_parallel_eyescan
+from service import submit_job
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    # A daemon of the simulated chain serving from a thread
+    server = ScanDaemon(tmp_path / "daemon.sock", simulated_chain())
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+@pytest.fixture
+def job(tmp_path, scan_options) -> dict:
+    # The job eyescan --daemon submits for the scan options
+    options = dict(scan_options)
+    del options["jtag_factory"]
+    return options | dict(output_path=tmp_path / "daemon.tsv",
+                          daisy_chain_device_number=0,
+                          transport="direct",
+                          adaptive=False,
+                          dwell_policy=None,
+                          output_format="tsv",
+                          stream=False,
+                          resume=False,
+                          plan=None,
+                          tuned=False,
+                          board_id=None,
+                          render=None,
+                          parallel=True,
+                          chain_wide=False,
+                          pipelined=False)
+
+
+def test_daemon_streams_the_samples_of_a_scan(tmp_path, scan_options, daemon,
+                                              job):
+    samples = io.StringIO()
+    status = submit_job(daemon.server_address, job, samples)
+    perform_parallel_eyescan(output_path=tmp_path / "direct.tsv",
+                             **scan_options)
+    assert status["done"]["samples"] == len(samples.getvalue().splitlines())
+    assert sorted(samples.getvalue().splitlines()) == read_samples(
+        tmp_path / "direct.tsv") == read_samples(job["output_path"])
+
+
+def test_daemon_keeps_the_session_between_scans(daemon, job):
+    submit_job(daemon.server_address, job)
+    session = daemon.sessions["sim://"]
+    assert "done" in submit_job(daemon.server_address, job)
+    assert daemon.sessions["sim://"] is session
+    submit_job(daemon.server_address, job | dict(ftdi_jtag_frequency=2E6))
+    assert daemon.sessions["sim://"] is not session
+
+
+def test_failed_scan_closes_the_session(daemon, job, capsys):
+    submit_job(daemon.server_address, job)
+    status = submit_job(
+        daemon.server_address,
+        job | dict(plan=ScanPlan((0, ), (0, ), (0, ), devices=(5, ))))
+    assert "None of the scanned devices" in status["error"]
+    assert "sim://" not in daemon.sessions
+    captured = capsys.readouterr()
+    assert "Scan of sim:// failed" in captured.err and not captured.out
+
+
+def test_invalid_job_is_refused(daemon):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(daemon.server_address)
+        with connection.makefile("rw") as stream:
+            stream.write("{}\n")
+            stream.flush()
+            assert json.loads(
+                stream.readline())["error"].startswith("Invalid job")
@@ -0,0 +1,64 @@
+import math
+import pytest
+from conftest import read_samples
+from dwell import ECOUNT_SATURATION, DwellPolicy, poisson_cdf
+from scan import perform_parallel_eyescan
+
+# Expects 1 error at the target BER in 1 ms
+POLICY = DwellPolicy(1E-4, 8E-4, target_ber=1E-7, bit_rate=1E10)
+
+
+def test_poisson_cdf():
+    assert poisson_cdf(0, 2) == pytest.approx(math.exp(-2))
+    assert poisson_cdf(2, 2) == pytest.approx(5 * math.exp(-2))
+    assert poisson_cdf(0, 0) == poisson_cdf(1000, 1) == 1
+
+
+def test_settled_once_the_ber_is_conclusive():
+    assert not POLICY.settled(0, 1E-4)
+    assert POLICY.settled(0, 1E-2)
+    assert POLICY.settled(100, 1E-4)
+    assert not POLICY.settled(1, 1E-4)
+    assert POLICY.settled(1, POLICY.max_dwell)
+    assert POLICY.settled(ECOUNT_SATURATION, 1E-6)
+
+
+def test_only_unsettled_points_are_measured_again():
+    measured = []
+
+    def measure(dwell, points):
+        measured.append((dwell, points))
+        # Point 0 saturates, point 1 never shows an error
+        return [(ECOUNT_SATURATION, ) if point == 0 else (0, )
+                for point in points]
+
+    results = POLICY.measure(measure, [0, 1])
+    assert results == [((ECOUNT_SATURATION, ), 1E-4), ((0, ), 8E-4)]
+    assert measured == [(1E-4, [0, 1]), (2E-4, [1]), (4E-4, [1]), (8E-4, [1])]
+
+
+def test_fixed_policy_measures_once():
+    measured = []
+    policy = DwellPolicy.fixed(1E-5)
+    policy.measure(
+        lambda dwell, points: measured.append(dwell) or [(0, )] * len(points),
+        [0, 1])
+    assert measured == [1E-5]
+
+
+def test_dwell_is_only_extended_from_above_zero():
+    with pytest.raises(ValueError):
+        DwellPolicy(0, 1E-3)
+
+
+def test_dwell_policy_scan_extends_the_open_points(tmp_path, scan_options):
+    # A point settles once all of its lanes do
+    path = tmp_path / "scan.tsv"
+    perform_parallel_eyescan(output_path=path,
+                             dwell_policy=POLICY,
+                             **scan_options)
+    dwells = {}
+    for sample in read_samples(path):
+        fields = sample.split("\t")
+        dwells.setdefault(fields[5] == "0", set()).add(float(fields[7]))
+    assert dwells[True] == {0.8} and 0.1 in dwells[False]
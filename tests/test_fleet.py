@@ -0,0 +1,61 @@
+import io
+from conftest import read_samples
+from fleet import merge_part, part_path, perform_fleet_eyescan
+from scan import perform_parallel_eyescan
+
+FAILING_URL = "sim://failing"
+
+
+def perform_or_fail(pyftdi_url, output_path, **kwargs):
+    # Scans like perform_parallel_eyescan, FAILING_URL fails after writing a
+    # sample
+    if pyftdi_url == FAILING_URL:
+        output_path.write_text("1\t0\t0\t0\t0\t0\n")
+        raise SystemExit(3)
+    perform_parallel_eyescan(pyftdi_url=pyftdi_url,
+                             output_path=output_path,
+                             **kwargs)
+
+
+def test_merge_part_keeps_incomplete_lines_for_later(tmp_path):
+    path = tmp_path / "part"
+    merged = io.StringIO()
+    assert merge_part((merged, ), "sim://a", path) == 0
+    path.write_text("1\t2\n3\t")
+    offset = merge_part((merged, ), "sim://a", path)
+    assert merged.getvalue() == "sim://a\t1\t2\n"
+    path.write_text("1\t2\n3\t4\n")
+    assert merge_part((merged, ), "sim://a", path, offset) == 8
+    assert merged.getvalue() == "sim://a\t1\t2\nsim://a\t3\t4\n"
+
+
+def test_fleet_scan_merges_every_adapter(tmp_path, scan_options):
+    options = dict(scan_options)
+    del options["pyftdi_url"]
+    path = tmp_path / "fleet.tsv"
+    streamed = io.StringIO()
+    urls = ["sim://a", "sim://b"]
+    assert perform_fleet_eyescan(urls,
+                                 path,
+                                 perform_parallel_eyescan,
+                                 streams=(streamed, ),
+                                 **options) == {}
+    perform_parallel_eyescan(output_path=tmp_path / "direct.tsv",
+                             **scan_options)
+    direct = read_samples(tmp_path / "direct.tsv")
+    assert read_samples(path) == sorted(f"{url}\t{sample}" for url in urls
+                                        for sample in direct)
+    assert streamed.getvalue() == path.read_text()
+    assert not any(part_path(path, index).exists() for index in range(2))
+
+
+def test_failed_adapter_keeps_its_part(tmp_path, scan_options, capsys):
+    options = dict(scan_options)
+    del options["pyftdi_url"]
+    path = tmp_path / "fleet.tsv"
+    failures = perform_fleet_eyescan(["sim://a", FAILING_URL], path,
+                                     perform_or_fail, **options)
+    assert failures == {FAILING_URL: 3}
+    assert part_path(path, 1).exists() and not part_path(path, 0).exists()
+    assert f"{FAILING_URL}\t1\t0\t0\t0\t0\t0" in read_samples(path)
+    assert FAILING_URL in capsys.readouterr().err
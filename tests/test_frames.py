@@ -0,0 +1,62 @@
+import pytest
+import scan
+from conftest import DEVICE_COUNT, simulated_chain
+from instructions import LANES, ws_char
+from plan import ScanPlan
+from scan import ScanSession, char_frame, compile_char_frame, configure_receiver_block, chain_readout_receiver_block
+
+
+@pytest.fixture
+def frame_cache():
+    compile_char_frame.cache_clear()
+    yield compile_char_frame
+    compile_char_frame.cache_clear()
+    scan.frame_cache_full = False
+
+
+@pytest.mark.parametrize("device", [0, 1, 2])
+def test_compiled_frame_decodes_every_lane(frame_cache, device):
+    frame = compile_char_frame(8, 0xfc, 3, True, device, DEVICE_COUNT)
+    single = char_frame(8, 0xfc, 3, True)
+    assert len(frame.bits) == (len(single) *
+                               DEVICE_COUNT if device == 0 else len(single) +
+                               DEVICE_COUNT - 1)
+    assert len(frame.ecount_offsets) == (DEVICE_COUNT if device == 0 else 1)
+    # An ecount of every lane, captured one bit below its ws_char offset
+    readback = 0
+    for index, offsets in enumerate(frame.ecount_offsets):
+        for lane, offset in enumerate(offsets):
+            readback |= (index * LANES + lane + 1) << offset
+    assert frame.decode(readback) == [
+        tuple(index * LANES + lane + 1 for lane in range(LANES))
+        for index in range(len(frame.ecount_offsets))
+    ]
+    assert all(offset - previous == ws_char.ecount.stride
+               for offsets in frame.ecount_offsets
+               for previous, offset in zip(offsets, offsets[1:]))
+
+
+def test_frames_are_compiled_as_the_readout_needs_them(frame_cache,
+                                                       scan_options):
+    plan = ScanPlan.sweep(20, 1, 1)
+    session = ScanSession("sim://", 1E7, 0, 0, 0, DEVICE_COUNT,
+                          simulated_chain())
+    try:
+        for device in range(1, DEVICE_COUNT + 1):
+            configure_receiver_block(session.jtag, device, DEVICE_COUNT, 0,
+                                     scan_options["test_pattern"],
+                                     session.chain_state)
+        next(
+            chain_readout_receiver_block(session.jtag, DEVICE_COUNT, plan, 0,
+                                         0, session.chain_state))
+    finally:
+        session.close()
+    # Only the frames of the first row
+    assert frame_cache.cache_info().currsize == len({0, *plan.phases})
+
+
+def test_full_frame_cache_is_reported_once(frame_cache, monkeypatch, capsys):
+    monkeypatch.setattr(scan, "FRAME_CACHE_SIZE", 4)
+    for phase in range(8):
+        compile_char_frame(0, phase, 0, True, 1, DEVICE_COUNT)
+    assert capsys.readouterr().err.count("frame cache full") == 1
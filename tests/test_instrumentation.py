@@ -0,0 +1,42 @@
+import json
+import sys
+import pytest
+import instrumentation
+from eyescan import eyescan as cli
+from instrumentation import Profiler, profiling, recording
+from scan import perform_parallel_eyescan
+
+
+def test_recording_restores_the_active_profiler():
+    outer, inner = Profiler(), Profiler()
+    with recording(outer):
+        with recording(inner):
+            assert instrumentation._profiler is inner
+        assert instrumentation._profiler is outer
+    assert instrumentation._profiler is None
+
+
+def test_profiled_scan_exports_its_operations(tmp_path, scan_options):
+    paths = (tmp_path / "profile.json", tmp_path / "profile.prom")
+    with profiling(paths):
+        statistics = perform_parallel_eyescan(output_path=tmp_path /
+                                              "scan.tsv",
+                                              **scan_options)
+    operations = json.loads(paths[0].read_text())
+    assert operations["jtag_shift_dr"]["count"] > 0
+    assert operations["output"]["count"] == statistics.batches
+    assert ('eyescan_operations_total{operation="jtag_shift_dr"} '
+            f'{operations["jtag_shift_dr"]["count"]}'
+            in paths[1].read_text().splitlines())
+    assert instrumentation._profiler is None
+
+
+def test_dry_run_cannot_be_profiled(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", [
+        "eyescan", "-o",
+        str(tmp_path / "scan.tsv"), "-f", "1E6", "--dry-run", "--profile",
+        str(tmp_path / "profile.json")
+    ])
+    with pytest.raises(SystemExit):
+        cli.parse_args()
+    assert "--dry-run scans are not profiled" in capsys.readouterr().err
@@ -0,0 +1,40 @@
+import pytest
+from conftest import read_samples, recorded_chain
+from dwell import DwellPolicy
+from scan import perform_parallel_eyescan
+
+
+def test_pipelined_readout_matches_serial(tmp_path, scan_options,
+                                          serial_samples):
+    path = tmp_path / "scan.tsv"
+    perform_parallel_eyescan(output_path=path, pipelined=True, **scan_options)
+    assert read_samples(path) == serial_samples
+
+
+def test_pipelined_readout_shares_the_dwell_time(tmp_path, scan_options):
+    # Both receiver blocks dwell at once, which saves more bus time than the
+    # extra WIR switches cost
+    engines = []
+    options = scan_options | dict(dwell_time=1E-4)
+    for pipelined in (False, True):
+        perform_parallel_eyescan(output_path=tmp_path / f"{pipelined}.tsv",
+                                 pipelined=pipelined,
+                                 **options
+                                 | dict(jtag_factory=recorded_chain(engines)))
+    parallel, pipelined = (engine.statistics for engine in engines)
+    assert pipelined.bus_time < parallel.bus_time * 0.75
+
+
+@pytest.mark.parametrize("readout", [{
+    "adaptive": True
+}, {
+    "dwell_policy": DwellPolicy(1E-5, 1E-4)
+}],
+                         ids=["adaptive", "dwell-policy"])
+def test_pipelined_readout_refuses_per_point_readouts(tmp_path, scan_options,
+                                                      readout):
+    with pytest.raises(ValueError, match="Pipelined readout"):
+        perform_parallel_eyescan(output_path=tmp_path / "scan.tsv",
+                                 pipelined=True,
+                                 **scan_options,
+                                 **readout)
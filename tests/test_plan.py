@@ -0,0 +1,99 @@
+import pytest
+from conftest import read_samples, recorded_chain
+from plan import (DEFAULT_LATENCIES, ScanPlan, estimate_scan,
+                  operation_latencies)
+from scan import perform_parallel_eyescan
+
+
+@pytest.mark.parametrize("plan, message", [
+    (dict(voltages=[]), "no voltages"),
+    (dict(phases=[16]), "phases have to be between -16 and 15"),
+    (dict(bits=[32]), "bits have to be between 0 and 31"),
+    (dict(lanes=[0, 1]), "no lanes of receiver block 1"),
+    (dict(devices=[0]), "devices start at 1"),
+    (dict(order="phase"), "order has to be one of"),
+    (dict(center_first="yes"), "center_first has to be true or false"),
+    (dict(dwell=1), "Unknown scan plan fields: dwell"),
+])
+def test_invalid_plans_are_refused(plan, message):
+    with pytest.raises(ValueError, match=message):
+        ScanPlan.from_dict(plan, ScanPlan.sweep(1, 8, 4))
+
+
+def test_unsorted_or_duplicate_sets_are_refused():
+    with pytest.raises(ValueError, match="descending"):
+        ScanPlan((0, 8), (0, ), (0, ))
+    with pytest.raises(ValueError, match="duplicate bits"):
+        ScanPlan((0, ), (0, ), (0, 0))
+
+
+def test_plan_sets_are_lists_or_ranges():
+    plan = ScanPlan.from_dict(
+        dict(voltages=dict(start=-8, stop=9, step=8),
+             phases=[0, 4, -4, 4],
+             receiver_blocks=[0],
+             lanes=[2, 1],
+             order="bit"), ScanPlan.sweep(2, 8, 4))
+    assert plan.voltages == (8, 0, -8)
+    assert plan.phases == (4, 0, -4)
+    assert plan.lanes == (1, 2)
+    assert plan.bits == (0, 1)
+    assert plan.rows() == [(8, 0), (0, 0), (-8, 0), (8, 1), (0, 1), (-8, 1)]
+
+
+def test_center_first_plan_starts_with_the_center_rows():
+    plan = ScanPlan((9, 1, -7), (0, ), (0, 1), center_first=True)
+    assert plan.rows() == [(1, 0), (1, 1), (9, 0), (9, 1), (-7, 0), (-7, 1)]
+
+
+def test_plan_scans_its_subset_of_the_sweep(tmp_path, scan_options):
+    full = tmp_path / "full.tsv"
+    perform_parallel_eyescan(output_path=full, **scan_options)
+    plan = ScanPlan((23, -1), (15, 7), (1, ), lanes=(0, 5), devices=(2, ))
+    path = tmp_path / "plan.tsv"
+    perform_parallel_eyescan(output_path=path, plan=plan, **scan_options)
+    samples = read_samples(path)
+    assert len(samples) == 2 * 2 * 2
+    assert samples == [
+        sample for sample in read_samples(full)
+        if sample.split("\t")[:5] in (["2", lane, "1", voltage, phase]
+                                      for lane in ("0", "5")
+                                      for voltage in ("23", "-1")
+                                      for phase in ("15", "7"))
+    ]
+    with pytest.raises(ValueError, match="None of the scanned devices"):
+        plan.select_devices([1])
+
+
+def test_estimate_is_the_traffic_of_the_scan(tmp_path, scan_options):
+    engines = []
+    statistics = perform_parallel_eyescan(
+        output_path=tmp_path / "scan.tsv",
+        **scan_options | dict(jtag_factory=recorded_chain(engines)))
+    options = dict(scan_options)
+    del options["jtag_factory"]
+    estimate = estimate_scan(perform_parallel_eyescan, DEFAULT_LATENCIES,
+                             **options)
+    simulated = engines[0].statistics
+    assert estimate.samples == statistics.samples
+    assert (estimate.ir_writes, estimate.dr_shifts, estimate.tck_cycles,
+            estimate.usb_round_trips) == (simulated.ir_shifts,
+                                          simulated.dr_shifts,
+                                          simulated.tck_cycles,
+                                          simulated.usb_round_trips)
+    assert estimate.bus_seconds == pytest.approx(simulated.bus_time)
+    assert estimate.latency_seconds == pytest.approx(
+        simulated.ir_shifts * DEFAULT_LATENCIES["jtag_write_ir"] +
+        simulated.dr_shifts * DEFAULT_LATENCIES["jtag_shift_dr"])
+
+
+def test_latencies_leave_out_the_tck_cycles():
+    latencies = operation_latencies(
+        {
+            "jtag_shift_dr": dict(count=10, seconds=0.03, bits=1E5),
+            "jtag_write_ir": dict(count=0, seconds=0, bits=0),
+            "dwell": dict(count=10, seconds=1, bits=0)
+        }, 1E7)
+    assert latencies["jtag_shift_dr"] == pytest.approx(2E-3)
+    assert latencies["jtag_write_ir"] == DEFAULT_LATENCIES["jtag_write_ir"]
+    assert "dwell" not in latencies
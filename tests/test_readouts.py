@@ -0,0 +1,14 @@
+from conftest import read_samples
+from scan import perform_parallel_eyescan
+
+
+def test_readout_matches_serial(tmp_path, scan_options, serial_samples):
+    path = tmp_path / "scan.tsv"
+    perform_parallel_eyescan(output_path=path, **scan_options)
+    assert read_samples(path) == serial_samples
+
+
+def test_readout_reads_simulated_eyes(serial_samples):
+    # Every lane has an open eye around its center and a closed border
+    ecounts = [int(sample.split("\t")[5]) for sample in serial_samples]
+    assert 0 in ecounts and max(ecounts) > 0
@@ -0,0 +1,43 @@
+import pytest
+from instructions import LANES, ws_cfg, ws_char, ws_core, ws_tuning
+
+
+def test_lane_fields_are_replicated_to_every_lane():
+    register = ws_char(phase_offset=0x7c, bit_select=3, voltage_offset=5)
+    for field, value in ((ws_char.phase_offset, 0x7c), (ws_char.bit_select, 3),
+                         (ws_char.voltage_offset, 5)):
+        assert field.lanes(register.value) == (value, ) * LANES
+    assert register.bit_select == 3
+
+
+def test_fields_are_masked_to_their_width():
+    register = ws_char(phase_offset=0xfc, bit_select=0, voltage_offset=0)
+    assert register.phase_offset == 0x7c
+    register.phase_offset = 1
+    assert ws_char.phase_offset.lanes(register.value) == (1, ) * LANES
+    assert register.bit_select == 0
+
+
+def test_binary_lists_the_register_bits_in_order():
+    register = ws_cfg(core_we_head=True, core_we_tail=True)
+    binary = register.to_binary()
+    assert len(binary) == ws_cfg.LENGTH
+    assert [index for index, bit in enumerate(binary) if bit == "1"] == [2, 23]
+    assert ws_cfg.from_int(register.value) == register
+
+
+def test_from_int_keeps_the_register_length():
+    register = ws_tuning.from_int(-1)
+    assert register.value == (1 << ws_tuning.LENGTH) - 1
+    assert register.eqboost == 3
+
+
+def test_registers_compare_by_type_and_value():
+    assert ws_cfg() == ws_cfg() and hash(ws_cfg()) == hash(ws_cfg())
+    assert ws_cfg() != ws_tuning()
+    assert ws_core(eq=1) != ws_core(eq=2)
+
+
+def test_registers_have_no_instance_dict():
+    with pytest.raises(AttributeError):
+        ws_cfg().unknown = 1
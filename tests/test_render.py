@@ -0,0 +1,98 @@
+import dataclasses
+import sys
+import numpy
+import pytest
+from conftest import read_samples, simulated_chain
+from eyescan import eyescan as cli
+from plan import ScanPlan
+from render import EyeRenderer, dead_lanes, lane_status
+from scan import perform_parallel_eyescan
+from simulator import SyntheticEye
+
+
+class RecordingSink:
+    """Sink of a BackgroundWriter that keeps the samples in scan order."""
+
+    def __init__(self):
+        self.samples = []
+
+    def write_batch(self, samples: list[tuple]):
+        self.samples += samples
+
+    def flush(self):
+        pass
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_lane_status_waits_for_the_center():
+    # (device, lane) heatmaps of 3 x 3 points, lane 0 open, lane 1 closed
+    # with its center measured, lane 2 closed without and lane 3 unmeasured
+    heatmaps = numpy.full((1, 4, 3, 3), numpy.nan)
+    heatmaps[0, 0, 1] = [5, 0, 5]
+    heatmaps[0, 1, 1] = [5, 5, 5]
+    heatmaps[0, 2, 0] = [5, 5, 5]
+    measured, error_free, dead = lane_status(heatmaps, (1, 1))
+    assert measured.tolist() == [[3, 3, 3, 0]]
+    assert error_free.tolist() == [[1, 0, 0, 0]]
+    assert dead.tolist() == [[False, True, False, False]]
+
+
+def test_center_first_plan_starts_at_voltage_0():
+    plan = ScanPlan((8, 4, -1, -5), (0, ), (0, 1))
+    center_first = dataclasses.replace(plan, center_first=True)
+    assert center_first.rows() == [(-1, 0), (-1, 1), (8, 0), (8, 1), (4, 0),
+                                   (4, 1), (-5, 0), (-5, 1)]
+    assert sorted(center_first.rows()) == sorted(plan.rows())
+    with pytest.raises(ValueError):
+        ScanPlan.from_dict({"center_first": "yes"}, plan)
+
+
+@pytest.mark.parametrize("readout", [{}, {
+    "chain_wide": True
+}, {
+    "pipelined": True
+}],
+                         ids=["parallel", "chain-wide", "pipelined"])
+def test_center_first_scan_finds_dead_lanes_first(tmp_path, scan_options,
+                                                  readout):
+    plan = ScanPlan.sweep(scan_options["bit_number"],
+                          scan_options["voltage_increment"],
+                          scan_options["phase_increment"])
+    options = scan_options | dict(jtag_factory=simulated_chain(
+        eyes={(2, 5): SyntheticEye(12, 8, dead=True)}),
+                                  **readout)
+    perform_parallel_eyescan(output_path=tmp_path / "scan.tsv",
+                             plan=plan,
+                             **options)
+    sink = RecordingSink()
+    perform_parallel_eyescan(output_path=tmp_path / "center.tsv",
+                             plan=dataclasses.replace(plan, center_first=True),
+                             sinks=(sink, ),
+                             **options)
+    assert read_samples(tmp_path / "center.tsv") == read_samples(tmp_path /
+                                                                 "scan.tsv")
+    # The rows through the center alone tell the dead lane
+    center = min(plan.voltages, key=abs)
+    rows = len(plan.bits) * 2 * len(plan.phases) * 8
+    assert all(sample[3] == center for sample in sink.samples[:rows])
+    renderer = EyeRenderer(tmp_path / "render",
+                           plan.grid((1, 2)),
+                           "scan",
+                           interval=float("inf"))
+    renderer.write_batch(sink.samples[:rows])
+    assert dead_lanes(renderer.devices, renderer.heatmaps,
+                      renderer.center) == ["device 2 lane 5"]
+
+
+def test_render_scans_center_first(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, "argv", [
+        "eyescan", "-o",
+        str(tmp_path / "scan.tsv"), "--render",
+        str(tmp_path / "render")
+    ])
+    assert cli.parse_args().plan.center_first
@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+import numpy
+import pytest
+from conftest import read_samples
+from results import (BINARY_MAGIC, FLAG_INFERRED, FLAG_WRITTEN, HEADER_LENGTH,
+                     BackgroundWriter, BinaryWriter, Journal, ScanGrid,
+                     load_results, read_header)
+from scan import perform_parallel_eyescan
+
+GRID = ScanGrid(devices=(1, 2),
+                lanes=8,
+                bits=2,
+                voltages=(-4, 0, 4),
+                phases=(-2, 0, 2))
+
+
+class LoggingSink:
+    """Sink of a BackgroundWriter that logs its calls into a shared list, and
+    raises OSError from write_batch when failing."""
+
+    def __init__(self, log: list, failing: bool = False):
+        self.log = log
+        self.failing = failing
+        self.release = threading.Event()
+        self.release.set()
+
+    def write_batch(self, samples: list[tuple]):
+        self.release.wait()
+        if self.failing:
+            raise OSError("Disk full")
+        self.log.append(("write", self, samples))
+
+    def sync(self):
+        self.log.append(("sync", self))
+
+    def close(self):
+        self.log.append(("close", self))
+
+
+def test_grid_index_is_the_record_order():
+    index = numpy.ravel_multi_index((1, 3, 1, 2, 0), GRID.shape)
+    assert GRID.index(2, 3, 1, 4, -2) == index
+    assert GRID.size == numpy.prod(GRID.shape)
+
+
+def test_binary_records_hold_the_tsv_samples(tmp_path, scan_options):
+    for output_format in ("tsv", "binary"):
+        perform_parallel_eyescan(output_path=tmp_path / output_format,
+                                 output_format=output_format,
+                                 **scan_options)
+    header, records = load_results(tmp_path / "binary")
+    assert header["dwell_time"] == pytest.approx(scan_options["dwell_time"] *
+                                                 1000)
+    assert (records["flags"] == FLAG_WRITTEN).all()
+    assert sorted("\t".join(
+        str(record[field])
+        for field in ("device", "lane", "bit", "voltage", "phase", "ecount"))
+                  for record in records.ravel()) == read_samples(tmp_path /
+                                                                 "tsv")
+
+
+def test_binary_writer_flags_its_records(tmp_path):
+    path = tmp_path / "scan.bin"
+    with BinaryWriter(path, GRID, 1E-5) as writer:
+        writer.write((1, 0, 0, 0, 0, 7))
+        writer.write((2, 7, 1, 4, 2, 0, 1, 0.5))
+    _, records = load_results(path)
+    assert records.shape == GRID.shape
+    assert records[0, 0, 0, 1, 1]["flags"] == FLAG_WRITTEN
+    assert records[0, 0, 0, 1, 1]["ecount"] == 7
+    assert records[0, 0, 0, 1, 1]["dwell"] == pytest.approx(0.01)
+    inferred = records[1, 7, 1, 2, 2]
+    assert inferred["flags"] == FLAG_WRITTEN | FLAG_INFERRED
+    assert inferred["dwell"] == 0.5
+    assert (records["flags"] != 0).sum() == 2
+
+
+def test_read_header_checks_the_file(tmp_path):
+    path = tmp_path / "scan.tsv"
+    path.write_text("1\t0\t0\t0\t0\t0\n")
+    with pytest.raises(ValueError, match="not a binary"):
+        read_header(path)
+    header = json.dumps({"version": 0}).encode()
+    path.write_bytes(BINARY_MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+    with pytest.raises(ValueError, match="Unsupported"):
+        read_header(path)
+
+
+def test_checkpoint_journals_the_synced_slices(tmp_path):
+    log = []
+    sinks = [LoggingSink(log), LoggingSink(log)]
+    journal = Journal(tmp_path / "scan.journal", GRID, False)
+    with BackgroundWriter(sinks, journal, batch_size=2, latency=60) as writer:
+        for phase in GRID.phases:
+            writer.write((1, 0, 0, 0, phase, 0))
+        writer.checkpoint({(0, 1, 0, 0)})
+    assert log == [("write", sinks[0], [(1, 0, 0, 0, -2, 0),
+                                        (1, 0, 0, 0, 0, 0)]),
+                   ("write", sinks[1], [(1, 0, 0, 0, -2, 0),
+                                        (1, 0, 0, 0, 0, 0)]),
+                   ("write", sinks[0], [(1, 0, 0, 0, 2, 0)]),
+                   ("write", sinks[1], [(1, 0, 0, 0, 2, 0)]),
+                   ("sync", sinks[0]), ("sync", sinks[1]), ("close", sinks[0]),
+                   ("close", sinks[1])]
+    assert writer.statistics.samples == 3
+    assert writer.statistics.batches == 2
+    assert Journal(tmp_path / "scan.journal", GRID,
+                   True).completed == {(0, 1, 0, 0)}
+
+
+def test_sink_error_is_raised_after_closing_every_sink(tmp_path):
+    log = []
+    sinks = [LoggingSink(log, failing=True), LoggingSink(log)]
+    journal = Journal(tmp_path / "scan.journal", GRID, False)
+    writer = BackgroundWriter(sinks, journal, batch_size=1)
+    writer.write((1, 0, 0, 0, 0, 0))
+    writer.checkpoint({(0, 1, 0, 0)})
+    with pytest.raises(OSError, match="Disk full"):
+        writer.close()
+    assert log == [("close", sinks[0]), ("close", sinks[1])]
+    # The slice was not synced
+    assert not Journal(tmp_path / "scan.journal", GRID, True).completed
+
+
+def test_sink_error_is_raised_by_the_next_write():
+    writer = BackgroundWriter([LoggingSink([], failing=True)], batch_size=1)
+    writer.write((1, 0, 0, 0, 0, 0))
+    deadline = time.monotonic() + 5
+    while writer.error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with pytest.raises(OSError):
+        writer.write((1, 0, 0, 0, 2, 0))
+    with pytest.raises(OSError):
+        writer.close()
+
+
+def test_full_queue_stalls_the_scan():
+    sink = LoggingSink([])
+    sink.release.clear()
+    writer = BackgroundWriter([sink], queue_size=1, batch_size=1)
+    threading.Timer(0.2, sink.release.set).start()
+    for phase in GRID.phases:
+        writer.write((1, 0, 0, 0, phase, 0))
+    writer.close()
+    assert writer.statistics.stalls > 0
+    assert writer.statistics.stall_seconds > 0
+    assert writer.statistics.samples == len(GRID.phases)
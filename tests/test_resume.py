@@ -0,0 +1,98 @@
+import functools
+import pytest
+from conftest import DEVICE_COUNT, read_samples
+from results import BinaryWriter, Journal, ScanGrid, journal_path
+from scan import perform_parallel_eyescan
+from simulator import SimulatedJtagEngine
+
+GRID = ScanGrid(devices=(1, 2),
+                lanes=8,
+                bits=2,
+                voltages=(-4, 0, 4),
+                phases=(-2, 0, 2))
+
+
+class InterruptedJtagEngine(SimulatedJtagEngine):
+    """Simulated chain whose adapter is unplugged after a number of DR
+    shifts."""
+
+    shifts_left = None
+
+    def shift_and_update_register(self, data):
+        if InterruptedJtagEngine.shifts_left is not None:
+            InterruptedJtagEngine.shifts_left -= 1
+            if InterruptedJtagEngine.shifts_left < 0:
+                raise KeyboardInterrupt
+        return super().shift_and_update_register(data)
+
+
+def test_finished_scan_removes_journal(tmp_path, scan_options):
+    path = tmp_path / "scan.tsv"
+    perform_parallel_eyescan(output_path=path, **scan_options)
+    assert not journal_path(path).exists()
+
+
+@pytest.mark.parametrize("output_format", ["tsv", "binary"])
+def test_resumed_scan_matches_full_scan(tmp_path, scan_options, output_format):
+    full = tmp_path / "full"
+    perform_parallel_eyescan(output_path=full,
+                             output_format=output_format,
+                             **scan_options)
+    interrupted = tmp_path / "interrupted"
+    options = scan_options | dict(jtag_factory=functools.partial(
+        InterruptedJtagEngine, device_count=DEVICE_COUNT, realtime=False),
+                                  output_format=output_format)
+    InterruptedJtagEngine.shifts_left = 300
+    try:
+        with pytest.raises(KeyboardInterrupt):
+            perform_parallel_eyescan(output_path=interrupted, **options)
+    finally:
+        InterruptedJtagEngine.shifts_left = None
+    assert journal_path(interrupted).exists()
+    perform_parallel_eyescan(output_path=interrupted, resume=True, **options)
+    if output_format == "binary":
+        assert interrupted.read_bytes() == full.read_bytes()
+    else:
+        assert read_samples(interrupted) == read_samples(full)
+    assert not journal_path(interrupted).exists()
+
+
+def test_journal_keeps_the_complete_slices(tmp_path):
+    path = tmp_path / "scan.journal"
+    journal = Journal(path, GRID, False)
+    journal.record({(0, 1, 0, 0), (0, 2, 0, 0), (1, 1, 0, 0)})
+    journal.close()
+    with open(path, "a") as file:
+        file.write("1\t2\t0")
+    journal = Journal(path, GRID, True)
+    assert journal.resumed
+    assert journal.completed == {(0, 1, 0, 0), (0, 2, 0, 0), (1, 1, 0, 0)}
+    assert journal.rows([0]) == {(0, 0)}
+    assert journal.rows([0, 1]) == frozenset()
+    journal.remove()
+    assert not path.exists()
+
+
+def test_journal_without_resume_starts_over(tmp_path):
+    path = tmp_path / "scan.journal"
+    Journal(path, GRID, False).record({(0, 1, 0, 0)})
+    journal = Journal(path, GRID, False)
+    assert not journal.resumed and not journal.completed
+    assert Journal(None, GRID, True).completed == set()
+
+
+def test_resume_refuses_another_sweep_grid(tmp_path):
+    other = ScanGrid(GRID.devices, GRID.lanes, 1, GRID.voltages, GRID.phases)
+    Journal(tmp_path / "scan.journal", GRID, False).close()
+    with pytest.raises(ValueError, match="different sweep grid"):
+        Journal(tmp_path / "scan.journal", other, True)
+    BinaryWriter(tmp_path / "scan.bin", GRID, 1E-5).close()
+    with pytest.raises(ValueError, match="different sweep grid"):
+        BinaryWriter(tmp_path / "scan.bin", other, 1E-5, resume=True)
+
+
+def test_resume_of_another_scan_fails(tmp_path, scan_options):
+    path = tmp_path / "scan.tsv"
+    Journal(journal_path(path), GRID, False).close()
+    with pytest.raises(ValueError, match="different sweep grid"):
+        perform_parallel_eyescan(output_path=path, resume=True, **scan_options)
@@ -0,0 +1,113 @@
+import json
+import sys
+import pytest
+from analysis import is_result_file, load_scans
+from archive import ScanMetadata, ingest, open_archive
+from eyescan import eyescan as cli
+from render import render_scan
+from runs import ScanRun, load_runs, read_run_headers
+from scan import perform_parallel_eyescan, perform_session_eyescan
+
+
+def write_runs(tmp_path, entries) -> str:
+    path = tmp_path / "runs.json"
+    path.write_text(json.dumps(entries))
+    return path
+
+
+def test_runs_default_to_the_session_options(tmp_path, scan_options):
+    runs = load_runs(
+        write_runs(tmp_path, [{}, {
+            "label": "long",
+            "test_pattern": "PRBS_23_BIT",
+            "dwell_time": 10
+        }]), scan_options["test_pattern"])
+    assert runs[0].label == scan_options["test_pattern"].name
+    assert runs[0].options() == dict(test_pattern=scan_options["test_pattern"])
+    assert runs[1].options()["dwell_time"] == 0.01
+
+
+@pytest.mark.parametrize("entries", [[], [{
+    "pattern": "PRBS_7_BIT"
+}], [{}, {}], [{
+    "label": ""
+}], [{
+    "label": "-3"
+}], [{
+    "label": "# run"
+}], [{
+    "label": "a\tb"
+}]],
+                         ids=[
+                             "empty", "unknown field", "same label",
+                             "empty label", "numeric label", "comment label",
+                             "tab in label"
+                         ])
+def test_invalid_runs_are_rejected(tmp_path, scan_options, entries):
+    with pytest.raises(ValueError):
+        load_runs(write_runs(tmp_path, entries), scan_options["test_pattern"])
+
+
+@pytest.fixture
+def run_output(tmp_path, scan_options) -> tuple:
+    # Two runs on one session, the second with its own dwell time
+    runs = load_runs(
+        write_runs(tmp_path, [{}, {
+            "label": "long",
+            "test_pattern": "PRBS_23_BIT",
+            "dwell_time": 0.1
+        }]), scan_options["test_pattern"])
+    path = tmp_path / "runs.tsv"
+    perform_session_eyescan(runs,
+                            perform_parallel_eyescan,
+                            output_path=path,
+                            **scan_options)
+    return path, runs
+
+
+def test_runs_write_headers_and_no_part_files(tmp_path, scan_options,
+                                              run_output):
+    path, runs = run_output
+    assert sorted(tmp_path.iterdir()) == [tmp_path / "runs.json", path]
+    assert is_result_file(path)
+    assert read_run_headers(path) == {
+        run.label:
+        ScanRun(run.label, run.test_pattern, run.dwell_time
+                or scan_options["dwell_time"])
+        for run in runs
+    }
+
+
+def test_runs_are_loaded_as_scans_with_their_dwell_time(run_output):
+    path, runs = run_output
+    scans = load_scans(path)
+    assert list(scans) == [run.label for run in runs]
+    assert scans["long"].dwell[0, 0, 0, 0, 0] == pytest.approx(1E-4)
+    assert scans["PRBS_7_BIT"].dwell[0, 0, 0, 0, 0] == pytest.approx(1E-5)
+    assert [tag for tag, _, _ in render_scan(path)] == list(scans)
+
+
+def test_runs_are_archived_with_their_test_pattern(tmp_path, run_output):
+    path, _ = run_output
+    assert len(ingest(tmp_path / "archive", path, ScanMetadata("sim://"))) == 2
+    connection = open_archive(tmp_path / "archive")
+    try:
+        rows = connection.execute("SELECT tag, adapter, test_pattern, "
+                                  "dwell_time FROM scans ORDER BY id")
+        assert [tuple(row) for row in rows] == [
+            ("PRBS_7_BIT", "sim://", "PRBS_7_BIT", pytest.approx(1E-5)),
+            ("long", "sim://", "PRBS_23_BIT", pytest.approx(1E-4))
+        ]
+    finally:
+        connection.close()
+
+
+def test_runs_cannot_be_combined_with_fleet(tmp_path, monkeypatch,
+                                            scan_options):
+    monkeypatch.setattr(sys, "argv", [
+        "eyescan", "-o",
+        str(tmp_path / "scan.tsv"), "--runs",
+        str(write_runs(tmp_path, [{}])), "--fleet", "sim://a"
+    ])
+    with pytest.raises(SystemExit):
+        cli.parse_args()
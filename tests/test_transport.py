@@ -0,0 +1,55 @@
+import functools
+import pytest
+from pyftdi.bits import BitSequence
+from conftest import DEVICE_COUNT, read_samples, recorded_chain, simulated_chain
+from scan import perform_parallel_eyescan
+from simulator import BYPASS_OPCODE, IR_LENGTH
+from transport import JtagBatch, MpsseBatch
+
+
+@pytest.mark.parametrize("readout", [{}, {
+    "chain_wide": True
+}],
+                         ids=["parallel", "chain-wide"])
+def test_mpsse_transport_matches_direct(tmp_path, scan_options, readout):
+    for transport in ("direct", "mpsse"):
+        perform_parallel_eyescan(output_path=tmp_path / f"{transport}.tsv",
+                                 transport=transport,
+                                 **scan_options,
+                                 **readout)
+    assert (read_samples(tmp_path / "direct.tsv") == read_samples(tmp_path /
+                                                                  "mpsse.tsv"))
+
+
+def test_mpsse_transport_batches_usb_round_trips(tmp_path, scan_options):
+    engines = []
+    for transport in ("direct", "mpsse"):
+        perform_parallel_eyescan(output_path=tmp_path / f"{transport}.tsv",
+                                 transport=transport,
+                                 **scan_options
+                                 | dict(jtag_factory=recorded_chain(engines)))
+    direct, mpsse = (engine.statistics for engine in engines)
+    assert mpsse.dr_shifts == direct.dr_shifts
+    assert mpsse.usb_round_trips * 4 < direct.usb_round_trips
+
+
+def test_mpsse_batch_reads_back_like_direct_batch():
+    # Through the bypass registers the readback is the shifted data, after
+    # the one captured bit of every device
+    readbacks = []
+    for batch_factory in (JtagBatch,
+                          functools.partial(MpsseBatch, frequency=1E7)):
+        engine = simulated_chain()()
+        try:
+            batch = batch_factory(engine)
+            batch.write_ir(
+                sum((BitSequence(BYPASS_OPCODE, length=IR_LENGTH)
+                     for _ in range(DEVICE_COUNT)), BitSequence()))
+            for value in (0x5a5a5, 0x12345):
+                batch.shift_dr(BitSequence(value, length=21))
+                batch.idle(1E-6)
+            readbacks.append(batch.execute())
+        finally:
+            engine.close()
+    assert readbacks[0] == readbacks[1]
+    assert len(set(readbacks[0])) == 2
@@ -0,0 +1,88 @@
+import dataclasses
+import io
+import numpy
+from analysis import eye_metrics, load_binary, worst_bit
+from conftest import DEVICE_COUNT, simulated_chain
+from instructions import LANES, ReceiverSettings
+from plan import ScanPlan
+from scan import ScanSession, perform_parallel_eyescan
+from simulator import SyntheticEye
+from tuning import best, candidate_space, tune
+
+KEYS = [(device, receiver_block) for device in range(1, DEVICE_COUNT + 1)
+        for receiver_block in range(2)]
+
+
+def test_candidate_space_starts_with_the_default_settings():
+    space = candidate_space([2, 1], [0, 1], [0])
+    assert space[0] == ReceiverSettings()
+    assert len(space) == len(set(space)) == 4
+
+
+def test_best_keeps_the_earlier_candidates_on_ties():
+    assert best([1, 3, 3, 2], 2) == [1, 2]
+    assert best([0, 0, 0], 1) == [0]
+
+
+def test_tune_halves_the_candidates_every_round():
+    # Every candidate scores its eq, the full plan scores its eq backwards
+    full_plan = ScanPlan.sweep(1, 8, 4)
+    scans = []
+
+    def scan(plan, receiver_settings):
+        scans.append(plan)
+        area = numpy.zeros((DEVICE_COUNT, 2 * LANES))
+        for (device, receiver_block), settings in receiver_settings.items():
+            eq = settings.eq if plan is not full_plan else -settings.eq
+            area[device - 1,
+                 receiver_block * LANES:(receiver_block + 1) * LANES] = eq
+        return area
+
+    log = io.StringIO()
+    space = candidate_space(list(range(8)), [0], [0])
+    settings = tune(scan, KEYS, space, full_plan, top=2, log=log)
+    assert settings == {key: ReceiverSettings(eq=6) for key in KEYS}
+    # 8 + 4 proxy scans and 2 full scans
+    assert len(scans) == 14 and scans[-2:] == [full_plan, full_plan]
+    assert scans[0].phases != scans[8].phases
+    assert log.getvalue().splitlines() == [
+        "Round 1: 8 candidates, 16 voltages and 3 phases of bit 0",
+        "Round 2: 4 candidates, 32 voltages and 5 phases of bit 0",
+        "Full scans of 2 candidates"
+    ]
+
+
+def test_tune_finds_the_widest_eyes_of_the_simulated_chain(
+        tmp_path, scan_options):
+    # Receiver block 1 of device 2 is the widest at eq 3 and eqboost 2
+    eyes = {
+        (2, lane): SyntheticEye(12, 8, eq=3, eqboost=2)
+        for lane in range(LANES, 2 * LANES)
+    }
+    session = ScanSession("sim://", 1E7, 0, 0, 0, DEVICE_COUNT,
+                          simulated_chain(eyes=eyes))
+
+    def scan(plan, receiver_settings):
+        path = tmp_path / "tuning.bin"
+        perform_parallel_eyescan(output_path=path,
+                                 output_format="binary",
+                                 session=session,
+                                 plan=plan,
+                                 receiver_settings=receiver_settings,
+                                 **scan_options)
+        metrics, _ = worst_bit(eye_metrics(load_binary(path), [1E-12]))
+        return metrics.area[0]
+
+    try:
+        settings = tune(scan, KEYS, candidate_space(list(range(4)), [0, 2],
+                                                    [0]),
+                        ScanPlan.sweep(1, 4, 4))
+    finally:
+        session.close()
+    default = ReceiverSettings()
+    assert settings == {
+        key: default
+        for key in KEYS
+    } | {
+        (2, 1): dataclasses.replace(default, eq=3, eqboost=2)
+    }